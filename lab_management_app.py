@@ -1,17 +1,25 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
-from flask_socketio import SocketIO, emit, join_room, leave_room
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, Response, stream_with_context, g, has_request_context
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
+import sqlalchemy as sa
+from sqlalchemy.ext.compiler import compiles
 from flask_migrate import Migrate
 from authlib.integrations.flask_client import OAuth
 from datetime import datetime, timedelta
 import subprocess
 import os
 import json
+import csv
+import io
 import shutil
+import tempfile
 import uuid
 import re
 from pathlib import Path
 from functools import wraps
+from collections import OrderedDict
+from contextlib import contextmanager
 import asyncio
 import aiohttp
 import platform
@@ -19,6 +27,13 @@ from concurrent.futures import ThreadPoolExecutor
 import pymysql
 import traceback
 import signal
+import base64
+import hashlib
+import hmac
+from zoneinfo import ZoneInfo
+import threading
+import time
+import atexit
 from dotenv import load_dotenv
 import getpass
 
@@ -53,12 +68,31 @@ app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
     'pool_pre_ping': True,
 }
 
+# Optional read replica for reporting queries (e.g. a second local database when testing)
+if os.getenv('DATABASE_REPLICA_URL'):
+    app.config['SQLALCHEMY_BINDS'] = {'replica': os.getenv('DATABASE_REPLICA_URL')}
+READ_YOUR_WRITES_SECONDS = int(os.getenv('READ_YOUR_WRITES_SECONDS', 10))  # Primary-only reads after a user's write
+APP_STARTED_AT = datetime.utcnow().replace(microsecond=0)
+
 # Google OAuth Config
 print("Google client id: ", os.getenv('GOOGLE_CLIENT_ID'))
 app.config['GOOGLE_CLIENT_ID'] = os.getenv('GOOGLE_CLIENT_ID')
 app.config['GOOGLE_CLIENT_SECRET'] = os.getenv('GOOGLE_CLIENT_SECRET')
 
-db = SQLAlchemy(app)
+class RoutingSession(FlaskSQLAlchemySession):
+    """
+    Session that sends reads to the read replica when the current request asks for it
+    
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and use_read_replica()
+                and not isinstance(clause, (sa.Insert, sa.Update, sa.Delete))):
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 migrate = Migrate(app, db)
 socketio = SocketIO(app, cors_allowed_origins="*")
 oauth = OAuth(app)
@@ -67,8 +101,72 @@ oauth = OAuth(app)
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 LAB_TEMPLATES_PATH = os.getenv('LAB_TEMPLATES_PATH', os.path.join(BASE_DIR, 'lab-templates'))
 STUDENT_LABS_PATH = os.getenv('STUDENT_LABS_PATH', os.path.join(BASE_DIR, 'student-labs'))
+LAB_ARCHIVE_PATH = os.getenv('LAB_ARCHIVE_PATH', os.path.join(BASE_DIR, 'archived-labs'))
+LAB_SNAPSHOT_PATH = os.getenv('LAB_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'lab-snapshots'))
+FETCH_RECORDINGS_PATH = os.getenv('FETCH_RECORDINGS_PATH', os.path.join(BASE_DIR, 'fetch-recordings'))
+# Held by the one process allowed to serve the app (admission control, caches
+# and terminals live in its memory)
+APP_PROCESS_LOCK_PATH = os.getenv('APP_PROCESS_LOCK_PATH', os.path.join(BASE_DIR, 'lab_management.lock'))
 ALLOWED_COMMANDS = json.loads(os.getenv('ALLOWED_COMMANDS', '["ls", "dir", "cd", "cat", "type", "grep", "find", "findstr", "pwd", "echo", "whoami", "python", "python3", "gcc", "make", "javac", "java", "node", "npm", "git"]'))
 
+# Idle reaper config (minutes of inactivity before each reclamation stage)
+LAB_IDLE_STOP_MINUTES = int(os.getenv('LAB_IDLE_STOP_MINUTES', 60))
+LAB_IDLE_RELEASE_NETWORK_MINUTES = int(os.getenv('LAB_IDLE_RELEASE_NETWORK_MINUTES', 180))
+LAB_IDLE_ARCHIVE_MINUTES = int(os.getenv('LAB_IDLE_ARCHIVE_MINUTES', 24 * 60))
+LAB_REAPER_INTERVAL_SECONDS = int(os.getenv('LAB_REAPER_INTERVAL_SECONDS', 300))
+LAB_REAPER_ENABLED = os.getenv('LAB_REAPER_ENABLED', 'true').lower() == 'true'
+
+# Admission control config (host capacity shared by all running labs)
+ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true'
+HOST_CPU_CAPACITY = float(os.getenv('HOST_CPU_CAPACITY', os.cpu_count() or 1))
+HOST_MEMORY_MB_CAPACITY = int(os.getenv('HOST_MEMORY_MB_CAPACITY', 0))  # 0 = 80% of detected host memory
+HOST_MAX_CONTAINERS = int(os.getenv('HOST_MAX_CONTAINERS', 50))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = int(os.getenv('ADMISSION_QUEUE_TIMEOUT_SECONDS', 120))
+DEFAULT_LAB_RESOURCE_PROFILE = {'cpu': 0.5, 'memory_mb': 512, 'containers': 1, 'max_concurrent': None}
+
+# Grading config
+LAB_TIMEZONE = ZoneInfo("Asia/Ho_Chi_Minh")  # Timezone of the daily auto-generated flags
+FLAG_PRECOMPUTE_ENABLED = os.getenv('FLAG_PRECOMPUTE_ENABLED', 'true').lower() == 'true'
+SUBMIT_RATE_BURST = int(os.getenv('SUBMIT_RATE_BURST', 5))  # Submissions allowed back to back
+SUBMIT_RATE_PER_MINUTE = float(os.getenv('SUBMIT_RATE_PER_MINUTE', 6))  # Sustained submission rate
+VERIFY_WORKERS = int(os.getenv('VERIFY_WORKERS', 4))  # Parallel in-container verification jobs
+VERIFY_QUEUE_LIMIT = int(os.getenv('VERIFY_QUEUE_LIMIT', 200))  # Max queued + running jobs
+VERIFY_JOB_TIMEOUT_SECONDS = int(os.getenv('VERIFY_JOB_TIMEOUT_SECONDS', 60))
+
+# Page cache config
+DASHBOARD_CACHE_SECONDS = int(os.getenv('DASHBOARD_CACHE_SECONDS', 300))  # Safety net for writes that skip invalidate_dashboard()
+ADMIN_STATS_CACHE_SECONDS = int(os.getenv('ADMIN_STATS_CACHE_SECONDS', 30))
+RESPONSE_CACHE_SECONDS = int(os.getenv('RESPONSE_CACHE_SECONDS', 300))  # Catalog responses, bumped by writes
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 5000))
+ADMIN_PAGE_SIZE = int(os.getenv('ADMIN_PAGE_SIZE', 50))  # Default rows per admin list page
+ADMIN_PAGE_SIZE_MAX = int(os.getenv('ADMIN_PAGE_SIZE_MAX', 200))
+COMMAND_OUTPUT_PREVIEW_CHARS = int(os.getenv('COMMAND_OUTPUT_PREVIEW_CHARS', 500))  # Output sent with command lists
+COMMAND_LOG_BATCH_SIZE = int(os.getenv('COMMAND_LOG_BATCH_SIZE', 200))  # Queued command logs that trigger a flush
+COMMAND_LOG_FLUSH_SECONDS = float(os.getenv('COMMAND_LOG_FLUSH_SECONDS', 1.0))  # Longest a command log waits in memory
+COMMAND_LOG_QUEUE_LIMIT = int(os.getenv('COMMAND_LOG_QUEUE_LIMIT', 20000))  # Oldest logs are dropped past this while the DB is down
+
+# Outbound HTTP Config
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', 100))  # Open connections of the shared aiohttp client
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', 10))
+HTTP_DNS_CACHE_SECONDS = int(os.getenv('HTTP_DNS_CACHE_SECONDS', 300))
+HTTP_KEEPALIVE_SECONDS = int(os.getenv('HTTP_KEEPALIVE_SECONDS', 30))  # Idle time before a pooled connection closes
+FETCH_MAX_BYTES = int(os.getenv('FETCH_MAX_BYTES', 1024 * 1024))  # Body kept by /api/fetch_url before truncating
+FETCH_STREAM_MAX_BYTES = int(os.getenv('FETCH_STREAM_MAX_BYTES', 50 * 1024 * 1024))  # Body piped by /api/fetch_url/stream
+FETCH_CHUNK_SIZE = 64 * 1024
+FETCH_CACHE_MAX_BYTES = int(os.getenv('FETCH_CACHE_MAX_BYTES', 64 * 1024 * 1024))  # Memory held by cached fetch responses
+FETCH_REPLAY_ONLY = os.getenv('FETCH_REPLAY_ONLY', 'false').lower() == 'true'  # Serve every fetch from recordings, no network
+DEFAULT_FETCH_CACHE_POLICY = {  # Labs opt in to sharing responses between students
+    'mode': os.getenv('FETCH_CACHE_MODE', 'off'),
+    'ttl': int(os.getenv('FETCH_CACHE_TTL_SECONDS', 60)),
+    'methods': ['GET', 'HEAD']  # Other methods usually change something upstream
+}
+RESOURCE_CHECK_CONCURRENCY = int(os.getenv('RESOURCE_CHECK_CONCURRENCY', 10))  # Resource probes in flight at once
+RESOURCE_CHECK_TIMEOUT_SECONDS = int(os.getenv('RESOURCE_CHECK_TIMEOUT_SECONDS', 5))
+RESOURCE_CACHE_SECONDS = int(os.getenv('RESOURCE_CACHE_SECONDS', 120))  # Age at which a probe result is re-checked
+RESOURCE_CACHE_MAX_ENTRIES = int(os.getenv('RESOURCE_CACHE_MAX_ENTRIES', 1000))
+RESOURCE_MONITOR_INTERVAL_SECONDS = int(os.getenv('RESOURCE_MONITOR_INTERVAL_SECONDS', 60))
+RESOURCE_MONITOR_ENABLED = os.getenv('RESOURCE_MONITOR_ENABLED', 'true').lower() == 'true'
+
 # PDF Upload Config
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'pdfs')
 ALLOWED_EXTENSIONS = {'pdf'}
@@ -81,6 +179,9 @@ LAB_NETWORK_MASK_PARAMETER = "${labNetworkMask}"
 # Ensure directories exist
 os.makedirs(LAB_TEMPLATES_PATH, exist_ok=True)
 os.makedirs(STUDENT_LABS_PATH, exist_ok=True)
+os.makedirs(LAB_ARCHIVE_PATH, exist_ok=True)
+os.makedirs(LAB_SNAPSHOT_PATH, exist_ok=True)
+os.makedirs(FETCH_RECORDINGS_PATH, exist_ok=True)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # Log paths for debugging
@@ -114,6 +215,8 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime)
     
+    __table_args__ = (db.Index('ix_users_created_at_id', 'created_at', 'id'),)
+    
     # Relationships
     enrollments = db.relationship('Enrollment', backref='user', lazy=True, cascade='all, delete-orphan')
     lab_sessions = db.relationship('LabSession', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -131,6 +234,8 @@ class Course(db.Model):
     max_students = db.Column(db.Integer, default=50)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (db.Index('ix_courses_created_at_id', 'created_at', 'id'),)
+    
     # Relationships
     labs = db.relationship('Lab', backref='course', lazy=True, cascade='all, delete-orphan')
     enrollments = db.relationship('Enrollment', backref='course', lazy=True, cascade='all, delete-orphan')
@@ -157,8 +262,16 @@ class Lab(db.Model):
     checkpoint_rules = db.Column(db.Text)  # JSON: rules for decoding/validating checkpoints
     pdf_instruction_url = db.Column(db.String(500))  # URL or path to PDF instruction file
     output_result = db.Column(db.Text)  # Expected output result to display after running commands
+    resource_profile = db.Column(db.Text)  # JSON: {"cpu": 1.0, "memory_mb": 1024, "containers": 2, "max_concurrent": 20}
+    fetch_cache_policy = db.Column(db.Text)  # JSON: {"mode": "off" | "cache" | "record" | "replay", "ttl": 300, "methods": ["GET"]}
+    verify_command = db.Column(db.Text)  # Optional command that verifies checkpoints inside the student's containers
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_labs_course_order', 'course_id', 'order_index', 'id'),
+        db.Index('ix_labs_course_active_order', 'course_id', 'is_active', 'order_index'),
+    )
+    
     # Relationships
     lab_sessions = db.relationship('LabSession', backref='lab', lazy=True, cascade='all, delete-orphan')
     lab_parameters = db.relationship('LabParameter', backref='lab', lazy=True, cascade='all, delete-orphan')
@@ -194,6 +307,20 @@ class Lab(db.Model):
         if self.checkpoint_rules:
             return json.loads(self.checkpoint_rules)
         return {}
+    
+    @property
+    def resource_profile_dict(self):
+        """Return resource profile as a dictionary"""
+        if self.resource_profile:
+            return json.loads(self.resource_profile)
+        return {}
+    
+    @property
+    def fetch_cache_policy_dict(self):
+        """Return fetch cache policy as a dictionary"""
+        if self.fetch_cache_policy:
+            return json.loads(self.fetch_cache_policy)
+        return {}
 
 class LabParameter(db.Model):
     __tablename__ = 'lab_parameters'
@@ -222,7 +349,11 @@ class Enrollment(db.Model):
     enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='active')
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'course_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'course_id'),
+        db.Index('ix_enrollments_enrolled_at_id', 'enrolled_at', 'id'),
+        db.Index('ix_enrollments_course_status', 'course_id', 'status'),
+    )
 
 class LabSession(db.Model):
     __tablename__ = 'lab_sessions'
@@ -240,12 +371,27 @@ class LabSession(db.Model):
     checkpoint_answers = db.Column(db.Text)  # JSON: student's checkpoint answers
     checkpoint_results = db.Column(db.Text)  # JSON: validation results for each checkpoint
     generated_flag = db.Column(db.String(255))  # Auto-generated flag for this lab session
+    submission_fingerprint = db.Column(db.String(64))  # SHA256 of the last graded answers + rules version
+    idle_stage = db.Column(db.String(20))  # Idle reaper stage: stopped, network_released, archived
+    chosen_parameters = db.Column(db.Text)  # JSON: {parameter_name: value} chosen when the lab was provisioned
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'lab_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'lab_id'),
+        db.Index('ix_lab_sessions_created_at_id', 'created_at', 'id'),
+        db.Index('ix_lab_sessions_lab_status', 'lab_id', 'status'),
+        db.Index('ix_lab_sessions_status_user', 'status', 'user_id'),
+    )
     
     # Relationships
     terminal_sessions = db.relationship('TerminalSession', backref='lab_session', lazy=True, cascade='all, delete-orphan')
+    
+    @property
+    def chosen_parameters_dict(self):
+        """Return the chosen parameter values as a dictionary"""
+        if self.chosen_parameters:
+            return json.loads(self.chosen_parameters)
+        return {}
 
 class TerminalSession(db.Model):
     __tablename__ = 'terminal_sessions'
@@ -260,6 +406,8 @@ class TerminalSession(db.Model):
     last_activity = db.Column(db.DateTime, default=datetime.utcnow)
     command_count = db.Column(db.Integer, default=0)
     
+    __table_args__ = (db.Index('ix_terminal_sessions_lab_session_active', 'lab_session_id', 'is_active'),)
+    
     # Relationships
     command_logs = db.relationship('CommandLog', backref='terminal_session', lazy=True, cascade='all, delete-orphan')
 
@@ -274,6 +422,48 @@ class CommandLog(db.Model):
     is_allowed = db.Column(db.Boolean)
     blocked_reason = db.Column(db.Text)
     executed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_command_logs_terminal_executed', 'terminal_session_id', 'executed_at', 'id'),)
+
+
+class CourseGradebook(db.Model):
+    __tablename__ = 'course_gradebook'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    lab_scores = db.Column(db.Text)  # JSON: {lab_id: {"best_score": int, "status": str}}
+    graded_labs = db.Column(db.Integer, default=0)
+    completed_labs = db.Column(db.Integer, default=0)
+    completed_score_total = db.Column(db.Integer, default=0)  # Sum of best scores of completed labs
+    average_score = db.Column(db.Float, default=0)  # Average best score of completed labs
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('course_id', 'user_id'),)
+    
+    @property
+    def lab_scores_dict(self):
+        """Return per-lab scores as a dictionary"""
+        if self.lab_scores:
+            return json.loads(self.lab_scores)
+        return {}
+    
+    def set_lab_scores(self, scores):
+        """Store per-lab scores and refresh the aggregate columns"""
+        completed = [s['best_score'] or 0 for s in scores.values() if s['status'] == 'completed']
+        self.lab_scores = json.dumps(scores)
+        self.graded_labs = sum(1 for s in scores.values() if s['best_score'] is not None)
+        self.completed_labs = len(completed)
+        self.completed_score_total = sum(completed)
+        self.average_score = round(sum(completed) / len(completed), 1) if completed else 0
+
+class WorkerLease(db.Model):
+    __tablename__ = 'worker_leases'
+    
+    name = db.Column(db.String(50), primary_key=True)  # e.g., idle_reaper
+    owner = db.Column(db.String(100), nullable=False)  # host:pid of the process holding the lease
+    expires_at = db.Column(db.DateTime, nullable=False)
+
 class LabsNetwork(db.Model):
     __tablename__ = 'labs_network'
 
@@ -287,6 +477,8 @@ class LabsNetwork(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow,
                            onupdate=datetime.utcnow)
 
+    __table_args__ = (db.Index('ix_labs_network_used', 'used'),)
+
     def __repr__(self):
         return f"<LabsNetwork {self.name} ({self.subnet_ip_base})>"    
 
@@ -310,108 +502,632 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Read replica routing
+def use_read_replica():
+    """Whether queries of the current request should read from the replica"""
+    if not has_request_context() or 'replica' not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return False
+    if not g.get('read_replica') or g.get('read_primary'):
+        return False
+    # Read-your-writes: recent writes by or for this user may not have reached the replica yet
+    now = time.time()
+    if session.get('read_primary_until', 0) > now:
+        return False
+    user = session.get('user')
+    if user:
+        with read_primary_lock:
+            return read_primary_until.get(user['id'], 0) <= now
+    return True
+
+def read_replica(f):
+    """Route the reads of a reporting endpoint to the read replica"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with replica_reads():
+            return f(*args, **kwargs)
+    return decorated_function
+
+@contextmanager
+def replica_reads():
+    """Route the reads inside the block to the read replica"""
+    previous = g.get('read_replica')
+    g.read_replica = True
+    try:
+        yield
+    finally:
+        g.read_replica = previous
+
+@contextmanager
+def primary_reads():
+    """Force the reads inside the block to the primary"""
+    previous = g.get('read_primary')
+    g.read_primary = True
+    try:
+        yield
+    finally:
+        g.read_primary = previous
+
+read_primary_lock = threading.Lock()
+read_primary_until = {}  # user_id -> time until which the user's reads go to the primary
+
+def pin_reads_to_primary(*user_ids, seconds=None):
+    """
+    Send reads to the primary for a while after a write users will want to see
+    
+    Pins the current user and every affected user passed in, e.g. the student
+    whose lab session an admin just corrected. The current user's pin is also
+    kept in their session cookie, which every worker process sees.
+    """
+    now = time.time()
+    until = now + (READ_YOUR_WRITES_SECONDS if seconds is None else seconds)
+    if has_request_context() and 'user' in session:
+        session['read_primary_until'] = until
+        user_ids += (session['user']['id'],)
+    
+    with read_primary_lock:
+        for user_id in [u for u, pinned_until in read_primary_until.items() if pinned_until <= now]:
+            del read_primary_until[user_id]
+        for user_id in user_ids:
+            read_primary_until[user_id] = max(read_primary_until.get(user_id, 0), until)
+
+# Catalog response cache with conditional GET
+# Versions and cached responses live in process memory: bump_data_version()
+# reaches every cached response because claim_app_process() keeps the app to
+# a single process
+data_versions_lock = threading.Lock()
+data_versions = {}  # domain -> (version, last modified)
+response_cache_lock = threading.Lock()
+response_cache = {}  # (path with query string, user scope) -> cached response
+
+def bump_data_version(*domains):
+    """Mark cached responses built from these data domains (courses, labs, enrollments) as stale"""
+    now = datetime.utcnow().replace(microsecond=0)
+    with data_versions_lock:
+        for domain in domains:
+            version, _ = data_versions.get(domain, (0, now))
+            data_versions[domain] = (version + 1, now)
+
+def get_data_versions(domains):
+    """
+    Get the current version and last modification time of some data domains
+    
+    The 'lab_templates' domain follows the modification time of the lab templates folder.
+    """
+    versions = []
+    last_modified = APP_STARTED_AT
+    with data_versions_lock:
+        for domain in domains:
+            if domain == 'lab_templates':
+                try:
+                    mtime = os.stat(LAB_TEMPLATES_PATH).st_mtime
+                except OSError:
+                    mtime = 0
+                versions.append(mtime)
+                modified = datetime.utcfromtimestamp(mtime).replace(microsecond=0)
+            else:
+                version, modified = data_versions.get(domain, (0, APP_STARTED_AT))
+                versions.append(version)
+            last_modified = max(last_modified, modified)
+    return tuple(versions), last_modified
+
+def cached_response(*domains, per_user=False):
+    """
+    Cache a JSON GET endpoint until one of its data domains changes
+    
+    Responses carry ETag and Last-Modified headers and matching conditional
+    requests get 304 Not Modified. Entries also expire after RESPONSE_CACHE_SECONDS.
+    
+    Args:
+        domains: Data domains the response is built from
+        per_user: Cache separately for each logged in user
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            scope = session['user']['id'] if per_user else None
+            key = (request.full_path, scope)
+            versions, last_modified = get_data_versions(domains)
+            now = time.monotonic()
+            
+            with response_cache_lock:
+                entry = response_cache.get(key)
+            if not entry or entry['versions'] != versions or entry['expires_at'] <= now:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                entry = {
+                    'versions': versions,
+                    'body': body,
+                    'mimetype': response.mimetype,
+                    'etag': hashlib.sha1(body).hexdigest(),
+                    'last_modified': last_modified,
+                    'expires_at': now + RESPONSE_CACHE_SECONDS
+                }
+                with response_cache_lock:
+                    if len(response_cache) >= RESPONSE_CACHE_MAX_ENTRIES:
+                        response_cache.pop(next(iter(response_cache)))
+                    response_cache[key] = entry
+            
+            response = Response(entry['body'], mimetype=entry['mimetype'])
+            response.set_etag(entry['etag'])
+            response.last_modified = entry['last_modified']
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return decorated_function
+    return decorator
+
 def is_edu_email(email):
     """Check if email is from an educational institution"""
     pattern = os.getenv('ALLOWED_EMAIL_REGEX', r'^.+@.+\.edu(\..+)?$')
     return bool(re.match(pattern, email, re.IGNORECASE))
 
 # Async HTTP helpers using aiohttp
-async def fetch_url_async(url, method='GET', headers=None, data=None, timeout=30):
+# All aiohttp work runs on one background event loop that owns a pooled ClientSession,
+# so requests reuse connections, DNS lookups and TLS sessions.
+async_loop = None
+async_loop_lock = threading.Lock()
+http_connector = None  # Only touched from the event loop thread
+http_sessions = {}  # {decompress: ClientSession}, sharing http_connector
+http_lock = threading.Lock()
+http_metrics = {
+    'calls': 0, 'requests': 0, 'failed': 0, 'timed_out': 0, 'in_flight': 0,
+    'total_latency': 0.0, 'max_latency': 0.0, 'total_wait': 0.0
+}
+
+def get_async_loop():
+    """Event loop of the background aiohttp thread, started on first use"""
+    global async_loop
+    with async_loop_lock:
+        if async_loop is None or async_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='aiohttp-loop', daemon=True).start()
+            async_loop = loop
+        return async_loop
+
+async def get_http_session(decompress=True):
+    """
+    Shared aiohttp session with a keep-alive connection pool and DNS cache
+    
+    With decompress=False, gzip bodies are read as sent, for passing them through.
+    Both sessions draw from the same connection pool.
+    """
+    global http_connector
+    if http_connector is None or http_connector.closed:
+        http_connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS
+        )
+        http_sessions.clear()
+    if decompress not in http_sessions:
+        http_sessions[decompress] = aiohttp.ClientSession(
+            connector=http_connector, connector_owner=False, auto_decompress=decompress
+        )
+    return http_sessions[decompress]
+
+async def read_limited(response, max_bytes):
+    """
+    Read a response body in chunks, stopping once it passes max_bytes
+    
+    Returns:
+        tuple: (body bytes, truncated)
+    """
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+        body.extend(chunk)
+        if len(body) > max_bytes:
+            return bytes(body[:max_bytes]), True
+    return bytes(body), False
+
+def record_http_request(started, outcome):
+    """Update request count and latency metrics when an outbound request ends"""
+    latency = time.monotonic() - started
+    with http_lock:
+        http_metrics['in_flight'] -= 1
+        http_metrics['requests'] += 1
+        if outcome != 'ok':
+            http_metrics[outcome] += 1
+        http_metrics['total_latency'] += latency
+        http_metrics['max_latency'] = max(http_metrics['max_latency'], latency)
+
+def start_http_request():
+    """Count an outbound request as in flight and return its start time"""
+    with http_lock:
+        http_metrics['in_flight'] += 1
+    return time.monotonic()
+
+async def fetch_url_async(url, method='GET', headers=None, data=None, timeout=30,
+                          max_bytes=FETCH_MAX_BYTES, gzip_passthrough=False):
     """
     Async function to fetch URL using aiohttp
     
+    The body is read in chunks and the read stops at max_bytes, so a large
+    download is never held in memory in full.
+    
     Args:
         url: URL to fetch
         method: HTTP method (GET, POST, etc.)
         headers: Optional headers dict
         data: Optional data for POST requests
         timeout: Request timeout in seconds
+        max_bytes: Largest body to return; longer bodies are truncated
+        gzip_passthrough: Return a gzip body still compressed, base64 encoded
     
     Returns:
-        dict with status, headers, and content
+        dict with status, headers, content and truncation metadata
     """
-    async with aiohttp.ClientSession() as session:
-        try:
-            timeout_obj = aiohttp.ClientTimeout(total=timeout)
-            async with session.request(
-                method=method,
-                url=url,
-                headers=headers,
-                json=data,
-                timeout=timeout_obj
-            ) as response:
-                content = await response.text()
-                return {
-                    'status': response.status,
-                    'headers': dict(response.headers),
-                    'content': content,
-                    'success': response.status < 400
-                }
-        except asyncio.TimeoutError:
-            return {
-                'status': 408,
-                'error': 'Request timeout',
-                'success': False
-            }
-        except Exception as e:
-            return {
-                'status': 500,
-                'error': str(e),
-                'success': False
+    session = await get_http_session(decompress=not gzip_passthrough)
+    if gzip_passthrough:
+        headers = dict(headers or {}, **{'Accept-Encoding': 'gzip'})
+    started = start_http_request()
+    outcome = 'failed'  # Recorded once in finally, after the response is released
+    try:
+        timeout_obj = aiohttp.ClientTimeout(total=timeout)
+        async with session.request(
+            method=method,
+            url=url,
+            headers=headers,
+            json=data,
+            timeout=timeout_obj
+        ) as response:
+            body, truncated = await read_limited(response, max_bytes)
+            result = {
+                'status': response.status,
+                'headers': dict(response.headers),
+                'success': response.status < 400,
+                'truncated': truncated,
+                'bytes_read': len(body),
+                'max_bytes': max_bytes,
+                'content_length': response.content_length
             }
+            if gzip_passthrough and response.headers.get('Content-Encoding') == 'gzip':
+                result['content'] = base64.b64encode(body).decode('ascii')
+                result['content_encoding'] = 'gzip'
+            else:
+                result['content'] = body.decode(response.charset or 'utf-8', errors='replace')
+        outcome = 'ok'
+        return result
+    except asyncio.TimeoutError:
+        outcome = 'timed_out'
+        return {
+            'status': 408,
+            'error': 'Request timeout',
+            'success': False
+        }
+    except Exception as e:
+        return {
+            'status': 500,
+            'error': str(e),
+            'success': False
+        }
+    finally:
+        record_http_request(started, outcome)
+
+async def open_fetch_stream(url, method='GET', headers=None, data=None, timeout=30, gzip_passthrough=False):
+    """
+    Send a request and return the response with its body still unread
+    
+    The timeout applies to connecting and to each read, not the whole transfer.
+    The caller must release the response on the event loop thread.
+    """
+    session = await get_http_session(decompress=not gzip_passthrough)
+    if gzip_passthrough:
+        headers = dict(headers or {}, **{'Accept-Encoding': 'gzip'})
+    return await session.request(
+        method=method,
+        url=url,
+        headers=headers,
+        json=data,
+        timeout=aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)
+    )
+
+# Shared fetch cache with record/replay
+# Modes: 'off' always fetches, 'cache' shares fresh responses between students,
+# 'record' also saves responses to FETCH_RECORDINGS_PATH, and 'replay' only
+# answers from the cache and recordings, never from the network. Only the
+# policy's methods (GET and HEAD unless a lab lists more) are cached or recorded.
+FETCH_CACHE_MODES = ('off', 'cache', 'record', 'replay')
+fetch_cache_lock = threading.Lock()
+fetch_cache = OrderedDict()  # {key: (recorded_at, size, result)}, least recently used first
+fetch_cache_stats = {'hits': 0, 'misses': 0, 'replayed': 0, 'replay_misses': 0, 'evictions': 0, 'bytes': 0}
+fetch_inflight = {}  # {key: asyncio.Task}, only touched from the event loop thread
+
+def get_lab_fetch_cache_policy(lab):
+    """Lab fetch cache policy declared by admins, filled in with defaults"""
+    policy = dict(DEFAULT_FETCH_CACHE_POLICY)
+    if lab:
+        try:
+            policy.update({k: v for k, v in lab.fetch_cache_policy_dict.items() if v is not None})
+        except (TypeError, ValueError):
+            print(f"Warning: Invalid fetch cache policy for lab {lab.id}")
+    if policy['mode'] not in FETCH_CACHE_MODES:
+        policy['mode'] = 'off'
+    if isinstance(policy['methods'], list) and all(isinstance(m, str) for m in policy['methods']):
+        policy['methods'] = [m.upper() for m in policy['methods']]
+    else:
+        policy['methods'] = DEFAULT_FETCH_CACHE_POLICY['methods']
+    if FETCH_REPLAY_ONLY:
+        policy['mode'] = 'replay'
+    return policy
+
+def get_fetch_cache_key(method, url, headers, data, max_bytes, gzip_passthrough):
+    """Identify a fetch by everything that changes its response"""
+    request_key = [method.upper(), url, headers or {}, data, max_bytes, gzip_passthrough]
+    return hashlib.sha256(json.dumps(request_key, sort_keys=True).encode('utf-8')).hexdigest()
+
+def get_fetch_recording_path(key):
+    return os.path.join(FETCH_RECORDINGS_PATH, f"{key}.json")
+
+def get_cached_fetch(key, max_age):
+    """Cached response of a fetch if it is younger than max_age (None accepts any age)"""
+    with fetch_cache_lock:
+        entry = fetch_cache.get(key)
+        if entry is None or (max_age is not None and time.time() - entry[0] >= max_age):
+            return None
+        fetch_cache.move_to_end(key)
+        return entry[2]
+
+def store_fetch_result(key, result, recorded_at=None):
+    """Cache a fetch response, evicting the least recently used ones past FETCH_CACHE_MAX_BYTES"""
+    size = len(result.get('content') or '') + 1024  # Headers and metadata, roughly
+    if size > FETCH_CACHE_MAX_BYTES:
+        return
+    with fetch_cache_lock:
+        previous = fetch_cache.pop(key, None)
+        if previous:
+            fetch_cache_stats['bytes'] -= previous[1]
+        fetch_cache[key] = (recorded_at or time.time(), size, result)
+        fetch_cache_stats['bytes'] += size
+        while fetch_cache_stats['bytes'] > FETCH_CACHE_MAX_BYTES:
+            _, (_, evicted_size, _) = fetch_cache.popitem(last=False)
+            fetch_cache_stats['bytes'] -= evicted_size
+            fetch_cache_stats['evictions'] += 1
+
+def count_fetch_cache(outcome):
+    with fetch_cache_lock:
+        fetch_cache_stats[outcome] += 1
+
+def save_fetch_recording(key, request_info, result):
+    """Write a recorded response to disk so it can be replayed after a restart"""
+    path = get_fetch_recording_path(key)
+    with tempfile.NamedTemporaryFile('w', dir=FETCH_RECORDINGS_PATH, suffix='.tmp', delete=False) as f:
+        json.dump({'request': request_info, 'recorded_at': time.time(), 'result': result}, f)
+    os.replace(f.name, path)
+
+def load_fetch_recording(key):
+    """Recorded response of a fetch from disk, loaded into the cache"""
+    try:
+        with open(get_fetch_recording_path(key)) as f:
+            recording = json.load(f)
+    except (OSError, ValueError):
+        return None
+    store_fetch_result(key, recording['result'], recording['recorded_at'])
+    return recording['result']
+
+async def cached_fetch_url_async(url, method='GET', headers=None, data=None, policy=None,
+                                 max_bytes=FETCH_MAX_BYTES, gzip_passthrough=False):
+    """
+    fetch_url_async behind the shared fetch cache
+    
+    Concurrent misses for the same request wait on a single upstream fetch.
+    Methods the policy does not list bypass the cache, except in replay mode,
+    which never goes to the network.
+    
+    Returns:
+        response dict like fetch_url_async, with 'cache' set to hit, miss, replay or bypass
+    """
+    policy = policy or get_lab_fetch_cache_policy(None)
+    if policy['mode'] == 'off' or (policy['mode'] != 'replay' and method.upper() not in policy['methods']):
+        result = await fetch_url_async(url, method, headers, data, max_bytes=max_bytes, gzip_passthrough=gzip_passthrough)
+        return dict(result, cache='bypass')
+    
+    key = get_fetch_cache_key(method, url, headers, data, max_bytes, gzip_passthrough)
+    if policy['mode'] == 'replay':
+        result = get_cached_fetch(key, None) or await asyncio.to_thread(load_fetch_recording, key)
+        if result is None:
+            count_fetch_cache('replay_misses')
+            return {'status': 504, 'error': 'No recorded response for this request', 'success': False, 'cache': 'replay'}
+        count_fetch_cache('replayed')
+        return dict(result, cache='replay')
+    
+    result = get_cached_fetch(key, policy['ttl'])
+    if result is not None:
+        count_fetch_cache('hits')
+        return dict(result, cache='hit')
+    
+    count_fetch_cache('misses')
+    if key not in fetch_inflight:
+        task = asyncio.ensure_future(fetch_url_async(url, method, headers, data, max_bytes=max_bytes,
+                                                     gzip_passthrough=gzip_passthrough))
+        task.add_done_callback(lambda _: fetch_inflight.pop(key, None))
+        fetch_inflight[key] = task
+        result = await asyncio.shield(task)
+        # Transport errors are not worth sharing; upstream responses of any status are
+        if 'error' not in result:
+            store_fetch_result(key, result)
+            if policy['mode'] == 'record':
+                request_info = {'method': method.upper(), 'url': url}
+                await asyncio.to_thread(save_fetch_recording, key, request_info, result)
+    else:
+        result = await asyncio.shield(fetch_inflight[key])
+    return dict(result, cache='miss')
 
-async def fetch_multiple_urls_async(urls):
+async def fetch_multiple_urls_async(urls, policy=None):
     """
     Fetch multiple URLs concurrently using aiohttp
     
     Args:
         urls: List of URLs to fetch
+        policy: Fetch cache policy of the lab the URLs belong to
     
     Returns:
         List of response dicts
     """
-    tasks = [fetch_url_async(url) for url in urls]
+    tasks = [cached_fetch_url_async(url, policy=policy) for url in urls]
     results = await asyncio.gather(*tasks, return_exceptions=True)
     return results
 
-def run_async(coro):
+async def track_loop_wait(coro, submitted):
+    """Record how long a coroutine waited for the event loop before running it"""
+    with http_lock:
+        http_metrics['calls'] += 1
+        http_metrics['total_wait'] += time.monotonic() - submitted
+    return await coro
+
+def run_async(coro, timeout=None):
     """
     Helper to run async function in sync context
+    
+    The coroutine runs on the shared event loop thread; the calling thread blocks
+    until it finishes or the timeout passes.
     """
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+    future = asyncio.run_coroutine_threadsafe(track_loop_wait(coro, time.monotonic()), get_async_loop())
     try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+        return future.result(timeout)
+    except Exception:
+        future.cancel()
+        raise
+
+def close_http_client():
+    """Close pooled connections and stop the event loop thread"""
+    loop = async_loop
+    if loop is None or loop.is_closed():
+        return
+    async def close_sessions():
+        for client in list(http_sessions.values()):
+            await client.close()
+        if http_connector is not None:
+            await http_connector.close()
+    
+    try:
+        asyncio.run_coroutine_threadsafe(close_sessions(), loop).result(5)
+    except Exception as e:
+        print(f"Warning: Could not close HTTP client: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+
+atexit.register(close_http_client)
+
+# Resource availability cache, shared by request handlers and the health monitor
+resource_lock = threading.Lock()
+resource_cache = {}  # {url: (checked_at, result)}
+resource_probes = {}  # {url: asyncio.Task}, only touched from the event loop thread
+resource_semaphore = None  # Created on the event loop thread
+
+async def probe_resource(url):
+    """Probe one resource URL, at most RESOURCE_CHECK_CONCURRENCY at a time"""
+    global resource_semaphore
+    if resource_semaphore is None:
+        resource_semaphore = asyncio.Semaphore(RESOURCE_CHECK_CONCURRENCY)
+    
+    session = await get_http_session()
+    async with resource_semaphore:
+        started = start_http_request()
+        outcome = 'failed'  # Recorded once in finally, like fetch_url_async
+        try:
+            timeout = aiohttp.ClientTimeout(total=RESOURCE_CHECK_TIMEOUT_SECONDS)
+            async with session.get(url, timeout=timeout) as response:
+                result = {
+                    'available': response.status < 500,
+                    'status': response.status,
+                    'response_time': response.headers.get('X-Response-Time', 'N/A')
+                }
+            outcome = 'ok'
+        except asyncio.TimeoutError:
+            outcome = 'timed_out'
+            result = {
+                'available': False,
+                'error': 'Request timeout'
+            }
+        except Exception as e:
+            result = {
+                'available': False,
+                'error': str(e)
+            }
+        finally:
+            record_http_request(started, outcome)
+    
+    result['checked_at'] = datetime.utcnow().isoformat()
+    store_resource_result(url, result)
+    return result
 
-async def check_lab_resource_availability(resource_urls):
+def store_resource_result(url, result):
+    """Cache a probe result, dropping expired entries when the cache is full"""
+    now = time.time()
+    with resource_lock:
+        if len(resource_cache) >= RESOURCE_CACHE_MAX_ENTRIES:
+            for key in [k for k, (checked_at, _) in resource_cache.items() if now - checked_at >= RESOURCE_CACHE_SECONDS]:
+                del resource_cache[key]
+        resource_cache[url] = (now, result)
+
+async def check_lab_resource_availability(resource_urls, max_age=RESOURCE_CACHE_SECONDS):
     """
     Check if lab resources (external APIs, services) are available
     
+    Fresh cached results are returned as is; the rest are probed concurrently.
+    A URL that is already being probed is awaited instead of probed twice.
+    
     Args:
         resource_urls: List of resource URLs to check
+        max_age: Oldest cached result to accept, in seconds (0 always probes)
     
     Returns:
         dict with availability status for each resource
     """
     results = {}
-    async with aiohttp.ClientSession() as session:
-        for url in resource_urls:
+    stale = []
+    now = time.time()
+    with resource_lock:
+        for url in dict.fromkeys(resource_urls):
+            cached = resource_cache.get(url)
+            if cached and now - cached[0] < max_age:
+                results[url] = cached[1]
+            else:
+                stale.append(url)
+    
+    for url in stale:
+        if url not in resource_probes:
+            task = asyncio.ensure_future(probe_resource(url))
+            task.add_done_callback(lambda _, url=url: resource_probes.pop(url, None))
+            resource_probes[url] = task
+    
+    probed = await asyncio.gather(*(resource_probes[url] for url in stale))
+    results.update(zip(stale, probed))
+    return results
+
+def get_monitored_resource_urls():
+    """HTTP(S) resources listed on active labs"""
+    urls = set()
+    for (resources,) in db.session.query(Lab.accessible_resources).filter(Lab.is_active == True).all():
+        if not resources:
+            continue
+        for resource in json.loads(resources):
+            if isinstance(resource, str) and resource.startswith(('http://', 'https://')):
+                urls.add(resource)
+    return sorted(urls)
+
+def resource_monitor_loop():
+    """Background loop that keeps the availability of lab resources cached"""
+    print(f"Resource monitor started (every {RESOURCE_MONITOR_INTERVAL_SECONDS}s)")
+    while True:
+        with app.app_context():
             try:
-                timeout = aiohttp.ClientTimeout(total=5)
-                async with session.get(url, timeout=timeout) as response:
-                    results[url] = {
-                        'available': response.status < 500,
-                        'status': response.status,
-                        'response_time': response.headers.get('X-Response-Time', 'N/A')
-                    }
+                urls = get_monitored_resource_urls()
             except Exception as e:
-                results[url] = {
-                    'available': False,
-                    'error': str(e)
-                }
-    return results
+                print(f"Resource monitor error: {e}")
+                db.session.rollback()
+                urls = []
+            finally:
+                db.session.remove()
+        
+        if urls:
+            try:
+                run_async(check_lab_resource_availability(urls, max_age=0))
+            except Exception as e:
+                print(f"Resource monitor error: {e}")
+        time.sleep(RESOURCE_MONITOR_INTERVAL_SECONDS)
 
 def validate_command_access(command, accessible_resources, current_dir):
     """
@@ -555,6 +1271,7 @@ def logout():
 
 @app.route('/profile')
 @login_required
+@read_replica
 def profile():
     """User profile page"""
     user_id = session['user']['id']
@@ -565,9 +1282,12 @@ def profile():
     completed_labs = LabSession.query.filter_by(user_id=user_id, status='completed').count()
     in_progress_labs = LabSession.query.filter_by(user_id=user_id, status='in_progress').count()
     
-    # Get average score
-    completed_sessions = LabSession.query.filter_by(user_id=user_id, status='completed').all()
-    avg_score = sum(s.score for s in completed_sessions if s.score) / len(completed_sessions) if completed_sessions else 0
+    # Get average score from the gradebook
+    score_total, completed_count = db.session.query(
+        db.func.sum(CourseGradebook.completed_score_total),
+        db.func.sum(CourseGradebook.completed_labs)
+    ).filter(CourseGradebook.user_id == user_id).one()
+    avg_score = (score_total or 0) / completed_count if completed_count else 0
     
     # Get recent lab sessions
     recent_sessions = db.session.query(LabSession, Lab).join(Lab).filter(
@@ -618,54 +1338,110 @@ def update_settings():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/dashboard')
-@login_required
-def dashboard():
-    user_id = session['user']['id']
+# Dashboard view models, cached per user
+# In process memory: invalidate_dashboard() reaches every cached copy because
+# claim_app_process() keeps the app to a single process
+dashboard_cache_lock = threading.Lock()
+dashboard_cache = {}  # user_id -> (expires_at, enrolled_courses)
+
+def invalidate_dashboard(user_id=None):
+    """Drop the cached dashboard of one user, or of everyone when user_id is None"""
+    with dashboard_cache_lock:
+        if user_id is None:
+            dashboard_cache.clear()
+        else:
+            dashboard_cache.pop(user_id, None)
+
+def build_dashboard_view(user_id):
+    """
+    Build the dashboard view model of a user with a single query
     
-    # Get user's enrolled courses with labs
-    enrollments = db.session.query(Enrollment, Course).join(Course).filter(
-        Enrollment.user_id == user_id,
-        Enrollment.status == 'active'
-    ).all()
+    Enrollments, their active labs and the user's lab sessions are fetched
+    with one outer-joined query and grouped in Python.
+    
+    Returns:
+        List of {'course', 'labs', 'enrollment'} dicts of plain values
+    """
+    rows = db.session.query(
+        Enrollment.id, Enrollment.enrolled_at, Enrollment.status,
+        Course.id, Course.code, Course.name, Course.description, Course.semester,
+        Lab.id, Lab.name, Lab.description, Lab.deadline, Lab.difficulty,
+        Lab.estimated_duration, Lab.max_score,
+        LabSession.status, LabSession.score, LabSession.started_at, LabSession.completed_at
+    ).join(Course, Enrollment.course_id == Course.id)\
+        .outerjoin(Lab, db.and_(Lab.course_id == Course.id, Lab.is_active == True))\
+        .outerjoin(LabSession, db.and_(LabSession.lab_id == Lab.id, LabSession.user_id == user_id))\
+        .filter(Enrollment.user_id == user_id, Enrollment.status == 'active')\
+        .order_by(Enrollment.id, Lab.order_index, Lab.id).all()
     
     enrolled_courses = []
-    for enrollment, course in enrollments:
-        # Get labs for this course
-        labs = Lab.query.filter_by(course_id=course.id, is_active=True).order_by(Lab.order_index).all()
-        
-        course_labs = []
-        for lab in labs:
-            # Get lab session for this user
-            lab_session = LabSession.query.filter_by(user_id=user_id, lab_id=lab.id).first()
-            
-            lab_info = {
-                'id': lab.id,
-                'name': lab.name,
-                'description': lab.description,
-                'deadline': lab.deadline,
-                'difficulty': lab.difficulty,
-                'estimated_duration': lab.estimated_duration,
-                'max_score': lab.max_score,
-                'status': lab_session.status if lab_session else 'not_started',
-                'score': lab_session.score if lab_session else None,
-                'started_at': lab_session.started_at if lab_session else None,
-                'completed_at': lab_session.completed_at if lab_session else None
+    courses_by_enrollment = {}
+    seen_labs = set()
+    for (enrollment_id, enrolled_at, enrollment_status,
+         course_id, code, name, description, semester,
+         lab_id, lab_name, lab_description, deadline, difficulty,
+         estimated_duration, max_score,
+         session_status, score, started_at, completed_at) in rows:
+        course_info = courses_by_enrollment.get(enrollment_id)
+        if course_info is None:
+            course_info = {
+                'course': {'id': course_id, 'code': code, 'name': name,
+                           'description': description, 'semester': semester},
+                'labs': [],
+                'enrollment': {'id': enrollment_id, 'enrolled_at': enrolled_at, 'status': enrollment_status}
             }
-            course_labs.append(lab_info)
+            courses_by_enrollment[enrollment_id] = course_info
+            enrolled_courses.append(course_info)
+        
+        # Courses without active labs still get a row, and only the first session of a lab counts
+        if lab_id is None or (enrollment_id, lab_id) in seen_labs:
+            continue
+        seen_labs.add((enrollment_id, lab_id))
         
-        enrolled_courses.append({
-            'course': course,
-            'labs': course_labs,
-            'enrollment': enrollment
+        course_info['labs'].append({
+            'id': lab_id,
+            'name': lab_name,
+            'description': lab_description,
+            'deadline': deadline,
+            'difficulty': difficulty,
+            'estimated_duration': estimated_duration,
+            'max_score': max_score,
+            'status': session_status or 'not_started',
+            'score': score,
+            'started_at': started_at,
+            'completed_at': completed_at
         })
     
+    return enrolled_courses
+
+def get_dashboard_view(user_id):
+    """Get the dashboard view model of a user from the cache, building it on a miss"""
+    now = time.monotonic()
+    with dashboard_cache_lock:
+        cached = dashboard_cache.get(user_id)
+        if cached and cached[0] > now:
+            return cached[1]
+    
+    enrolled_courses = build_dashboard_view(user_id)
+    with dashboard_cache_lock:
+        dashboard_cache[user_id] = (now + DASHBOARD_CACHE_SECONDS, enrolled_courses)
+    return enrolled_courses
+
+@app.route('/dashboard')
+@login_required
+def dashboard():
+    user_id = session['user']['id']
+    
+    # Get user's enrolled courses with labs
+    enrolled_courses = get_dashboard_view(user_id)
+    
     return render_template('dashboard.html', 
                          enrolled_courses=enrolled_courses,
                          current_time=datetime.utcnow())
 
 @app.route('/api/courses')
 @login_required
+@cached_response('courses', 'labs', 'enrollments', per_user=True)
 def get_available_courses():
     """Get all available courses for enrollment"""
     user_id = session['user']['id']
@@ -673,12 +1449,13 @@ def get_available_courses():
     # Get courses user is not enrolled in
     enrolled_course_ids = db.session.query(Enrollment.course_id).filter_by(
         user_id=user_id, status='active'
-    ).subquery()
+    ).scalar_subquery()
     
     available_courses = Course.query.filter(
         Course.is_active == True,
         ~Course.id.in_(enrolled_course_ids)
     ).all()
+    lab_counts = count_by_course(Lab, [course.id for course in available_courses])
     
     courses_data = []
     for course in available_courses:
@@ -688,7 +1465,7 @@ def get_available_courses():
             'name': course.name,
             'description': course.description,
             'semester': course.semester,
-            'lab_count': len(course.labs)
+            'lab_count': lab_counts.get(course.id, 0)
         })
     
     return jsonify(courses_data)
@@ -727,6 +1504,9 @@ def enroll_course():
     
     try:
         db.session.commit()
+        bump_data_version('enrollments')
+        invalidate_dashboard(user_id)
+        pin_reads_to_primary()
         
         # Clone lab folders for all labs in this course
         labs = Lab.query.filter_by(course_id=course_id, is_active=True).all()
@@ -743,18 +1523,54 @@ def enroll_course():
 def check_resources():
     """Check availability of external resources using aiohttp"""
     resource_urls = request.json.get('urls', [])
+    max_age = 0 if request.json.get('refresh') else RESOURCE_CACHE_SECONDS
     
     if not resource_urls:
         return jsonify({'error': 'No URLs provided'}), 400
     
     # Run async function in sync context
-    results = run_async(check_lab_resource_availability(resource_urls))
+    results = run_async(check_lab_resource_availability(resource_urls, max_age))
     
     return jsonify({
         'resources': results,
         'checked_at': datetime.utcnow().isoformat()
     })
 
+@app.route('/admin/resources/health')
+@admin_required
+def resource_health():
+    """Get the cached availability of every resource configured on active labs"""
+    urls = get_monitored_resource_urls()
+    with resource_lock:
+        cached = {url: resource_cache.get(url) for url in urls}
+    
+    return jsonify({
+        'resources': {url: entry[1] if entry else None for url, entry in cached.items()},
+        'unavailable': sorted(url for url, entry in cached.items() if entry and not entry[1]['available']),
+        'monitor_enabled': RESOURCE_MONITOR_ENABLED,
+        'interval_seconds': RESOURCE_MONITOR_INTERVAL_SECONDS
+    })
+
+def get_fetch_lab(lab_id):
+    """
+    Lab whose fetch cache policy applies to a fetch request
+    
+    The lab decides how responses are shared, so students may only name a
+    lab they have a session in; admins may name any lab.
+    
+    Returns:
+        tuple: (Lab or None, error response or None)
+    """
+    if not lab_id:
+        return None, None
+    lab = db.session.get(Lab, lab_id)
+    if not lab:
+        return None, (jsonify({'error': 'Lab not found'}), 404)
+    if session['user']['role'] != 'admin' and not LabSession.query.filter_by(
+            user_id=session['user']['id'], lab_id=lab.id).first():
+        return None, (jsonify({'error': 'Unauthorized'}), 403)
+    return lab, None
+
 @app.route('/api/fetch_url', methods=['POST'])
 @login_required
 def fetch_url():
@@ -765,19 +1581,95 @@ def fetch_url():
     headers = data.get('headers')
     payload = data.get('data')
     
+    max_bytes = data.get('max_bytes', FETCH_MAX_BYTES)
+    gzip_passthrough = bool(data.get('gzip_passthrough'))
+    
     if not url:
         return jsonify({'error': 'URL is required'}), 400
+    if not isinstance(max_bytes, int) or isinstance(max_bytes, bool) or max_bytes < 0:
+        return jsonify({'error': 'max_bytes must be a non-negative integer'}), 400
+    max_bytes = min(max_bytes, FETCH_MAX_BYTES)
+    
+    lab, error = get_fetch_lab(data.get('lab_id'))
+    if error:
+        return error
     
     # Run async fetch
-    result = run_async(fetch_url_async(url, method, headers, payload))
+    result = run_async(cached_fetch_url_async(url, method, headers, payload, get_lab_fetch_cache_policy(lab),
+                                              max_bytes=max_bytes, gzip_passthrough=gzip_passthrough))
     
     return jsonify(result)
 
+@app.route('/api/fetch_url/stream', methods=['POST'])
+@login_required
+def fetch_url_stream():
+    """Pipe a fetched URL to the client chunk by chunk, without buffering the body"""
+    data = request.json
+    url = data.get('url')
+    
+    if not url:
+        return jsonify({'error': 'URL is required'}), 400
+    
+    # Hand gzip bodies over untouched when the client can decode them itself
+    gzip_passthrough = 'gzip' in request.headers.get('Accept-Encoding', '')
+    started = start_http_request()
+    try:
+        response = run_async(open_fetch_stream(
+            url, data.get('method', 'GET'), data.get('headers'), data.get('data'),
+            gzip_passthrough=gzip_passthrough
+        ))
+    except asyncio.TimeoutError:
+        record_http_request(started, 'timed_out')
+        return jsonify({'error': 'Request timeout'}), 504
+    except Exception as e:
+        record_http_request(started, 'failed')
+        return jsonify({'error': str(e)}), 502
+    
+    state = {'outcome': 'failed', 'released': False}
+    
+    def release():
+        """Hand the upstream connection back once, even if the body was never iterated"""
+        if state['released']:
+            return
+        state['released'] = True
+        get_async_loop().call_soon_threadsafe(response.release)
+        record_http_request(started, state['outcome'])
+    
+    def generate():
+        sent = 0
+        try:
+            while sent < FETCH_STREAM_MAX_BYTES:
+                chunk = run_async(response.content.read(FETCH_CHUNK_SIZE))
+                if not chunk:
+                    break
+                chunk = chunk[:FETCH_STREAM_MAX_BYTES - sent]
+                sent += len(chunk)
+                yield chunk
+            state['outcome'] = 'ok'
+        except asyncio.TimeoutError:
+            state['outcome'] = 'timed_out'
+        finally:
+            release()
+    
+    stream_headers = {'X-Upstream-Status': str(response.status), 'X-Fetch-Max-Bytes': str(FETCH_STREAM_MAX_BYTES)}
+    if gzip_passthrough and response.headers.get('Content-Encoding') == 'gzip':
+        stream_headers['Content-Encoding'] = 'gzip'
+    stream_response = Response(
+        generate(),
+        status=response.status,
+        content_type=response.headers.get('Content-Type', 'application/octet-stream'),
+        headers=stream_headers
+    )
+    # The WSGI server closes the response even when the client left before the first chunk
+    stream_response.call_on_close(release)
+    return stream_response
+
 @app.route('/api/fetch_multiple', methods=['POST'])
 @login_required
 def fetch_multiple():
     """Fetch multiple URLs concurrently using aiohttp"""
     urls = request.json.get('urls', [])
+    lab_id = request.json.get('lab_id')
     
     if not urls:
         return jsonify({'error': 'No URLs provided'}), 400
@@ -785,16 +1677,53 @@ def fetch_multiple():
     if len(urls) > 10:
         return jsonify({'error': 'Maximum 10 URLs allowed'}), 400
     
+    lab, error = get_fetch_lab(lab_id)
+    if error:
+        return error
+    
     # Run async fetch for multiple URLs
-    results = run_async(fetch_multiple_urls_async(urls))
+    results = run_async(fetch_multiple_urls_async(urls, get_lab_fetch_cache_policy(lab)))
     
     return jsonify({
         'results': results,
         'count': len(results)
     })
 
+@app.route('/admin/fetch_cache')
+@admin_required
+def fetch_cache_status():
+    """Get hit rates and memory use of the shared fetch cache"""
+    with fetch_cache_lock:
+        stats = dict(fetch_cache_stats, entries=len(fetch_cache))
+    
+    lookups = stats['hits'] + stats['misses']
+    return jsonify({
+        **stats,
+        'max_bytes': FETCH_CACHE_MAX_BYTES,
+        'hit_rate': round(stats['hits'] / lookups, 3) if lookups else None,
+        'recordings': len([name for name in os.listdir(FETCH_RECORDINGS_PATH) if name.endswith('.json')]),
+        'replay_only': FETCH_REPLAY_ONLY
+    })
+
+@app.route('/admin/fetch_cache/clear', methods=['POST'])
+@admin_required
+def clear_fetch_cache():
+    """Empty the fetch cache, and also delete the recordings if asked"""
+    with fetch_cache_lock:
+        fetch_cache.clear()
+        fetch_cache_stats['bytes'] = 0
+    
+    deleted = 0
+    if (request.json or {}).get('recordings'):
+        for name in os.listdir(FETCH_RECORDINGS_PATH):
+            if name.endswith('.json'):
+                os.remove(os.path.join(FETCH_RECORDINGS_PATH, name))
+                deleted += 1
+    return jsonify({'message': 'Fetch cache cleared', 'recordings_deleted': deleted})
+
 @app.route('/api/check_lab_template/<int:lab_id>')
 @login_required
+@cached_response('labs', 'lab_templates')
 def check_lab_template(lab_id):
     """Check if lab template exists"""
     lab = db.session.get(Lab, lab_id)
@@ -823,46 +1752,239 @@ def check_lab_template(lab_id):
 # Admin Routes
 @app.route('/admin')
 @admin_required
+@read_replica
 def admin_dashboard():
     """Admin dashboard"""
-    users = User.query.all()
-    courses = Course.query.all()
-    labs = Lab.query.all()
-    enrollments = Enrollment.query.all()
-    lab_sessions = LabSession.query.all()
+    # Tables are loaded by the page through the admin list endpoints
+    return render_template('admin.html', stats=get_admin_stats())
+
+@app.route('/admin/stats')
+@admin_required
+@read_replica
+def admin_stats():
+    """Get admin dashboard statistics"""
+    return jsonify(get_admin_stats(refresh=request.args.get('refresh') == 'true'))
+
+# Admin statistics, cached for a short time
+admin_stats_lock = threading.Lock()
+admin_stats_cache = {'expires_at': 0, 'stats': None}
+
+def count_with_active(model):
+    """Count all rows of a model and the active ones in one query"""
+    total, active = db.session.query(
+        db.func.count(model.id),
+        db.func.sum(db.case((model.is_active == True, 1), else_=0))
+    ).one()
+    return total or 0, int(active or 0)
+
+def count_by_course(model, course_ids):
+    """Count rows of a model per course for the given course ids with one grouped query"""
+    if not course_ids:
+        return {}
+    return dict(db.session.query(model.course_id, db.func.count(model.id))
+                .filter(model.course_id.in_(course_ids))
+                .group_by(model.course_id).all())
+
+def count_by_status(model):
+    """Count rows of a model grouped by their status column"""
+    return {status or 'unknown': count for status, count in
+            db.session.query(model.status, db.func.count(model.id)).group_by(model.status)}
+
+def get_admin_stats(refresh=False):
+    """
+    Compute admin dashboard statistics with COUNT/GROUP BY aggregates
+    
+    Results are cached for ADMIN_STATS_CACHE_SECONDS.
+    
+    Args:
+        refresh: Recompute even if the cached value is still fresh
+    """
+    now = time.monotonic()
+    with admin_stats_lock:
+        if not refresh and admin_stats_cache['stats'] and admin_stats_cache['expires_at'] > now:
+            return admin_stats_cache['stats']
+    
+    total_users, active_users = count_with_active(User)
+    total_courses, active_courses = count_with_active(Course)
+    total_labs, active_labs = count_with_active(Lab)
+    enrollments_by_status = count_by_status(Enrollment)
+    lab_sessions_by_status = count_by_status(LabSession)
     
     stats = {
-        'total_users': len(users),
-        'total_courses': len(courses),
-        'total_labs': len(labs),
-        'total_enrollments': len(enrollments),
-        'total_lab_sessions': len(lab_sessions),
-        'active_users': User.query.filter_by(is_active=True).count(),
-        'active_courses': Course.query.filter_by(is_active=True).count(),
+        'total_users': total_users,
+        'total_courses': total_courses,
+        'total_labs': total_labs,
+        'total_enrollments': sum(enrollments_by_status.values()),
+        'total_lab_sessions': sum(lab_sessions_by_status.values()),
+        'active_users': active_users,
+        'active_courses': active_courses,
+        'active_labs': active_labs,
+        'enrollments_by_status': enrollments_by_status,
+        'lab_sessions_by_status': lab_sessions_by_status,
+        'generated_at': datetime.utcnow().isoformat()
     }
     
-    return render_template('admin.html', 
-                         users=users, 
-                         courses=courses, 
-                         labs=labs,
-                         enrollments=enrollments,
-                         stats=stats)
+    with admin_stats_lock:
+        admin_stats_cache['stats'] = stats
+        admin_stats_cache['expires_at'] = now + ADMIN_STATS_CACHE_SECONDS
+    return stats
 
-# User Management
-@app.route('/admin/users')
-@admin_required
-def admin_users():
-    """Get all users"""
-    users = User.query.order_by(User.created_at.desc()).all()
-    return jsonify([{
-        'id': u.id,
-        'email': u.email,
+# Admin list pagination
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page as an opaque cursor"""
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor, sort_columns):
+    """Decode a cursor back into sort key values typed like sort_columns"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(sort_columns):
+        raise ValueError('Invalid cursor')
+    
+    decoded = []
+    for column, value in zip(sort_columns, values):
+        if value is not None and column.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+        decoded.append(value)
+    return decoded
+
+def get_list_sort(sort_options, default_sort):
+    """
+    Resolve the ?sort= argument of an admin list
+    
+    Args:
+        sort_options: dict of sort name -> list of columns (the id is appended as tie-breaker)
+        default_sort: Sort name used when none is given; prefix with '-' for descending
+    
+    Returns:
+        Tuple (sort name, sort columns, descending)
+    """
+    sort = request.args.get('sort') or default_sort
+    descending = sort.startswith('-')
+    name = sort.lstrip('-')
+    if name not in sort_options:
+        raise ValueError(f'Unsupported sort: {name}')
+    return sort, sort_options[name], descending
+
+def search_filter(term, *columns):
+    """Case-insensitive substring match of a search term on any of the columns"""
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return db.or_(*[column.ilike(f'%{escaped}%', escape='\\') for column in columns])
+
+def keyset_after(sort_columns, values, descending):
+    """
+    Filter for the rows that sort after a cursor position
+    
+    A row-value comparison drops rows with a NULL sort key, so the comparison
+    is expanded column by column. NULLs are treated as the smallest value,
+    which is how MySQL and SQLite order them, so the plain ORDER BY can still
+    walk the sort index.
+    """
+    clauses = []
+    for i, (column, value) in enumerate(zip(sort_columns, values)):
+        if value is None:
+            # NULLs come first ascending and last descending
+            after = sa.false() if descending else column.isnot(None)
+        elif descending and column.nullable:
+            after = db.or_(column < value, column.is_(None))
+        elif descending:
+            after = column < value
+        else:
+            after = column > value
+        
+        equal = [c.is_(None) if v is None else c == v for c, v in zip(sort_columns[:i], values[:i])]
+        clauses.append(db.and_(*equal, after))
+    return db.or_(*clauses)
+
+def paginate_keyset(query, sort_columns, descending):
+    """
+    Fetch one page of a query with keyset (cursor) pagination
+    
+    The page starts after the row encoded in ?cursor= and holds ?limit= rows,
+    so the cost of a page does not depend on how deep it is. Rows with NULL
+    sort keys are paged like any other (see keyset_after).
+    
+    Args:
+        query: Filtered query without ORDER BY
+        sort_columns: Columns of the sort key, ending with a unique column
+        descending: Sort direction
+    
+    Returns:
+        Tuple (rows, next cursor or None); rows are what the query returns
+    """
+    limit = request.args.get('limit', ADMIN_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, ADMIN_PAGE_SIZE_MAX))
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.filter(keyset_after(sort_columns, decode_cursor(cursor, sort_columns), descending))
+    
+    order_by = [column.desc() if descending else column.asc() for column in sort_columns]
+    rows = query.add_columns(*sort_columns).order_by(*order_by).limit(limit + 1).all()
+    
+    key_size = len(sort_columns)
+    next_cursor = encode_cursor(rows[limit - 1][-key_size:]) if len(rows) > limit else None
+    items = []
+    for row in rows[:limit]:
+        entities = tuple(row[:-key_size])
+        items.append(entities[0] if len(entities) == 1 else entities)
+    return items, next_cursor
+
+def list_response(items, next_cursor, sort):
+    """Build the JSON body of an admin list page"""
+    return jsonify({
+        'items': items,
+        'next_cursor': next_cursor,
+        'sort': sort
+    })
+
+def get_bool_arg(name):
+    """Read a true/false query argument, None when absent"""
+    value = request.args.get(name)
+    if value in (None, ''):
+        return None
+    return value.lower() == 'true'
+
+# User Management
+@app.route('/admin/users')
+@admin_required
+def admin_users():
+    """
+    Get a page of users
+    
+    Query args: search, role, is_active, sort (created_at, email, full_name), cursor, limit
+    """
+    try:
+        sort, sort_columns, descending = get_list_sort({
+            'created_at': [User.created_at, User.id],
+            'email': [User.email, User.id],
+            'full_name': [User.full_name, User.id]
+        }, '-created_at')
+        
+        query = User.query
+        if request.args.get('search'):
+            query = query.filter(search_filter(request.args['search'], User.email, User.full_name))
+        if request.args.get('role'):
+            query = query.filter(User.role == request.args['role'])
+        if get_bool_arg('is_active') is not None:
+            query = query.filter(User.is_active == get_bool_arg('is_active'))
+        
+        users, next_cursor = paginate_keyset(query, sort_columns, descending)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return list_response([{
+        'id': u.id,
+        'email': u.email,
         'full_name': u.full_name,
         'role': u.role,
         'is_active': u.is_active,
         'created_at': u.created_at.isoformat() if u.created_at else None,
         'last_login': u.last_login.isoformat() if u.last_login else None
-    } for u in users])
+    } for u in users], next_cursor, sort)
 
 @app.route('/admin/user/<int:user_id>', methods=['PUT'])
 @admin_required
@@ -899,6 +2021,8 @@ def delete_user(user_id):
         # Delete from database first
         db.session.delete(user)
         db.session.commit()
+        bump_data_version('enrollments')
+        invalidate_dashboard(user_id)
         
         # Delete Linux user if on Linux system
         if platform.system() != 'Windows':
@@ -933,10 +2057,37 @@ def delete_user(user_id):
 # Course Management
 @app.route('/admin/courses')
 @admin_required
+@cached_response('courses', 'labs', 'enrollments')
 def admin_courses():
-    """Get all courses"""
-    courses = Course.query.order_by(Course.created_at.desc()).all()
-    return jsonify([{
+    """
+    Get a page of courses
+    
+    Query args: search, semester, is_active, sort (created_at, code, name), cursor, limit
+    """
+    try:
+        sort, sort_columns, descending = get_list_sort({
+            'created_at': [Course.created_at, Course.id],
+            'code': [Course.code, Course.id],
+            'name': [Course.name, Course.id]
+        }, '-created_at')
+        
+        query = Course.query
+        if request.args.get('search'):
+            query = query.filter(search_filter(request.args['search'], Course.code, Course.name))
+        if request.args.get('semester'):
+            query = query.filter(Course.semester == request.args['semester'])
+        if get_bool_arg('is_active') is not None:
+            query = query.filter(Course.is_active == get_bool_arg('is_active'))
+        
+        courses, next_cursor = paginate_keyset(query, sort_columns, descending)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    course_ids = [c.id for c in courses]
+    lab_counts = count_by_course(Lab, course_ids)
+    enrollment_counts = count_by_course(Enrollment, course_ids)
+    
+    return list_response([{
         'id': c.id,
         'code': c.code,
         'name': c.name,
@@ -944,10 +2095,17 @@ def admin_courses():
         'semester': c.semester,
         'is_active': c.is_active,
         'max_students': c.max_students,
-        'lab_count': len(c.labs),
-        'enrollment_count': len(c.enrollments),
+        'lab_count': lab_counts.get(c.id, 0),
+        'enrollment_count': enrollment_counts.get(c.id, 0),
         'created_at': c.created_at.isoformat() if c.created_at else None
-    } for c in courses])
+    } for c in courses], next_cursor, sort)
+
+@app.route('/admin/course_options')
+@admin_required
+def admin_course_options():
+    """Get id, code and name of every course for select boxes"""
+    courses = db.session.query(Course.id, Course.code, Course.name).order_by(Course.code).all()
+    return jsonify([{'id': id, 'code': code, 'name': name} for id, code, name in courses])
 
 @app.route('/admin/course', methods=['POST'])
 @admin_required
@@ -967,6 +2125,7 @@ def create_course():
     try:
         db.session.add(course)
         db.session.commit()
+        bump_data_version('courses')
         return jsonify({'message': 'Course created successfully', 'id': course.id})
     except Exception as e:
         db.session.rollback()
@@ -994,6 +2153,8 @@ def update_course(course_id):
     
     try:
         db.session.commit()
+        bump_data_version('courses')
+        invalidate_dashboard()
         return jsonify({'message': 'Course updated successfully'})
     except Exception as e:
         db.session.rollback()
@@ -1008,6 +2169,8 @@ def delete_course(course_id):
     try:
         db.session.delete(course)
         db.session.commit()
+        bump_data_version('courses', 'labs', 'enrollments')
+        invalidate_dashboard()
         return jsonify({'message': 'Course deleted successfully'})
     except Exception as e:
         db.session.rollback()
@@ -1068,10 +2231,35 @@ def upload_lab_pdf():
 # Lab Management
 @app.route('/admin/labs')
 @admin_required
+@cached_response('courses', 'labs')
 def admin_labs():
-    """Get all labs"""
-    labs = Lab.query.order_by(Lab.course_id, Lab.order_index).all()
-    return jsonify([{
+    """
+    Get a page of labs
+    
+    Query args: course_id, search, difficulty, is_active, sort (order, name, created_at), cursor, limit
+    """
+    try:
+        sort, sort_columns, descending = get_list_sort({
+            'order': [Lab.course_id, Lab.order_index, Lab.id],
+            'name': [Lab.name, Lab.id],
+            'created_at': [Lab.created_at, Lab.id]
+        }, 'order')
+        
+        query = Lab.query.options(db.joinedload(Lab.course), db.selectinload(Lab.lab_parameters))
+        if request.args.get('course_id'):
+            query = query.filter(Lab.course_id == request.args.get('course_id', type=int))
+        if request.args.get('search'):
+            query = query.filter(search_filter(request.args['search'], Lab.name))
+        if request.args.get('difficulty'):
+            query = query.filter(Lab.difficulty == request.args['difficulty'])
+        if get_bool_arg('is_active') is not None:
+            query = query.filter(Lab.is_active == get_bool_arg('is_active'))
+        
+        labs, next_cursor = paginate_keyset(query, sort_columns, descending)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return list_response([{
         'id': l.id,
         'name': l.name,
         'course_id': l.course_id,
@@ -1085,6 +2273,9 @@ def admin_labs():
         'checkpoint_rules': l.checkpoint_rules,
         'pdf_instruction_url': l.pdf_instruction_url,
         'output_result': l.output_result,
+        'resource_profile': l.resource_profile,
+        'fetch_cache_policy': l.fetch_cache_policy,
+        'verify_command': l.verify_command,
         'difficulty': l.difficulty,
         'is_active': l.is_active,
         'order_index': l.order_index,
@@ -1100,7 +2291,7 @@ def admin_labs():
             'file_path': p.file_path,
             'description': p.description
         } for p in l.lab_parameters]
-    } for l in labs])
+    } for l in labs], next_cursor, sort)
 
 @app.route('/admin/lab', methods=['POST'])
 @admin_required
@@ -1120,6 +2311,9 @@ def create_lab():
         checkpoint_rules=json.dumps(data.get('checkpoint_rules', {})),
         pdf_instruction_url=data.get('pdf_instruction_url'),
         output_result=data.get('output_result'),
+        resource_profile=json.dumps(data['resource_profile']) if data.get('resource_profile') else None,
+        fetch_cache_policy=json.dumps(data['fetch_cache_policy']) if data.get('fetch_cache_policy') else None,
+        verify_command=data.get('verify_command') or None,
         order_index=data.get('order_index', 0),
         difficulty=data.get('difficulty', 'medium'),
         max_score=data.get('max_score', 100),
@@ -1133,6 +2327,8 @@ def create_lab():
     try:
         db.session.add(lab)
         db.session.commit()
+        bump_data_version('labs')
+        invalidate_dashboard()
         
         # Create parameters if provided
         if 'parameters' in data and data['parameters']:
@@ -1146,6 +2342,7 @@ def create_lab():
                 )
                 db.session.add(param)
             db.session.commit()
+            bump_data_version('labs')
         
         return jsonify({'message': 'Lab created successfully', 'id': lab.id})
     except Exception as e:
@@ -1175,10 +2372,17 @@ def update_lab(lab_id):
         lab.num_checkpoints = data['num_checkpoints']
     if 'checkpoint_rules' in data:
         lab.checkpoint_rules = json.dumps(data['checkpoint_rules'])
+        invalidate_lab_flags(lab_id)
     if 'pdf_instruction_url' in data:
         lab.pdf_instruction_url = data['pdf_instruction_url']
     if 'output_result' in data:
         lab.output_result = data['output_result']
+    if 'resource_profile' in data:
+        lab.resource_profile = json.dumps(data['resource_profile']) if data['resource_profile'] else None
+    if 'fetch_cache_policy' in data:
+        lab.fetch_cache_policy = json.dumps(data['fetch_cache_policy']) if data['fetch_cache_policy'] else None
+    if 'verify_command' in data:
+        lab.verify_command = data['verify_command'] or None
     if 'order_index' in data:
         lab.order_index = data['order_index']
     if 'difficulty' in data:
@@ -1212,6 +2416,8 @@ def update_lab(lab_id):
     
     try:
         db.session.commit()
+        bump_data_version('labs')
+        invalidate_dashboard()
         return jsonify({'message': 'Lab updated successfully'})
     except Exception as e:
         db.session.rollback()
@@ -1224,8 +2430,14 @@ def delete_lab(lab_id):
     lab = Lab.query.get_or_404(lab_id)
     
     try:
+        user_ids = [user_id for (user_id,) in
+                    db.session.query(LabSession.user_id).filter(LabSession.lab_id == lab_id).distinct()]
+        for user_id in user_ids:
+            remove_gradebook_lab(lab.course_id, user_id, lab_id)
         db.session.delete(lab)
         db.session.commit()
+        bump_data_version('labs')
+        invalidate_dashboard()
         return jsonify({'message': 'Lab deleted successfully'})
     except Exception as e:
         db.session.rollback()
@@ -1265,6 +2477,7 @@ def create_lab_parameter(lab_id):
     try:
         db.session.add(param)
         db.session.commit()
+        bump_data_version('labs')
         return jsonify({'message': 'Parameter created successfully', 'id': param.id})
     except Exception as e:
         db.session.rollback()
@@ -1288,6 +2501,7 @@ def update_lab_parameter(param_id):
     
     try:
         db.session.commit()
+        bump_data_version('labs')
         return jsonify({'message': 'Parameter updated successfully'})
     except Exception as e:
         db.session.rollback()
@@ -1302,6 +2516,7 @@ def delete_lab_parameter(param_id):
     try:
         db.session.delete(param)
         db.session.commit()
+        bump_data_version('labs')
         return jsonify({'message': 'Parameter deleted successfully'})
     except Exception as e:
         db.session.rollback()
@@ -1310,13 +2525,36 @@ def delete_lab_parameter(param_id):
 # Enrollment Management
 @app.route('/admin/enrollments')
 @admin_required
+@read_replica
 def admin_enrollments():
-    """Get all enrollments"""
-    enrollments = db.session.query(Enrollment, User, Course)\
-        .join(User, Enrollment.user_id == User.id)\
-        .join(Course, Enrollment.course_id == Course.id)\
-        .order_by(Enrollment.enrolled_at.desc()).all()
-    return jsonify([{
+    """
+    Get a page of enrollments
+    
+    Query args: course_id, user_id, status, search, sort (enrolled_at, status), cursor, limit
+    """
+    try:
+        sort, sort_columns, descending = get_list_sort({
+            'enrolled_at': [Enrollment.enrolled_at, Enrollment.id],
+            'status': [Enrollment.status, Enrollment.id]
+        }, '-enrolled_at')
+        
+        query = db.session.query(Enrollment, User, Course)\
+            .join(User, Enrollment.user_id == User.id)\
+            .join(Course, Enrollment.course_id == Course.id)
+        if request.args.get('course_id'):
+            query = query.filter(Enrollment.course_id == request.args.get('course_id', type=int))
+        if request.args.get('user_id'):
+            query = query.filter(Enrollment.user_id == request.args.get('user_id', type=int))
+        if request.args.get('status'):
+            query = query.filter(Enrollment.status == request.args['status'])
+        if request.args.get('search'):
+            query = query.filter(search_filter(request.args['search'], User.email, User.full_name))
+        
+        enrollments, next_cursor = paginate_keyset(query, sort_columns, descending)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return list_response([{
         'id': e.id,
         'user_id': e.user_id,
         'user_name': u.full_name,
@@ -1326,7 +2564,7 @@ def admin_enrollments():
         'course_code': c.code,
         'status': e.status,
         'enrolled_at': e.enrolled_at.isoformat() if e.enrolled_at else None
-    } for e, u, c in enrollments])
+    } for e, u, c in enrollments], next_cursor, sort)
 
 @app.route('/admin/enrollment/<int:enrollment_id>', methods=['PUT'])
 @admin_required
@@ -1340,6 +2578,9 @@ def update_enrollment(enrollment_id):
     
     try:
         db.session.commit()
+        bump_data_version('enrollments')
+        invalidate_dashboard()
+        pin_reads_to_primary(enrollment.user_id)
         return jsonify({'message': 'Enrollment updated successfully'})
     except Exception as e:
         db.session.rollback()
@@ -1351,9 +2592,13 @@ def delete_enrollment(enrollment_id):
     """Delete enrollment"""
     enrollment = Enrollment.query.get_or_404(enrollment_id)
     
+    user_id = enrollment.user_id
     try:
         db.session.delete(enrollment)
         db.session.commit()
+        bump_data_version('enrollments')
+        invalidate_dashboard()
+        pin_reads_to_primary(user_id)
         return jsonify({'message': 'Enrollment deleted successfully'})
     except Exception as e:
         db.session.rollback()
@@ -1362,30 +2607,57 @@ def delete_enrollment(enrollment_id):
 # Lab Session Management
 @app.route('/admin/lab_sessions')
 @admin_required
+@read_replica
 def admin_lab_sessions():
-    """Get all lab sessions"""
-    sessions = db.session.query(LabSession, User, Lab, Course)\
-        .join(User, LabSession.user_id == User.id)\
-        .join(Lab, LabSession.lab_id == Lab.id)\
-        .join(Course, Lab.course_id == Course.id)\
-        .order_by(LabSession.created_at.desc()).all()
-    return jsonify([{
+    """
+    Get a page of lab sessions
+    
+    Query args: course_id, lab_id, user_id, status, search, sort (created_at, status), cursor, limit
+    """
+    try:
+        sort, sort_columns, descending = get_list_sort({
+            'created_at': [LabSession.created_at, LabSession.id],
+            'status': [LabSession.status, LabSession.id]
+        }, '-created_at')
+        
+        query = db.session.query(LabSession, User, Lab, Course)\
+            .join(User, LabSession.user_id == User.id)\
+            .join(Lab, LabSession.lab_id == Lab.id)\
+            .join(Course, Lab.course_id == Course.id)
+        if request.args.get('course_id'):
+            query = query.filter(Lab.course_id == request.args.get('course_id', type=int))
+        if request.args.get('lab_id'):
+            query = query.filter(LabSession.lab_id == request.args.get('lab_id', type=int))
+        if request.args.get('user_id'):
+            query = query.filter(LabSession.user_id == request.args.get('user_id', type=int))
+        if request.args.get('status'):
+            query = query.filter(LabSession.status == request.args['status'])
+        if request.args.get('search'):
+            query = query.filter(search_filter(request.args['search'], User.email, User.full_name))
+        
+        sessions, next_cursor = paginate_keyset(query, sort_columns, descending)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return list_response([{
         'id': ls.id,
         'user_id': ls.user_id,
         'user_name': u.full_name,
         'user_email': u.email,
         'lab_id': ls.lab_id,
         'lab_name': l.name,
+        'max_score': l.max_score,
         'course_name': c.name,
         'course_code': c.code,
         'status': ls.status,
         'student_folder': ls.student_folder,
+        'idle_stage': ls.idle_stage,
         'score': ls.score,
         'started_at': ls.started_at.isoformat() if ls.started_at else None,
         'completed_at': ls.completed_at.isoformat() if ls.completed_at else None,
         'last_accessed': ls.last_accessed.isoformat() if ls.last_accessed else None,
         'created_at': ls.created_at.isoformat() if ls.created_at else None
-    } for ls, u, l, c in sessions])
+    } for ls, u, l, c in sessions], next_cursor, sort)
 
 @app.route('/admin/lab_session', methods=['POST'])
 @admin_required
@@ -1407,6 +2679,8 @@ def create_lab_session():
     
     # Get the newly created session
     lab_session = LabSession.query.filter_by(user_id=user_id, lab_id=lab_id).first()
+    invalidate_dashboard(user_id)
+    pin_reads_to_primary(user_id)
     
     return jsonify({'message': 'Lab session created successfully', 'id': lab_session.id})
 
@@ -1425,48 +2699,123 @@ def update_lab_session(session_id):
         lab_session.submission_notes = data['submission_notes']
     
     try:
+        if 'status' in data or 'score' in data:
+            # Admin edits are corrections, so they replace the best score
+            record_gradebook_score(lab_session, lab_session.lab, keep_best=False)
         db.session.commit()
+        invalidate_dashboard(lab_session.user_id)
+        release_finished_lab_admission(lab_session)
+        pin_reads_to_primary(lab_session.user_id)
+        publish_lab_session_change(lab_session, 'graded')
         return jsonify({'message': 'Lab session updated successfully'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@compiles(sa.sql.functions.char_length, 'sqlite')
+def compile_char_length_sqlite(element, compiler, **kw):
+    """SQLite has no CHAR_LENGTH; its LENGTH already counts characters"""
+    return f'length({compiler.process(element.clause_expr, **kw)})'
+
 @app.route('/admin/lab_session/<int:session_id>/commands')
 @admin_required
+@read_replica
 def get_lab_session_commands(session_id):
-    """Get command logs for a lab session"""
-    lab_session = LabSession.query.get_or_404(session_id)
+    """
+    Get a page of command logs for a lab session, across all its terminal sessions
     
-    # Get all terminal sessions for this lab session
-    terminal_sessions = TerminalSession.query.filter_by(lab_session_id=session_id).all()
+    Query args:
+        order: asc (default) or desc by execution time
+        output: preview (default, first COMMAND_OUTPUT_PREVIEW_CHARS chars), none or full
+        cursor, limit: keyset pagination as in the admin lists
+    """
+    LabSession.query.get_or_404(session_id)
+    output_mode = request.args.get('output', 'preview')
+    if output_mode not in ('preview', 'none', 'full'):
+        return jsonify({'error': f'Unsupported output mode: {output_mode}'}), 400
+    
+    if output_mode == 'full':
+        output_column = CommandLog.output
+    elif output_mode == 'preview':
+        output_column = db.func.substr(CommandLog.output, 1, COMMAND_OUTPUT_PREVIEW_CHARS)
+    else:
+        output_column = db.literal(None)
     
-    # Get all commands from all terminal sessions
-    commands = []
-    for ts in terminal_sessions:
-        session_commands = CommandLog.query.filter_by(
-            terminal_session_id=ts.id
-        ).order_by(CommandLog.executed_at.asc()).all()
-        commands.extend(session_commands)
+    query = db.session.query(
+        CommandLog.id, CommandLog.command, output_column, db.func.char_length(CommandLog.output),
+        CommandLog.exit_code, CommandLog.is_allowed, CommandLog.blocked_reason, CommandLog.executed_at
+    ).join(TerminalSession, CommandLog.terminal_session_id == TerminalSession.id)\
+        .filter(TerminalSession.lab_session_id == session_id)
     
-    # Sort all commands by execution time
-    commands.sort(key=lambda x: x.executed_at)
+    try:
+        commands, next_cursor = paginate_keyset(
+            query, [CommandLog.executed_at, CommandLog.id], request.args.get('order') == 'desc'
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     # Count statistics
-    total_commands = len(commands)
-    blocked_commands = sum(1 for cmd in commands if not cmd.is_allowed)
+    total_commands, blocked_commands = db.session.query(
+        db.func.count(CommandLog.id),
+        db.func.sum(db.case((CommandLog.is_allowed == False, 1), else_=0))
+    ).join(TerminalSession, CommandLog.terminal_session_id == TerminalSession.id)\
+        .filter(TerminalSession.lab_session_id == session_id).one()
     
     return jsonify({
         'commands': [{
-            'id': cmd.id,
-            'command': cmd.command,
-            'output': cmd.output,
-            'exit_code': cmd.exit_code,
-            'is_allowed': cmd.is_allowed,
-            'blocked_reason': cmd.blocked_reason,
-            'executed_at': cmd.executed_at.isoformat() if cmd.executed_at else None
-        } for cmd in commands],
+            'id': id,
+            'command': command,
+            'output': output,
+            'output_length': output_length or 0,
+            'output_truncated': output_mode != 'full' and (output_length or 0) > len(output or ''),
+            'exit_code': exit_code,
+            'is_allowed': is_allowed,
+            'blocked_reason': blocked_reason,
+            'executed_at': executed_at.isoformat() if executed_at else None
+        } for id, command, output, output_length, exit_code, is_allowed, blocked_reason, executed_at in commands],
+        'next_cursor': next_cursor,
         'total_commands': total_commands,
-        'blocked_commands': blocked_commands
+        'blocked_commands': int(blocked_commands or 0)
+    })
+
+@app.route('/admin/command_log/<int:command_id>/output')
+@admin_required
+def get_command_output(command_id):
+    """Get the full output of one logged command"""
+    command_log = CommandLog.query.get_or_404(command_id)
+    return jsonify({'id': command_log.id, 'output': command_log.output})
+
+@app.route('/admin/lab_session/<int:session_id>/commands/export')
+@admin_required
+@read_replica
+def export_lab_session_commands(session_id):
+    """Stream all command logs of a lab session as NDJSON, one command per line"""
+    LabSession.query.get_or_404(session_id)
+    query = db.session.query(
+        CommandLog.id, TerminalSession.session_id, CommandLog.command, CommandLog.output,
+        CommandLog.exit_code, CommandLog.is_allowed, CommandLog.blocked_reason, CommandLog.executed_at
+    ).join(TerminalSession, CommandLog.terminal_session_id == TerminalSession.id)\
+        .filter(TerminalSession.lab_session_id == session_id)\
+        .order_by(CommandLog.executed_at, CommandLog.id)\
+        .yield_per(500)
+    
+    def generate():
+        # Runs after the view returned, so re-enter replica routing
+        with replica_reads():
+            for id, terminal_id, command, output, exit_code, is_allowed, blocked_reason, executed_at in query:
+                yield json.dumps({
+                    'id': id,
+                    'terminal_session': terminal_id,
+                    'command': command,
+                    'output': output,
+                    'exit_code': exit_code,
+                    'is_allowed': is_allowed,
+                    'blocked_reason': blocked_reason,
+                    'executed_at': executed_at.isoformat() if executed_at else None
+                }) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': f'attachment; filename=lab_session_{session_id}_commands.ndjson'
     })
 
 @app.route('/admin/lab_session/<int:session_id>', methods=['DELETE'])
@@ -1474,6 +2823,7 @@ def get_lab_session_commands(session_id):
 def delete_lab_session(session_id):
     """Delete lab session"""
     lab_session = LabSession.query.get_or_404(session_id)
+    release_lab_admission(lab_session.id)
     
     # Delete student folder if exists
     if lab_session.student_folder and os.path.exists(lab_session.student_folder):
@@ -1482,14 +2832,371 @@ def delete_lab_session(session_id):
         except Exception as e:
             print(f"Warning: Could not delete folder {lab_session.student_folder}: {e}")
     
+    # Delete snapshot and idle archive so a new session starts from the template
+    if lab_session.student_folder:
+        for path in (get_snapshot_path(lab_session.student_folder), get_archive_path(lab_session.student_folder)):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    user_id = lab_session.user_id
     try:
+        remove_gradebook_lab(lab_session.lab.course_id, user_id, lab_session.lab_id)
         db.session.delete(lab_session)
         db.session.commit()
+        invalidate_dashboard()
+        pin_reads_to_primary(user_id)
         return jsonify({'message': 'Lab session deleted successfully'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# Course Gradebook
+def merge_gradebook_score(previous, score, status):
+    """
+    Combine a stored gradebook score with a new one, keeping the best
+    
+    Used by record_gradebook_score(keep_best=True): the best score and a
+    'completed' status stick across later, worse submissions.
+    """
+    if previous and previous['best_score'] is not None:
+        if score is None or previous['best_score'] > score:
+            score = previous['best_score']
+        if previous['status'] == 'completed':
+            status = 'completed'
+    return {'best_score': score, 'status': status}
+
+def get_gradebook_entry_for_update(course_id, user_id):
+    """
+    Get the locked gradebook row of a student in a course, creating it if needed
+    
+    Two submissions of the same student can race to create the row; the loser
+    hits the unique constraint in its savepoint and locks the winner's row.
+    """
+    for attempt in range(3):
+        entry = CourseGradebook.query.filter_by(course_id=course_id, user_id=user_id).with_for_update().first()
+        if entry:
+            return entry
+        try:
+            with db.session.begin_nested():
+                entry = CourseGradebook(course_id=course_id, user_id=user_id)
+                db.session.add(entry)
+            return entry
+        except sa.exc.IntegrityError:
+            continue
+    raise RuntimeError(f'Could not lock gradebook row for course {course_id}, user {user_id}')
+
+def record_gradebook_score(lab_session, lab, keep_best=True):
+    """
+    Update the (course, user) gradebook row for a scored lab session
+    
+    Runs inside the caller's transaction; the caller commits. The row stays
+    locked until then so concurrent submissions don't overwrite each other.
+    
+    Args:
+        lab_session: LabSession with the new score and status
+        lab: The session's Lab
+        keep_best: Keep the higher of the stored and new score (student submissions
+            and their verification); False replaces it (admin corrections)
+    """
+    entry = get_gradebook_entry_for_update(lab.course_id, lab_session.user_id)
+    
+    scores = entry.lab_scores_dict
+    key = str(lab.id)
+    if keep_best:
+        scores[key] = merge_gradebook_score(scores.get(key), lab_session.score, lab_session.status)
+    else:
+        scores[key] = {'best_score': lab_session.score, 'status': lab_session.status}
+    entry.set_lab_scores(scores)
+
+def replace_gradebook_lab_scores(lab, scores):
+    """
+    Overwrite one lab's scores in the gradebook rows of its course, e.g. after a regrade
+    
+    Runs inside the caller's transaction; the caller commits.
+    
+    Args:
+        lab: The regraded Lab
+        scores: dict of user_id -> (score, status)
+    """
+    key = str(lab.id)
+    entries = {
+        entry.user_id: entry
+        for entry in CourseGradebook.query.filter(
+            CourseGradebook.course_id == lab.course_id,
+            CourseGradebook.user_id.in_(list(scores))
+        ).with_for_update()
+    }
+    for user_id, (score, status) in scores.items():
+        entry = entries.get(user_id) or get_gradebook_entry_for_update(lab.course_id, user_id)
+        lab_scores = entry.lab_scores_dict
+        lab_scores[key] = {'best_score': score, 'status': status}
+        entry.set_lab_scores(lab_scores)
+
+def remove_gradebook_lab(course_id, user_id, lab_id):
+    """Drop one lab from a gradebook row, e.g. when its lab session is deleted"""
+    entry = CourseGradebook.query.filter_by(course_id=course_id, user_id=user_id).first()
+    if entry:
+        scores = entry.lab_scores_dict
+        scores.pop(str(lab_id), None)
+        entry.set_lab_scores(scores)
+
+def rebuild_gradebook(course_id=None):
+    """
+    Rebuild gradebook rows from scratch out of the lab session scores
+    
+    Each lab gets the score and status of its lab session (one per student
+    and lab). The stored rows are not read: best scores of earlier
+    submissions that no lab session holds any more are gone after a rebuild.
+    
+    Runs inside the caller's transaction; the caller commits.
+    
+    Returns:
+        Number of gradebook rows written
+    """
+    query = db.session.query(Lab.course_id, LabSession.user_id, LabSession.lab_id, LabSession.score, LabSession.status)\
+        .join(Lab, LabSession.lab_id == Lab.id)\
+        .filter(db.or_(LabSession.score.isnot(None), LabSession.status == 'completed'))
+    delete_query = CourseGradebook.query
+    if course_id:
+        query = query.filter(Lab.course_id == course_id)
+        delete_query = delete_query.filter(CourseGradebook.course_id == course_id)
+    
+    rows = {}
+    for row_course_id, user_id, lab_id, score, status in query.yield_per(1000):
+        rows.setdefault((row_course_id, user_id), {})[str(lab_id)] = {'best_score': score, 'status': status}
+    
+    delete_query.delete(synchronize_session=False)
+    for (row_course_id, user_id), scores in rows.items():
+        entry = CourseGradebook(course_id=row_course_id, user_id=user_id)
+        entry.set_lab_scores(scores)
+        db.session.add(entry)
+    return len(rows)
+
+@app.route('/admin/course/<int:course_id>/gradebook')
+@admin_required
+@read_replica
+def course_gradebook(course_id):
+    """Get the gradebook of a course, one row per student"""
+    course = Course.query.get_or_404(course_id)
+    entries = db.session.query(CourseGradebook, User)\
+        .join(User, CourseGradebook.user_id == User.id)\
+        .filter(CourseGradebook.course_id == course_id)\
+        .order_by(User.email).all()
+    
+    return jsonify({
+        'course_id': course.id,
+        'course_code': course.code,
+        'students': [{
+            'user_id': u.id,
+            'user_name': u.full_name,
+            'user_email': u.email,
+            'lab_scores': g.lab_scores_dict,
+            'graded_labs': g.graded_labs,
+            'completed_labs': g.completed_labs,
+            'average_score': g.average_score,
+            'updated_at': g.updated_at.isoformat() if g.updated_at else None
+        } for g, u in entries]
+    })
+
+@app.route('/admin/gradebook/rebuild', methods=['POST'])
+@admin_required
+def admin_rebuild_gradebook():
+    """Rebuild the gradebook from scratch (optionally for one course)"""
+    data = request.get_json(silent=True) or {}
+    try:
+        count = rebuild_gradebook(data.get('course_id'))
+        db.session.commit()
+        return jsonify({'message': 'Gradebook rebuilt successfully', 'rows': count})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+# Course Exports
+EXPORT_MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+COURSE_EXPORT_DATASETS = {
+    'gradebook': {
+        'columns': {
+            'user_id': User.id,
+            'user_name': User.full_name,
+            'user_email': User.email,
+            'graded_labs': CourseGradebook.graded_labs,
+            'completed_labs': CourseGradebook.completed_labs,
+            'average_score': CourseGradebook.average_score,
+            'lab_scores': CourseGradebook.lab_scores,
+            'updated_at': CourseGradebook.updated_at
+        },
+        'date_column': CourseGradebook.updated_at
+    },
+    'lab_sessions': {
+        'columns': {
+            'id': LabSession.id,
+            'user_id': User.id,
+            'user_name': User.full_name,
+            'user_email': User.email,
+            'lab_id': Lab.id,
+            'lab_name': Lab.name,
+            'status': LabSession.status,
+            'score': LabSession.score,
+            'max_score': Lab.max_score,
+            'idle_stage': LabSession.idle_stage,
+            'started_at': LabSession.started_at,
+            'completed_at': LabSession.completed_at,
+            'last_accessed': LabSession.last_accessed,
+            'created_at': LabSession.created_at
+        },
+        'date_column': LabSession.created_at
+    },
+    'command_logs': {
+        'columns': {
+            'id': CommandLog.id,
+            'lab_session_id': LabSession.id,
+            'user_email': User.email,
+            'lab_name': Lab.name,
+            'terminal_session': TerminalSession.session_id,
+            'command': CommandLog.command,
+            'output': CommandLog.output,
+            'exit_code': CommandLog.exit_code,
+            'is_allowed': CommandLog.is_allowed,
+            'blocked_reason': CommandLog.blocked_reason,
+            'executed_at': CommandLog.executed_at
+        },
+        'date_column': CommandLog.executed_at
+    }
+}
+
+def build_course_export_query(dataset, columns, course_id):
+    """Select the given columns of an export dataset for one course, in a stable order"""
+    query = db.session.query(*columns)
+    if dataset == 'gradebook':
+        return query.select_from(CourseGradebook)\
+            .join(User, CourseGradebook.user_id == User.id)\
+            .filter(CourseGradebook.course_id == course_id)\
+            .order_by(User.email)
+    if dataset == 'lab_sessions':
+        return query.select_from(LabSession)\
+            .join(Lab, LabSession.lab_id == Lab.id)\
+            .join(User, LabSession.user_id == User.id)\
+            .filter(Lab.course_id == course_id)\
+            .order_by(LabSession.id)
+    return query.select_from(CommandLog)\
+        .join(TerminalSession, CommandLog.terminal_session_id == TerminalSession.id)\
+        .join(LabSession, TerminalSession.lab_session_id == LabSession.id)\
+        .join(Lab, LabSession.lab_id == Lab.id)\
+        .join(User, LabSession.user_id == User.id)\
+        .filter(Lab.course_id == course_id)\
+        .order_by(CommandLog.executed_at, CommandLog.id)
+
+def format_export_value(value):
+    """Convert a database value to something JSON and CSV can hold"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def escape_csv_cell(value):
+    """
+    Keep spreadsheets from running a cell as a formula
+    
+    Student commands, output and names are untrusted; text starting with a
+    formula character gets a leading apostrophe, which spreadsheets show as text.
+    """
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+@app.route('/admin/course/<int:course_id>/export/<dataset>')
+@admin_required
+@read_replica
+def export_course_data(course_id, dataset):
+    """
+    Stream a course dataset (gradebook, lab_sessions or command_logs) as CSV or NDJSON
+    
+    Rows are read with a server-side cursor and written as they arrive.
+    
+    Query args:
+        format: csv (default) or ndjson
+        columns: Comma separated column names (default: all)
+        since, until: ISO datetimes bounding the dataset's date column
+    """
+    course = Course.query.get_or_404(course_id)
+    spec = COURSE_EXPORT_DATASETS.get(dataset)
+    if not spec:
+        return jsonify({'error': f'Unknown dataset: {dataset}'}), 400
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_MIMETYPES:
+        return jsonify({'error': f'Unsupported format: {export_format}'}), 400
+    
+    names = [name.strip() for name in request.args.get('columns', '').split(',') if name.strip()]
+    names = names or list(spec['columns'])
+    unknown = [name for name in names if name not in spec['columns']]
+    if unknown:
+        return jsonify({'error': f'Unknown columns: {", ".join(unknown)}'}), 400
+    
+    query = build_course_export_query(
+        dataset, [spec['columns'][name].label(name) for name in names], course_id
+    )
+    try:
+        if request.args.get('since'):
+            query = query.filter(spec['date_column'] >= datetime.fromisoformat(request.args['since']))
+        if request.args.get('until'):
+            query = query.filter(spec['date_column'] < datetime.fromisoformat(request.args['until']))
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO datetimes'}), 400
+    query = query.yield_per(1000)
+    
+    # Gradebook lab scores get one CSV column per lab
+    labs = []
+    if 'lab_scores' in names and export_format == 'csv':
+        labs = db.session.query(Lab.id, Lab.name).filter(Lab.course_id == course_id)\
+            .order_by(Lab.order_index, Lab.id).all()
+    
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        header = []
+        for name in names:
+            header.extend([f'lab_{lab_id}_{lab_name}' for lab_id, lab_name in labs] if name == 'lab_scores' else [name])
+        writer.writerow([escape_csv_cell(cell) for cell in header])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        
+        for row in query:
+            values = []
+            for name, value in zip(names, row):
+                if name == 'lab_scores':
+                    scores = json.loads(value) if value else {}
+                    values.extend([(scores.get(str(lab_id)) or {}).get('best_score') for lab_id, _ in labs])
+                else:
+                    values.append(escape_csv_cell(format_export_value(value)))
+            writer.writerow(values)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    def generate_ndjson():
+        for row in query:
+            record = {name: format_export_value(value) for name, value in zip(names, row)}
+            if 'lab_scores' in record:
+                record['lab_scores'] = json.loads(record['lab_scores']) if record['lab_scores'] else {}
+            yield json.dumps(record) + '\n'
+    
+    def generate():
+        # Runs after the view returned, so re-enter replica routing
+        with replica_reads():
+            yield from (generate_csv() if export_format == 'csv' else generate_ndjson())
+    
+    # Course codes are free text: keep the header to a plain ASCII token
+    filename = secure_filename_custom(f'{course.code}_{dataset}.{export_format}').encode('ascii', 'ignore').decode()
+    if not filename or filename.startswith('.') or filename.startswith('_'):
+        filename = f'course_{course.id}_{dataset}.{export_format}'
+    return Response(stream_with_context(generate()), mimetype=EXPORT_MIMETYPES[export_format], headers={
+        'Content-Disposition': f'attachment; filename="{filename}"'
+    })
+
 # Linux User Management Functions
 def create_linux_user(username, home_dir=None):
     """
@@ -1738,6 +3445,26 @@ def start_lab(lab_id):
             print(f"Lab session not found after cloning for user {user_id}, lab {lab_id}")
             return jsonify({'error': 'Failed to create lab session'}), 500
     
+    # Bring back an environment the idle reaper has reclaimed
+    if lab_session.idle_stage:
+        publish_provisioning(lab_session, 'restoring', f'Resuming from {lab_session.idle_stage}')
+        if not resume_idle_lab_session(lab_session, user_linux_name):
+            publish_provisioning(lab_session, 'failed', 'Failed to restore lab environment')
+            return jsonify({'error': 'Failed to restore lab environment'}), 500
+    
+    # Queue the start when the host has no room for this lab
+    admitted, queue_position, reason = request_lab_admission(lab, lab_session)
+    if not admitted:
+        # Students poll start_lab while queued; only a move in the queue is news
+        if queue_position_changed(lab_session.id, queue_position):
+            publish_provisioning(lab_session, 'queued', f'Queue position {queue_position}: {reason}')
+        return jsonify({
+            'queued': True,
+            'queue_position': queue_position,
+            'reason': reason,
+            'message': f'Lab servers are busy. You are number {queue_position} in the queue.'
+        }), 202
+    
     # Update session status
     if lab_session.status == 'not_started':
         lab_session.status = 'in_progress'
@@ -1746,28 +3473,30 @@ def start_lab(lab_id):
     lab_session.last_accessed = datetime.utcnow()
     
     try:
+        parameter_values = get_lab_session_parameters(lab_session, lab, user)
         db.session.commit()
+        invalidate_dashboard(user_id)
+        publish_lab_session_change(lab_session, 'started')
         print("PREPARE FOR LABS ", lab.name)
         # Apply parameter file modifications if specified
         if lab.lab_parameters and lab_session.student_folder:
-            apply_parameter_file_modifications(lab, lab_session.student_folder, user_linux_name)
+            publish_provisioning(lab_session, 'applying_parameters')
+            apply_parameter_file_modifications(lab, lab_session.student_folder, parameter_values)
         
         # # Execute build command if specified
         # if lab.build_command and lab_session.student_folder:
         #     execute_build_command(user_linux_name, lab.build_command, lab_session.student_folder)
         
         # Execute run commands if specified
-        print(f"Student folder: {lab_session.student_folder}")
-        print(f"Raw command list: {lab.run_commands_list}")
-        if lab.run_commands_list and lab_session.student_folder:
-            # For qua từng command trong list
-            for command in lab.run_commands_list:
-                # Thay thế tất cả parameters với random values
-                print(f"Raw run command: {command}")
-                replaced_command = replace_lab_parameters(lab, command, user)
-                print(f"Executing run command: {replaced_command}")
-                execute_run_command(user_linux_name, replaced_command, lab_session.student_folder)
+        publish_provisioning(lab_session, 'running_commands')
+        run_lab_commands(lab, user, user_linux_name, lab_session.student_folder, parameter_values)
+        
+        # Keep a pristine copy of the provisioned environment for fast resets
+        if lab_session.student_folder:
+            publish_provisioning(lab_session, 'snapshotting')
+            snapshot_lab_folder(lab_session.student_folder, user_linux_name)
         
+        publish_provisioning(lab_session, 'ready')
         return jsonify({
             'message': 'Lab started successfully',
             'lab_session_id': lab_session.id,
@@ -1775,104 +3504,181 @@ def start_lab(lab_id):
         })
     except Exception as e:
         db.session.rollback()
+        release_lab_admission(lab_session.id)
+        publish_provisioning(lab_session, 'failed', str(e))
         print(f"Error starting lab: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': 'Failed to start lab'}), 500
 
-def apply_parameter_file_modifications(lab, student_folder, user_linux_name):
+def build_parameter_pattern(parameter_replacements):
     """
-    Modify files with parameter values when file_path is specified
+    Compile a single regex that matches every parameter placeholder
+
+    Longer names are tried first so that e.g. ${fieldNameX} wins over ${fieldName}.
+
+    Args:
+        parameter_replacements: dict of placeholder -> value
+
+    Returns:
+        Compiled pattern, or None if there is nothing to replace
+    """
+    if not parameter_replacements:
+        return None
+    names = sorted(parameter_replacements, key=len, reverse=True)
+    return re.compile('|'.join(re.escape(name) for name in names))
+
+def render_parameter_file(file_full_path, pattern, parameter_replacements):
+    """
+    Substitute all placeholders in a file in one streaming pass
+
+    The file is read line by line into a temp file next to it, and the temp
+    file only replaces the original when at least one placeholder matched.
+
+    Args:
+        file_full_path: Absolute path of the file to render
+        pattern: Pattern from build_parameter_pattern()
+        parameter_replacements: dict of placeholder -> value
+
+    Returns:
+        Number of replacements made (0 means the file was left untouched)
+    """
+    def substitute(match):
+        return str(parameter_replacements[match.group(0)])
+
+    total = 0
+    fd, tmp_path = tempfile.mkstemp(
+        prefix='.render-', dir=os.path.dirname(file_full_path)
+    )
+    try:
+        with open(file_full_path, 'r', encoding='utf-8', newline='') as src, \
+                os.fdopen(fd, 'w', encoding='utf-8', newline='') as dst:
+            for line in src:
+                rendered, count = pattern.subn(substitute, line)
+                total += count
+                dst.write(rendered)
+
+        if total:
+            shutil.copymode(file_full_path, tmp_path)
+            os.replace(tmp_path, file_full_path)
+        else:
+            os.remove(tmp_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return total
+
+def choose_lab_parameter_values(lab, user):
+    """
+    Pick a random value for each lab parameter
     
     Args:
         lab: Lab object with parameters
-        student_folder: Path to student's lab folder
+        user: Student the values are chosen for
+    
+    Returns:
+        dict of parameter_name -> value
     """
     import random
     
-    # Store parameter replacements to use consistently
-    parameter_replacements = {}
-    
-    # First pass: determine random values for all parameters
+    parameter_values = {}
     for param in lab.lab_parameters:
         if param.values_list:
             value = random.choice(param.values_list)
-            value = value.replace(STUDENT_NAME_LAB_PARAMETER, user_linux_name)
+            value = value.replace(STUDENT_NAME_LAB_PARAMETER, get_student_username(user.email))
             if LAB_NETWORK_MASK_PARAMETER in value:
                 network = LabsNetwork.query.filter_by(used=False).first()
                 if not network:
                     raise ValueError("No available network for lab!")
                 value = value.replace(LAB_NETWORK_MASK_PARAMETER, network.mask)
-            parameter_replacements[param.parameter_name] = value
+            parameter_values[param.parameter_name] = value
+    return parameter_values
+
+def get_lab_session_parameters(lab_session, lab, user):
+    """
+    Parameter values of a lab session, chosen on first provisioning and stored
+    
+    Files, run commands, resets and verification all use these values, so the
+    verify command checks the same values the containers were started with.
+    The caller commits.
+    """
+    if lab_session.chosen_parameters is None:
+        lab_session.chosen_parameters = json.dumps(choose_lab_parameter_values(lab, user))
+    return lab_session.chosen_parameters_dict
+
+def apply_parameter_file_modifications(lab, student_folder, parameter_values):
+    """
+    Modify files with parameter values when file_path is specified
+
+    Parameters are grouped by target file so each file is rendered once,
+    with all placeholders substituted in a single pass.
+
+    Args:
+        lab: Lab object with parameters
+        student_folder: Path to student's lab folder
+        parameter_values: dict of parameter_name -> value (see get_lab_session_parameters)
+    """
+    pattern = build_parameter_pattern(parameter_values)
+    if pattern is None:
+        return
     
-    # Second pass: modify files if file_path is specified
+    # Group target files so shared files are rendered once
+    target_files = {}
     for param in lab.lab_parameters:
         if not param.file_path:
             continue
-        
-        # Construct full file path
-        file_full_path = os.path.join(student_folder, param.file_path)
-        print 
+        file_full_path = os.path.normpath(os.path.join(student_folder, param.file_path))
+        target_files.setdefault(file_full_path, param.file_path)
+    
+    for file_full_path, relative_path in target_files.items():
         if not os.path.exists(file_full_path):
             print(f"⚠️ File not found for parameter modification: {file_full_path}")
             continue
         
         try:
-            # Read file content
-            with open(file_full_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Replace all parameters in the file
-            modified_content = content
-            for param_name, param_value in parameter_replacements.items():
-                modified_content = modified_content.replace(param_name, str(param_value))
-            
-            # Write back modified content
-            with open(file_full_path, 'w', encoding='utf-8') as f:
-                f.write(modified_content)
-            
-            print(f"✅ Modified file: {param.file_path}")
-            print(f"   Replacements: {parameter_replacements}")
+            count = render_parameter_file(file_full_path, pattern, parameter_values)
+            if count:
+                print(f"✅ Modified file: {relative_path} ({count} replacements)")
+                print(f"   Replacements: {parameter_values}")
+            else:
+                print(f"File unchanged (no placeholders): {relative_path}")
             
         except Exception as e:
             print(f"❌ Error modifying file {file_full_path}: {e}")
 
-def replace_lab_parameters(lab, command, user):
+def run_lab_commands(lab, user, user_linux_name, student_folder, parameter_values):
+    """Execute the lab's run commands in the student folder with parameters replaced"""
+    print(f"Student folder: {student_folder}")
+    print(f"Raw command list: {lab.run_commands_list}")
+    if lab.run_commands_list and student_folder:
+        # For qua từng command trong list
+        for command in lab.run_commands_list:
+            # Thay thế tất cả parameters với giá trị đã chọn cho lab session
+            print(f"Raw run command: {command}")
+            replaced_command = replace_lab_parameters(command, user, parameter_values)
+            print(f"Executing run command: {replaced_command}")
+            execute_run_command(user_linux_name, replaced_command, student_folder)
+
+def replace_lab_parameters(command, user, parameter_values):
     """
-    Replace lab parameters in command with random values from their ranges
-    For qua tất cả parameters của lab, chọn random value và replace vào command
+    Replace lab parameters in command with the lab session's chosen values
     
     Args:
-        lab: Lab object with parameters
         command: Command string with parameters like ${fieldName}
+        user: Student, for ${email}
+        parameter_values: dict of parameter_name -> value (see get_lab_session_parameters)
     
     Returns:
         Command with parameters replaced
     """
-    import random
-    
     replaced_command = command.replace("${email}", user.email)
     
-    # For qua tất cả parameters của bài lab
-    for param in lab.lab_parameters:
-        parameter_name = param.parameter_name  # e.g., ${fieldName}
-        values_list = param.values_list  # List các giá trị có thể
-        
-        if not values_list:
-            continue
-        
-        # Chọn random 1 giá trị từ list
-        random_value = random.choice(values_list)
-        random_value = random_value.replace(STUDENT_NAME_LAB_PARAMETER, get_student_username(user.email))
-        if LAB_NETWORK_MASK_PARAMETER in random_value:
-            network = LabsNetwork.query.filter_by(used=False).first()
-            if not network:
-                raise ValueError("No available network for lab!")
-            random_value = random_value.replace(LAB_NETWORK_MASK_PARAMETER, network.mask)
-        # Replace tất cả occurrences của parameter name = parameter value
-        replaced_command = replaced_command.replace(parameter_name, str(random_value))
-        
-        print(f"Replaced {parameter_name} with {random_value}")
+    # Replace tất cả occurrences của parameter name = parameter value
+    for parameter_name, value in parameter_values.items():
+        replaced_command = replaced_command.replace(parameter_name, str(value))
+        print(f"Replaced {parameter_name} with {value}")
     
     return replaced_command
 
@@ -1927,34 +3733,654 @@ def execute_build_command(user_linux_name, build_command, working_directory):
         print(f"Error executing build command: {e}")
         return False
 
-@app.route('/lab/<int:lab_id>/terminal')
-@login_required
-def lab_terminal(lab_id):
-    """Display lab terminal interface"""
-    user_id = session['user']['id']
-    
-    # Get lab session for current user and lab
-    lab_session = LabSession.query.filter_by(lab_id=lab_id, user_id=user_id).first()
-    if not lab_session:
-        flash('Lab session not found. Please start the lab first.', 'error')
-        return redirect(url_for('dashboard'))
-    
-    # Update last accessed
-    lab_session.last_accessed = datetime.utcnow()
-    db.session.commit()
-    
-    return render_template('lab_terminal.html', lab_session=lab_session)
+# Idle Lab Session Reaper
+IDLE_STAGES = ['stopped', 'network_released', 'archived']
+COMPOSE_FILE_NAMES = ['docker-compose.yml', 'docker-compose.yaml', 'compose.yml', 'compose.yaml']
+lab_lifecycle_lock = threading.Lock()
 
-@app.route('/api/lab/<int:lab_session_id>/submit', methods=['POST'])
-@login_required
-def submit_lab(lab_session_id):
-    """Submit lab with checkpoint answers"""
-    user_id = session['user']['id']
+def has_compose_file(student_folder):
+    """Check if the student folder runs its services with docker compose"""
+    return any(os.path.exists(os.path.join(student_folder, name)) for name in COMPOSE_FILE_NAMES)
+
+def get_archive_path(student_folder):
+    """Archive file used for a reclaimed student folder"""
+    return os.path.join(LAB_ARCHIVE_PATH, f"{os.path.basename(student_folder)}.tar.gz")
+
+def as_root(args):
+    """Prefix a command with sudo unless the app already runs as root"""
+    return args if os.geteuid() == 0 else ['sudo'] + args
+
+def pack_folder(folder, archive_path):
+    """
+    Write folder into a .tar.gz archive (atomically) and return the archive path
+    
+    On Linux tar runs as root, so files owned by container users (database
+    data directories) are readable and keep their owners.
+    """
+    archive_base = archive_path[:-len('.tar.gz')]
+    tmp_base = f"{archive_base}.partial"
+    if platform.system() == 'Windows':
+        tmp_path = shutil.make_archive(
+            tmp_base, 'gztar',
+            root_dir=os.path.dirname(folder),
+            base_dir=os.path.basename(folder)
+        )
+    else:
+        tmp_path = f"{tmp_base}.tar.gz"
+        subprocess.run(as_root([
+            'tar', '-czf', tmp_path, '-C', os.path.dirname(folder), os.path.basename(folder)
+        ]), check=True, capture_output=True)
+    os.replace(tmp_path, archive_path)
+    return archive_path
+
+def remove_folder(folder):
+    """Delete a student folder, including files owned by container users"""
+    if platform.system() == 'Windows':
+        shutil.rmtree(folder)
+    else:
+        subprocess.run(as_root(['rm', '-rf', folder]), check=True, capture_output=True)
+
+def unpack_folder(archive_path, folder):
+    """Replace folder with the contents of an archive made by pack_folder()"""
+    if os.path.exists(folder):
+        remove_folder(folder)
+    if platform.system() == 'Windows':
+        shutil.unpack_archive(archive_path, os.path.dirname(folder))
+    else:
+        subprocess.run(as_root([
+            'tar', '-xzf', archive_path, '-C', os.path.dirname(folder)
+        ]), check=True, capture_output=True)
+
+def set_lab_folder_owner(student_folder, linux_username):
+    """Give the student's Linux user ownership of a restored folder"""
+    if platform.system() == 'Windows':
+        return
+    try:
+        subprocess.run([
+            'sudo', 'chown', '-R',
+            f'{linux_username}:{linux_username}',
+            student_folder
+        ], check=True, capture_output=True)
+    except Exception as e:
+        print(f"Warning: Could not set ownership: {e}")
+
+def archive_lab_folder(student_folder):
+    """
+    Compress a student folder into LAB_ARCHIVE_PATH and remove the original
+    
+    Returns:
+        Path to the archive, or None if there was nothing to archive
+    """
+    if not os.path.exists(student_folder):
+        return None
+    
+    archive_path = pack_folder(student_folder, get_archive_path(student_folder))
+    remove_folder(student_folder)
+    return archive_path
+
+def restore_lab_folder(student_folder, linux_username):
+    """
+    Unpack an archived student folder back into place
+    
+    Returns:
+        True if the folder exists after the call
+    """
+    archive_path = get_archive_path(student_folder)
+    if not os.path.exists(student_folder) and os.path.exists(archive_path):
+        unpack_folder(archive_path, student_folder)
+        os.remove(archive_path)
+        print(f"✅ Restored archived lab folder: {student_folder}")
+        set_lab_folder_owner(student_folder, linux_username)
+    
+    return os.path.exists(student_folder)
+
+def reclaim_lab_session(lab_session, linux_username, target_stage):
+    """
+    Advance a lab session through the reclamation stages up to target_stage
+    
+    Stages always run in order: stop containers, release networks, archive folder.
+    """
+    current_index = IDLE_STAGES.index(lab_session.idle_stage) if lab_session.idle_stage else -1
+    target_index = IDLE_STAGES.index(target_stage)
+    folder = lab_session.student_folder
+    uses_compose = has_compose_file(folder)
+    
+    for stage in IDLE_STAGES[current_index + 1:target_index + 1]:
+        if stage == 'stopped':
+            if uses_compose:
+                execute_run_command(linux_username, 'docker compose stop', folder)
+            release_lab_admission(lab_session.id)
+        elif stage == 'network_released' and uses_compose:
+            execute_run_command(linux_username, 'docker compose down', folder)
+        elif stage == 'archived':
+            archive_lab_folder(folder)
+        
+        lab_session.idle_stage = stage
+        db.session.commit()
+        publish_lab_session_change(lab_session, 'idle_reclaimed')
+        print(f"♻️ Lab session {lab_session.id} reclaimed: {stage}")
+
+def reap_idle_lab_sessions(now=None):
+    """
+    Reclaim resources of lab sessions that have been idle past the thresholds
+    
+    Idle time is measured from the latest of LabSession.last_accessed,
+    LabSession.started_at and the last TerminalSession.last_activity.
+    Sessions with a live terminal are never reaped.
+    
+    Returns:
+        Number of lab sessions that advanced a stage
+    """
+    now = now or datetime.utcnow()
+    thresholds = [
+        ('archived', timedelta(minutes=LAB_IDLE_ARCHIVE_MINUTES)),
+        ('network_released', timedelta(minutes=LAB_IDLE_RELEASE_NETWORK_MINUTES)),
+        ('stopped', timedelta(minutes=LAB_IDLE_STOP_MINUTES)),
+    ]
+    
+    last_terminal = db.session.query(
+        TerminalSession.lab_session_id,
+        db.func.max(TerminalSession.last_activity).label('last_activity')
+    ).group_by(TerminalSession.lab_session_id).subquery()
+    
+    candidates = db.session.query(LabSession, User, last_terminal.c.last_activity)\
+        .join(User, LabSession.user_id == User.id)\
+        .outerjoin(last_terminal, last_terminal.c.lab_session_id == LabSession.id)\
+        .filter(
+            LabSession.started_at.isnot(None),
+            LabSession.student_folder.isnot(None),
+            db.or_(LabSession.idle_stage.is_(None), LabSession.idle_stage != 'archived')
+        ).all()
+    
+    live_sessions = {info['lab_session_id'] for info in list(active_terminals.values())}
+    reaped = 0
+    
+    for lab_session, user, terminal_activity in candidates:
+        if lab_session.id in live_sessions:
+            continue
+        
+        last_seen = max(t for t in (lab_session.last_accessed, lab_session.started_at, terminal_activity) if t)
+        idle_for = now - last_seen
+        target_stage = next((stage for stage, limit in thresholds if idle_for >= limit), None)
+        current_index = IDLE_STAGES.index(lab_session.idle_stage) if lab_session.idle_stage else -1
+        if not target_stage or IDLE_STAGES.index(target_stage) <= current_index:
+            continue
+        
+        try:
+            with lab_lifecycle_lock:
+                reclaim_lab_session(lab_session, get_student_username(user.email), target_stage)
+            reaped += 1
+        except Exception as e:
+            print(f"Error reclaiming lab session {lab_session.id}: {e}")
+            db.session.rollback()
+    
+    return reaped
+
+def resume_idle_lab_session(lab_session, linux_username):
+    """
+    Undo reclamation so start_lab can bring the environment back up
+    
+    Containers and networks are recreated by the lab's run commands, so only
+    an archived folder needs restoring here.
+    """
+    with lab_lifecycle_lock:
+        if lab_session.idle_stage == 'archived':
+            if not restore_lab_folder(lab_session.student_folder, linux_username):
+                # Archive is gone, fall back to a fresh copy of the template
+                if not clone_lab_folder(lab_session.user_id, lab_session.lab_id):
+                    return False
+        
+        print(f"▶️ Resuming lab session {lab_session.id} from stage {lab_session.idle_stage}")
+        lab_session.idle_stage = None
+        db.session.commit()
+        publish_lab_session_change(lab_session, 'resumed')
+        return True
+
+def acquire_worker_lease(name, seconds):
+    """
+    Take or renew a named lease so only one process runs a background job
+    
+    The lease row is claimed with a single conditional UPDATE, which the
+    database serializes across processes and hosts. A holder that dies
+    loses the lease once it expires.
+    
+    Returns:
+        True if this process holds the lease for the next `seconds`
+    """
+    now = datetime.utcnow()
+    owner = f"{platform.node()}:{os.getpid()}"
+    values = {'owner': owner, 'expires_at': now + timedelta(seconds=seconds)}
+    try:
+        claimed = WorkerLease.query.filter(
+            WorkerLease.name == name,
+            db.or_(WorkerLease.owner == owner, WorkerLease.expires_at < now)
+        ).update(values, synchronize_session=False)
+        if not claimed:
+            with db.session.begin_nested():
+                db.session.execute(sa.insert(WorkerLease).values(name=name, **values))
+        db.session.commit()
+        return True
+    except sa.exc.IntegrityError:
+        # Another process holds the lease
+        db.session.rollback()
+        return False
+
+def idle_reaper_loop():
+    """
+    Background loop that periodically reaps idle lab sessions
+    
+    Every process starts this loop; the 'idle_reaper' lease lets only one
+    of them reap at a time.
+    """
+    print(f"Idle reaper started (every {LAB_REAPER_INTERVAL_SECONDS}s)")
+    while True:
+        time.sleep(LAB_REAPER_INTERVAL_SECONDS)
+        with app.app_context():
+            try:
+                if not acquire_worker_lease('idle_reaper', LAB_REAPER_INTERVAL_SECONDS * 2):
+                    continue
+                reaped = reap_idle_lab_sessions()
+                if reaped:
+                    print(f"Idle reaper reclaimed {reaped} lab session(s)")
+            except Exception as e:
+                print(f"Idle reaper error: {e}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+# Host Capacity Admission Control
+# Reservations and the queue live in memory; claim_app_process() keeps the app to one process
+admission_lock = threading.Lock()
+admission_reservations = {}  # {lab_session_id: {'lab_type': str, 'cpu': float, 'memory_mb': int, 'containers': int}}
+admission_queue = []  # [{'lab_session_id': int, 'lab_type': str, 'queued_at': datetime, 'last_seen': datetime, 'published_position': int}]
+admission_state = {'loaded': False}
+# Only a passed lab gives its capacity back on submit; a failed attempt keeps
+# its environment for the retry, and the idle reaper frees it if abandoned
+LAB_FINISHED_STATUSES = ('completed',)
+
+def read_host_memory():
+    """
+    Read total and available memory from /proc/meminfo
+    
+    Returns:
+        dict with total_mb and available_mb, or None if not available
+    """
+    try:
+        values = {}
+        with open('/proc/meminfo') as f:
+            for line in f:
+                key, value = line.split(':', 1)
+                values[key] = int(value.strip().split()[0]) // 1024
+        return {'total_mb': values['MemTotal'], 'available_mb': values['MemAvailable']}
+    except (OSError, KeyError, ValueError):
+        return None
+
+def get_host_load():
+    """Current 1-minute load average and available memory of the host"""
+    memory = read_host_memory()
+    return {
+        'load_1m': os.getloadavg()[0] if hasattr(os, 'getloadavg') else None,
+        'memory_available_mb': memory['available_mb'] if memory else None
+    }
+
+def get_host_capacity():
+    """Capacity budget that lab reservations are admitted against"""
+    memory_mb = HOST_MEMORY_MB_CAPACITY
+    if not memory_mb:
+        memory = read_host_memory()
+        memory_mb = int(memory['total_mb'] * 0.8) if memory else None
+    return {'cpu': HOST_CPU_CAPACITY, 'memory_mb': memory_mb, 'containers': HOST_MAX_CONTAINERS}
+
+def get_lab_resource_profile(lab):
+    """Lab resource profile declared by admins, filled in with defaults"""
+    profile = dict(DEFAULT_LAB_RESOURCE_PROFILE)
+    try:
+        profile.update({k: v for k, v in lab.resource_profile_dict.items() if v is not None})
+    except (TypeError, ValueError):
+        print(f"Warning: Invalid resource profile for lab {lab.id}")
+    return profile
+
+def summarize_admission_usage():
+    """Total and per lab type usage of the current reservations (caller holds admission_lock)"""
+    totals = {'cpu': 0.0, 'memory_mb': 0, 'containers': 0, 'sessions': 0}
+    by_lab_type = {}
+    for reservation in admission_reservations.values():
+        lab_usage = by_lab_type.setdefault(
+            reservation['lab_type'], {'cpu': 0.0, 'memory_mb': 0, 'containers': 0, 'sessions': 0}
+        )
+        for usage in (totals, lab_usage):
+            usage['cpu'] += reservation['cpu']
+            usage['memory_mb'] += reservation['memory_mb']
+            usage['containers'] += reservation['containers']
+            usage['sessions'] += 1
+    return totals, by_lab_type
+
+def check_admission_capacity(profile, lab_type):
+    """
+    Check whether one more lab with this profile fits on the host (caller holds admission_lock)
+    
+    Returns:
+        tuple: (fits: bool, reason: str)
+    """
+    capacity = get_host_capacity()
+    totals, by_lab_type = summarize_admission_usage()
+    lab_usage = by_lab_type.get(lab_type, {'sessions': 0})
+    load = get_host_load()
+    
+    if profile.get('max_concurrent') and lab_usage['sessions'] + 1 > profile['max_concurrent']:
+        return False, f'Lab limit of {profile["max_concurrent"]} concurrent sessions reached'
+    if totals['cpu'] + profile['cpu'] > capacity['cpu']:
+        return False, 'CPU capacity reached'
+    if capacity['memory_mb'] and totals['memory_mb'] + profile['memory_mb'] > capacity['memory_mb']:
+        return False, 'Memory capacity reached'
+    if totals['containers'] + profile['containers'] > capacity['containers']:
+        return False, 'Container limit reached'
+    
+    # Reservations are estimates, so also respect what the host reports right now
+    if load['load_1m'] is not None and load['load_1m'] > capacity['cpu']:
+        return False, 'Host CPU is overloaded'
+    if load['memory_available_mb'] is not None and load['memory_available_mb'] < profile['memory_mb']:
+        return False, 'Host memory is low'
+    
+    return True, 'Admitted'
+
+def load_admission_reservations():
+    """Seed reservations from lab sessions that were running before a restart (caller holds admission_lock)"""
+    if admission_state['loaded']:
+        return
+    
+    # Finished sessions and ones the reaper stopped hold no capacity
+    running = db.session.query(LabSession.id, Lab)\
+        .join(Lab, LabSession.lab_id == Lab.id)\
+        .filter(
+            LabSession.status.notin_(LAB_FINISHED_STATUSES),
+            LabSession.started_at.isnot(None),
+            LabSession.idle_stage.is_(None)
+        ).all()
+    for lab_session_id, lab in running:
+        profile = get_lab_resource_profile(lab)
+        admission_reservations[lab_session_id] = {
+            'lab_type': lab.template_folder,
+            'cpu': float(profile['cpu']),
+            'memory_mb': int(profile['memory_mb']),
+            'containers': int(profile['containers'])
+        }
+    admission_state['loaded'] = True
+
+def request_lab_admission(lab, lab_session):
+    """
+    Admit a lab start or put it in the queue
+    
+    The queue is FIFO per lab type: a request waits only behind earlier
+    requests for the same lab type, so a small lab that fits is not held up
+    by a large one waiting for capacity. Queued students are expected to
+    retry start_lab; an entry that is not polled for
+    ADMISSION_QUEUE_TIMEOUT_SECONDS loses its place.
+    
+    Returns:
+        tuple: (admitted: bool, queue_position: int or None, reason: str)
+    """
+    if not ADMISSION_CONTROL_ENABLED:
+        return True, None, 'Admission control disabled'
+    
+    now = datetime.utcnow()
+    profile = get_lab_resource_profile(lab)
+    lab_type = lab.template_folder
+    
+    with admission_lock:
+        load_admission_reservations()
+        
+        if lab_session.id in admission_reservations:
+            return True, None, 'Already running'
+        
+        # Drop students who stopped waiting
+        expiry = now - timedelta(seconds=ADMISSION_QUEUE_TIMEOUT_SECONDS)
+        admission_queue[:] = [entry for entry in admission_queue if entry['last_seen'] >= expiry]
+        
+        entry = next((e for e in admission_queue if e['lab_session_id'] == lab_session.id), None)
+        if entry:
+            entry['last_seen'] = now
+        
+        # Only the oldest waiting request of its lab type may take capacity
+        same_type = [e for e in admission_queue if e['lab_type'] == lab_type]
+        is_next = (same_type[0] is entry) if same_type else True
+        fits, reason = check_admission_capacity(profile, lab_type)
+        
+        if is_next and fits:
+            if entry:
+                admission_queue.remove(entry)
+            admission_reservations[lab_session.id] = {
+                'lab_type': lab_type,
+                'cpu': float(profile['cpu']),
+                'memory_mb': int(profile['memory_mb']),
+                'containers': int(profile['containers'])
+            }
+            return True, None, reason
+        
+        if not entry:
+            entry = {'lab_session_id': lab_session.id, 'lab_type': lab_type, 'queued_at': now, 'last_seen': now}
+            admission_queue.append(entry)
+            same_type.append(entry)
+        
+        return False, same_type.index(entry) + 1, reason if not fits else 'Waiting for earlier requests'
+
+def queue_position_changed(lab_session_id, queue_position):
+    """Whether a queued start moved since its position was last published, recording the new one"""
+    with admission_lock:
+        entry = next((e for e in admission_queue if e['lab_session_id'] == lab_session_id), None)
+        if not entry or entry.get('published_position') == queue_position:
+            return False
+        entry['published_position'] = queue_position
+        return True
+
+def release_lab_admission(lab_session_id):
+    """Free the capacity held by a lab session and drop it from the queue"""
+    with admission_lock:
+        admission_reservations.pop(lab_session_id, None)
+        admission_queue[:] = [e for e in admission_queue if e['lab_session_id'] != lab_session_id]
+
+def release_finished_lab_admission(lab_session):
+    """Free the capacity of a lab session once it is completed"""
+    if lab_session.status in LAB_FINISHED_STATUSES:
+        release_lab_admission(lab_session.id)
+
+@app.route('/api/lab/<int:lab_id>/queue')
+@login_required
+def lab_queue_status(lab_id):
+    """Get the current user's position in the lab start queue"""
+    user_id = session['user']['id']
+    lab_session = LabSession.query.filter_by(user_id=user_id, lab_id=lab_id).first()
+    
+    with admission_lock:
+        entry = next((e for e in admission_queue if lab_session and e['lab_session_id'] == lab_session.id), None)
+        same_type = [e for e in admission_queue if entry and e['lab_type'] == entry['lab_type']]
+        return jsonify({
+            'queued': entry is not None,
+            'queue_position': same_type.index(entry) + 1 if entry else None,
+            'queue_length': len(same_type) if entry else len(admission_queue)
+        })
+
+@app.route('/admin/capacity')
+@admin_required
+def admin_capacity():
+    """Get host capacity, reservations per lab type and the start queue"""
+    with admission_lock:
+        totals, by_lab_type = summarize_admission_usage()
+        queue = [{
+            'lab_session_id': e['lab_session_id'],
+            'lab_type': e['lab_type'],
+            'queued_at': e['queued_at'].isoformat()
+        } for e in admission_queue]
+    
+    return jsonify({
+        'enabled': ADMISSION_CONTROL_ENABLED,
+        'capacity': get_host_capacity(),
+        'load': get_host_load(),
+        'reserved': totals,
+        'by_lab_type': by_lab_type,
+        'queue': queue
+    })
+
+# Snapshot-based Lab Reset
+def get_snapshot_path(student_folder):
+    """Snapshot archive of a freshly provisioned student folder"""
+    return os.path.join(LAB_SNAPSHOT_PATH, f"{os.path.basename(student_folder)}.tar.gz")
+
+def snapshot_lab_folder(student_folder, linux_username):
+    """
+    Take the reset snapshot of a student folder, once
+    
+    The snapshot is taken after the first successful provisioning, so it
+    already holds rendered parameters and any data directories the lab's
+    containers initialized inside the folder. Containers are stopped while
+    the folder is packed so database files on disk are consistent.
+    
+    Returns:
+        Path to the snapshot, or None if it could not be taken
+    """
+    snapshot_path = get_snapshot_path(student_folder)
+    if os.path.exists(snapshot_path):
+        return snapshot_path
+    if not os.path.exists(student_folder):
+        return None
+    
+    uses_compose = has_compose_file(student_folder)
+    try:
+        start = time.time()
+        if uses_compose and not execute_run_command(linux_username, 'docker compose stop', student_folder):
+            print(f"Warning: Could not stop containers, skipping snapshot of {student_folder}")
+            return None
+        pack_folder(student_folder, snapshot_path)
+        print(f"📸 Snapshot taken for {student_folder} in {time.time() - start:.1f}s")
+        return snapshot_path
+    except Exception as e:
+        print(f"Warning: Could not snapshot {student_folder}: {e}")
+        return None
+    finally:
+        if uses_compose:
+            execute_run_command(linux_username, 'docker compose start', student_folder)
+
+@app.route('/api/lab/<int:lab_session_id>/reset', methods=['POST'])
+@login_required
+def reset_lab(lab_session_id):
+    """
+    Reset a student's lab environment to its provisioned state
+    
+    Containers are removed together with their writable layers and volumes,
+    the folder is restored from its snapshot (or recopied from the template
+    when there is none yet), and the lab's run commands start fresh
+    containers from the cached images.
+    """
+    user_id = session['user']['id']
     
-    # Get lab session and verify ownership
     lab_session = LabSession.query.get_or_404(lab_session_id)
     if lab_session.user_id != user_id:
         return jsonify({'error': 'Unauthorized'}), 403
+    if not lab_session.student_folder:
+        return jsonify({'error': 'Lab environment has not been set up'}), 400
+    
+    lab = lab_session.lab
+    user = lab_session.user
+    user_linux_name = get_student_username(user.email)
+    folder = lab_session.student_folder
+    snapshot_path = get_snapshot_path(folder)
+    start = time.time()
+    
+    # A reset starts containers again, so it goes through admission like start_lab
+    admitted, queue_position, reason = request_lab_admission(lab, lab_session)
+    if not admitted:
+        return jsonify({
+            'queued': True,
+            'queue_position': queue_position,
+            'reason': reason,
+            'message': f'Lab servers are busy. You are number {queue_position} in the queue.'
+        }), 202
+    
+    try:
+        parameter_values = get_lab_session_parameters(lab_session, lab, user)
+        publish_provisioning(lab_session, 'resetting')
+        with lab_lifecycle_lock:
+            # Throw away container state instead of re-running init scripts on it
+            if os.path.exists(folder) and has_compose_file(folder):
+                execute_run_command(user_linux_name, 'docker compose down -v', folder)
+            
+            if os.path.exists(snapshot_path):
+                unpack_folder(snapshot_path, folder)
+                restored_from = 'snapshot'
+            else:
+                if os.path.exists(folder):
+                    remove_folder(folder)
+                if not clone_lab_folder(user_id, lab.id):
+                    release_lab_admission(lab_session.id)
+                    return jsonify({'error': 'Failed to restore lab environment'}), 500
+                if lab.lab_parameters:
+                    apply_parameter_file_modifications(lab, folder, parameter_values)
+                restored_from = 'template'
+            
+            set_lab_folder_owner(folder, user_linux_name)
+            
+            archive_path = get_archive_path(folder)
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+            lab_session.idle_stage = None
+            lab_session.last_accessed = datetime.utcnow()
+            db.session.commit()
+        
+        publish_provisioning(lab_session, 'running_commands')
+        run_lab_commands(lab, user, user_linux_name, folder, parameter_values)
+        if restored_from == 'template':
+            snapshot_lab_folder(folder, user_linux_name)
+        
+        publish_provisioning(lab_session, 'ready', f'Reset from {restored_from}')
+        return jsonify({
+            'message': 'Lab environment reset successfully',
+            'restored_from': restored_from,
+            'duration_seconds': round(time.time() - start, 2)
+        })
+    except Exception as e:
+        db.session.rollback()
+        release_lab_admission(lab_session.id)
+        publish_provisioning(lab_session, 'failed', str(e))
+        print(f"Error resetting lab: {e}")
+        traceback.print_exc()
+        return jsonify({'error': 'Failed to reset lab'}), 500
+
+@app.route('/lab/<int:lab_id>/terminal')
+@login_required
+def lab_terminal(lab_id):
+    """Display lab terminal interface"""
+    user_id = session['user']['id']
+    
+    # Get lab session for current user and lab
+    lab_session = LabSession.query.filter_by(lab_id=lab_id, user_id=user_id).first()
+    if not lab_session:
+        flash('Lab session not found. Please start the lab first.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    # Update last accessed
+    lab_session.last_accessed = datetime.utcnow()
+    db.session.commit()
+    
+    return render_template('lab_terminal.html', lab_session=lab_session)
+
+@app.route('/api/lab/<int:lab_session_id>/submit', methods=['POST'])
+@login_required
+def submit_lab(lab_session_id):
+    """Submit lab with checkpoint answers"""
+    user_id = session['user']['id']
+    
+    # Get lab session and verify ownership before spending a submission token
+    lab_session = LabSession.query.get_or_404(lab_session_id)
+    if lab_session.user_id != user_id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    allowed, retry_after = take_submit_token(user_id, lab_session_id)
+    if not allowed:
+        response = jsonify({
+            'error': f'Too many submissions. Please wait {int(retry_after) + 1} seconds and try again.'
+        })
+        response.headers['Retry-After'] = str(int(retry_after) + 1)
+        return response, 429
     
     lab = lab_session.lab
     data = request.json
@@ -1969,31 +4395,40 @@ def submit_lab(lab_session_id):
             'error': f'Expected {lab.num_checkpoints} checkpoint answers, got {len(checkpoint_answers)}'
         }), 400
     
+    # Identical resubmission: answer from the stored result without writing
+    # (not for verified labs, where the container state can change between submissions)
+    notes = data.get('notes', '')
+    fingerprint = get_submission_fingerprint(lab, checkpoint_answers, notes)
+    if lab_session.submission_fingerprint == fingerprint and lab_session.checkpoint_results \
+            and not lab.verify_command:
+        results = json.loads(lab_session.checkpoint_results)
+        summary = score_checkpoint_results(results, lab.max_score, lab.minimum_score)
+        return jsonify({
+            'message': 'Lab already submitted with these answers',
+            'cached': True,
+            'score': lab_session.score,
+            'max_score': lab.max_score,
+            'minimum_score': summary['minimum_score'],
+            'passed': lab_session.status == 'completed',
+            'status': lab_session.status,
+            'earned_points': summary['earned_points'],
+            'total_points': summary['total_points'],
+            'passed_checkpoints': summary['passed_checkpoints'],
+            'total_checkpoints': lab.num_checkpoints,
+            'results': results
+        })
+    
     try:
         # Validate and score checkpoints
         results = validate_checkpoints(lab, lab_session, checkpoint_answers, user)
-        
-        # Calculate score based on points from each checkpoint
-        total_points = 0
-        earned_points = 0
-        passed_checkpoints = 0
-        
-        for result in results:
-            total_points += result['points']
-            if result['passed']:
-                earned_points += result['points']
-                passed_checkpoints += 1
-        
-        # Calculate final score (scale to max_score)
-        if total_points > 0:
-            score = int((earned_points / total_points) * lab.max_score)
-        else:
-            score = 0
-        
-        # Determine if passed based on minimum score
-        minimum_score = lab.minimum_score or 0
-        passed = score >= minimum_score
-        status = 'completed' if passed else 'failed'
+        summary = score_checkpoint_results(results, lab.max_score, lab.minimum_score)
+        score = summary['score']
+        minimum_score = summary['minimum_score']
+        passed = summary['passed']
+        status = summary['status']
+        earned_points = summary['earned_points']
+        total_points = summary['total_points']
+        passed_checkpoints = summary['passed_checkpoints']
         
         # Update lab session
         lab_session.checkpoint_answers = json.dumps(checkpoint_answers)
@@ -2001,12 +4436,25 @@ def submit_lab(lab_session_id):
         lab_session.score = score
         lab_session.status = status
         lab_session.completed_at = datetime.utcnow()
-        lab_session.submission_notes = data.get('notes', '')
+        lab_session.submission_notes = notes
+        lab_session.submission_fingerprint = fingerprint
+        record_gradebook_score(lab_session, lab)
         
         db.session.commit()
+        invalidate_dashboard(user.id)
+        release_finished_lab_admission(lab_session)
+        # Follow-up reads (profile, verification status) must see this submission
+        pin_reads_to_primary()
+        publish_lab_session_change(lab_session, 'submitted')
+        
+        # Check the student's containers in the background
+        verification = None
+        if lab.verify_command and lab_session.student_folder:
+            verification = queue_verification_job(lab, lab_session, user, fingerprint)
         
         return jsonify({
             'message': 'Lab submitted successfully',
+            'verification': verification,
             'score': score,
             'max_score': lab.max_score,
             'minimum_score': minimum_score,
@@ -2026,45 +4474,264 @@ def submit_lab(lab_session_id):
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-def validate_checkpoints(lab, lab_session, checkpoint_answers, user):
+DEFAULT_CHECKPOINT_RULE = {
+    'decode_method': 'plain',
+    'expected_answer': '',
+    'case_sensitive': False,
+    'points': 10,
+    'use_auto_flag': False
+}
+
+# Checkpoint Decoder Registry
+def decode_plain(answer):
+    """Direct text (no transformation)"""
+    return answer
+
+def decode_base64(answer):
+    """Decode base64 to text"""
+    try:
+        return base64.b64decode(answer).decode('utf-8')
+    except Exception:
+        raise ValueError('Invalid base64 string')
+
+def decode_hash(answer):
+    """Hash methods: the answer is already the hash, normalize it for comparison"""
+    return answer.lower().strip()
+
+def decode_reverse(answer):
+    """Reverse the string"""
+    return answer[::-1]
+
+def decode_hex(answer):
+    """Decode hex to text"""
+    try:
+        return bytes.fromhex(answer).decode('utf-8')
+    except Exception:
+        raise ValueError('Invalid hex string')
+
+def decode_strip(answer):
+    """Trim surrounding whitespace"""
+    return answer.strip()
+
+def decode_lower(answer):
+    """Lowercase the answer"""
+    return answer.lower()
+
+CHECKPOINT_DECODERS = {
+    'plain': decode_plain,
+    'base64': decode_base64,
+    'md5': decode_hash,
+    'sha1': decode_hash,
+    'sha256': decode_hash,
+    'reverse': decode_reverse,
+    'hex': decode_hex,
+    'strip': decode_strip,
+    'lower': decode_lower,
+}
+HASH_DECODE_METHODS = {'md5', 'sha1', 'sha256'}
+
+def parse_decode_methods(decode_method):
+    """Split a decode_method into pipeline steps: 'base64|reverse' or ['base64', 'reverse']"""
+    if isinstance(decode_method, (list, tuple)):
+        methods = [str(m).strip() for m in decode_method]
+    else:
+        methods = [m.strip() for m in str(decode_method or 'plain').split('|')]
+    return [m for m in methods if m] or ['plain']
+
+def normalize_checkpoint_value(value, case_sensitive):
+    """Normalize a value before comparison"""
+    value = str(value).strip()
+    return value if case_sensitive else value.lower()
+
+def compare_equal(student_value, expected_value):
+    """Plain equality compare"""
+    return student_value == expected_value
+
+def compare_constant_time(student_value, expected_value):
+    """Constant-time compare, used for hash answers"""
+    return hmac.compare_digest(student_value.encode('utf-8'), expected_value.encode('utf-8'))
+
+def compile_checkpoint_rule(rule):
     """
-    Validate checkpoint answers based on lab rules
+    Compile one rule into a grading pipeline: decode steps, normalized expected value and comparator
+    
+    Unknown decode methods do not fail compilation, they are reported per answer
+    the same way a decode error is.
+    """
+    compiled = {key: rule.get(key, default) for key, default in DEFAULT_CHECKPOINT_RULE.items()}
+    methods = parse_decode_methods(compiled['decode_method'])
+    unknown = [m for m in methods if m not in CHECKPOINT_DECODERS]
+    
+    compiled['decoders'] = tuple(CHECKPOINT_DECODERS[m] for m in methods if m in CHECKPOINT_DECODERS)
+    compiled['compile_error'] = f'Unknown decode method: {unknown[0]}' if unknown else None
+    compiled['compare'] = compare_constant_time if HASH_DECODE_METHODS.intersection(methods) else compare_equal
+    compiled['expected_value'] = normalize_checkpoint_value(compiled['expected_answer'], compiled['case_sensitive'])
+    return compiled
+
+COMPILED_DEFAULT_CHECKPOINT_RULE = compile_checkpoint_rule(DEFAULT_CHECKPOINT_RULE)
+
+def compile_checkpoint_rules(checkpoint_rules):
+    """
+    Parse a lab's checkpoint_rules JSON once into a list of compiled pipelines
     
     Args:
-        lab: Lab object with checkpoint_rules (JSON array with decode_method, expected_answer, case_sensitive, points, use_auto_flag)
-        lab_session: LabSession object with generated_flag
-        checkpoint_answers: List of student answers
+        checkpoint_rules: JSON array with decode_method, expected_answer, case_sensitive, points, use_auto_flag
     
     Returns:
-        List of validation results with points
+        List of compiled rule dicts (see compile_checkpoint_rule)
     """
-    import base64
-    import hashlib
-    
-    # Parse checkpoint rules
     try:
-        rules = json.loads(lab.checkpoint_rules) if lab.checkpoint_rules else []
-    except:
+        rules = json.loads(checkpoint_rules) if checkpoint_rules else []
+    except (TypeError, ValueError):
         rules = []
+    if not isinstance(rules, list):
+        rules = []
+    
+    return [compile_checkpoint_rule(rule) for rule in rules if isinstance(rule, dict)]
+
+compiled_rules_cache = {}  # {lab_id: (checkpoint_rules JSON, compiled rules)}
+
+def get_lab_checkpoint_pipeline(lab):
+    """Compiled checkpoint rules of a lab, recompiled only when its rules JSON changes"""
+    cached = compiled_rules_cache.get(lab.id)
+    if cached and cached[0] == lab.checkpoint_rules:
+        return cached[1]
+    compiled = compile_checkpoint_rules(lab.checkpoint_rules)
+    compiled_rules_cache[lab.id] = (lab.checkpoint_rules, compiled)
+    return compiled
+
+def get_flag_date(at=None):
+    """Flag date string (DDMMYYYY in Asia/Ho_Chi_Minh) for a naive UTC datetime, default now"""
+    if at is None:
+        local = datetime.now(LAB_TIMEZONE)
+    else:
+        local = at.replace(tzinfo=ZoneInfo('UTC')).astimezone(LAB_TIMEZONE)
+    return local.strftime("%d%m%Y")
+
+def build_expected_flag(date_str, user_email, expected_answer):
+    """
+    Build the auto-generated flag, identical to the lab templates' bash scripts
+    
+    Format: FLAG{SHA1(DDMMYYYY_email_expected)}
+    """
+    flag_input = f"{date_str}_{user_email}_{expected_answer}"
+    return f"FLAG{{{hashlib.sha1(flag_input.encode()).hexdigest()}}}"
+
+# Daily Expected-Flag Cache
+flag_cache_lock = threading.Lock()
+flag_cache = {'date': None, 'expires_at': 0, 'flags': {}}  # flags: {(lab_id, user_email, expected_answer): flag}
+
+def get_next_local_midnight():
+    """Unix timestamp of the next midnight in LAB_TIMEZONE, when flags change"""
+    now = datetime.now(LAB_TIMEZONE)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight.timestamp()
+
+def get_expected_flag(lab_id, user_email, expected_answer, date_str=None):
+    """
+    Expected auto-generated flag for a lab, user and day, cached until local midnight
+    
+    Flags of other days (e.g. when regrading) are computed without caching.
+    """
+    today = get_flag_date()
+    date_str = date_str or today
+    if date_str != today:
+        return build_expected_flag(date_str, user_email, expected_answer)
+    
+    key = (lab_id, user_email, expected_answer)
+    with flag_cache_lock:
+        if flag_cache['date'] != today or time.time() >= flag_cache['expires_at']:
+            flag_cache.update(date=today, expires_at=get_next_local_midnight(), flags={})
+        flag = flag_cache['flags'].get(key)
+        if flag is None:
+            flag = build_expected_flag(today, user_email, expected_answer)
+            flag_cache['flags'][key] = flag
+    return flag
+
+def invalidate_lab_flags(lab_id):
+    """Drop cached flags of a lab, e.g. after its checkpoint rules change"""
+    with flag_cache_lock:
+        flag_cache['flags'] = {k: v for k, v in flag_cache['flags'].items() if k[0] != lab_id}
+
+def precompute_flags(course_id=None, date_str=None):
+    """
+    Compute the day's expected flags for every enrolled student in one batch
+    
+    Args:
+        course_id: Limit to one course (default: all courses)
+        date_str: Flag date (default: today in LAB_TIMEZONE)
+    
+    Returns:
+        Number of flags in the cache for that day
+    """
+    date_str = date_str or get_flag_date()
+    query = db.session.query(Lab.id, Lab.checkpoint_rules, User.email)\
+        .join(Enrollment, Enrollment.course_id == Lab.course_id)\
+        .join(User, Enrollment.user_id == User.id)\
+        .filter(Lab.is_active == True, Enrollment.status == 'active', Lab.checkpoint_rules.isnot(None))
+    if course_id:
+        query = query.filter(Lab.course_id == course_id)
+    
+    auto_flag_answers = {}  # {lab_id: [expected_answer, ...]}, rules compiled once per lab
+    flags = {}
+    for lab_id, checkpoint_rules, email in query.all():
+        if lab_id not in auto_flag_answers:
+            auto_flag_answers[lab_id] = [rule['expected_answer'] for rule in compile_checkpoint_rules(checkpoint_rules)
+                                         if rule['use_auto_flag']]
+        for expected_answer in auto_flag_answers[lab_id]:
+            flags[(lab_id, email, expected_answer)] = build_expected_flag(date_str, email, expected_answer)
+    
+    with flag_cache_lock:
+        if flag_cache['date'] != date_str:
+            flag_cache.update(date=date_str, expires_at=get_next_local_midnight(), flags={})
+        flag_cache['flags'].update(flags)
+        return len(flag_cache['flags'])
+
+def flag_precompute_loop():
+    """Background loop that warms the flag cache right after each local midnight"""
+    print("Flag precompute worker started")
+    while True:
+        with app.app_context():
+            try:
+                count = precompute_flags()
+                print(f"Precomputed {count} flags for {get_flag_date()}")
+            except Exception as e:
+                print(f"Flag precompute error: {e}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+        time.sleep(max(1, get_next_local_midnight() - time.time() + 1))
+
+@app.route('/admin/course/<int:course_id>/precompute_flags', methods=['POST'])
+@admin_required
+def admin_precompute_flags(course_id):
+    """Warm today's expected flags for a course before a deadline"""
+    Course.query.get_or_404(course_id)
+    count = precompute_flags(course_id)
+    return jsonify({'message': 'Flags precomputed', 'date': get_flag_date(), 'cached_flags': count})
+
+def grade_checkpoint_answers(compiled_rules, checkpoint_answers, user_email, date_str, flag_lookup=None):
+    """
+    Grade answers against compiled rules without touching the database
+    
+    Args:
+        compiled_rules: Output of compile_checkpoint_rules()
+        checkpoint_answers: List of student answers
+        user_email: Email used in auto-generated flags
+        date_str: Flag date from get_flag_date()
+        flag_lookup: Optional callable(expected_answer) returning the expected flag,
+            e.g. backed by the daily flag cache; defaults to hashing directly
     
+    Returns:
+        tuple: (results list, last generated flag or None)
+    """
     results = []
+    generated_flag = None
     
     for i, answer in enumerate(checkpoint_answers):
-        # Get rule for this checkpoint
-        if i < len(rules):
-            rule = rules[i]
-            decode_method = rule.get('decode_method', 'plain')
-            expected_answer = rule.get('expected_answer', '')
-            case_sensitive = rule.get('case_sensitive', False)
-            points = rule.get('points', 10)
-            use_auto_flag = rule.get('use_auto_flag', False)  # New option for auto-generated flag
-        else:
-            # Default if no rule configured
-            decode_method = 'plain'
-            expected_answer = ''
-            case_sensitive = False
-            points = 10
-            use_auto_flag = False
+        rule = compiled_rules[i] if i < len(compiled_rules) else COMPILED_DEFAULT_CHECKPOINT_RULE
+        expected_answer = rule['expected_answer']
+        points = rule['points']
         
         result = {
             'checkpoint': i + 1,
@@ -2078,50 +4745,29 @@ def validate_checkpoints(lab, lab_session, checkpoint_answers, user):
         }
         
         try:
-            # Decode answer based on method
-            decoded = decode_checkpoint_answer(answer, decode_method)
+            if rule['compile_error']:
+                raise ValueError(rule['compile_error'])
+            
+            # Run the decode steps of the pipeline
+            decoded = answer
+            for decode in rule['decoders']:
+                decoded = decode(decoded)
             result['decoded_answer'] = decoded
             
-            # Generate unique flag for this lab session
-            # Format: Flag{SHA1(date_email_lab-key)}
-            from datetime import datetime
-            from zoneinfo import ZoneInfo
-            import hashlib
-
-            user_email = user.email  # hoặc gán chuỗi trực tiếp
-
-            # Lấy thời gian theo Asia/Ho_Chi_Minh và format giống hệt bash: DDMMYYYY
-            dt = datetime.now(ZoneInfo("Asia/Ho_Chi_Minh"))
-            date_str = dt.strftime("%d%m%Y")
-
-            # Ghép chuỗi giống hệt bash
-            print("========== ", date_str, user_email, expected_answer)
-            flag_input = f"{date_str}_{user_email}_{expected_answer}"
-
-            # Hash SHA1 giống bash
-            flag_hash = hashlib.sha1(flag_input.encode()).hexdigest()
-
-            lab_session.generated_flag = f"FLAG{{{flag_hash}}}"
-            print(f"Generated flag for lab session: {lab_session.generated_flag}")
-
             # Determine expected value
-            if use_auto_flag:
-                # Use auto-generated flag from lab session
-                expected_value = lab_session.generated_flag if lab_session.generated_flag else expected_answer
+            if rule['use_auto_flag']:
+                if flag_lookup:
+                    generated_flag = flag_lookup(expected_answer)
+                else:
+                    generated_flag = build_expected_flag(date_str, user_email, expected_answer)
+                expected_value = normalize_checkpoint_value(generated_flag, rule['case_sensitive'])
                 result['expected_answer'] = '[Auto-generated Flag]'
             else:
-                expected_value = str(expected_answer)
+                expected_value = rule['expected_value']
             
             # Compare with expected answer
-            student_value = str(decoded).strip()
-            expected_value = str(expected_value).strip()
-            
-            if not case_sensitive:
-                student_value = student_value.lower()
-                expected_value = expected_value.lower()
-            print("STUDENT VALUE ", student_value)
-            print("EXPECTED VALUE ", expected_value)
-            if student_value == expected_value:
+            student_value = normalize_checkpoint_value(decoded, rule['case_sensitive'])
+            if rule['compare'](student_value, expected_value):
                 result['passed'] = True
                 result['earned_points'] = points
                 result['message'] = f'✓ Correct! (+{points} points)'
@@ -2133,66 +4779,562 @@ def validate_checkpoints(lab, lab_session, checkpoint_answers, user):
         
         results.append(result)
     
-    return results
+    return results, generated_flag
 
-def decode_checkpoint_answer(answer, method):
+def score_checkpoint_results(results, max_score, minimum_score):
     """
-    Decode checkpoint answer using specified method
+    Turn checkpoint results into a lab score scaled to max_score
     
-    Args:
-        answer: Raw answer string
-        method: Decoding method (base64, md5, sha256, sha1, plain, reverse, hex)
+    Returns:
+        dict with score, status, passed and point totals
+    """
+    total_points = 0
+    earned_points = 0
+    passed_checkpoints = 0
+    
+    for result in results:
+        total_points += result['points']
+        if result['passed']:
+            earned_points += result['points']
+            passed_checkpoints += 1
+    
+    # Calculate final score (scale to max_score)
+    if total_points > 0:
+        score = int((earned_points / total_points) * max_score)
+    else:
+        score = 0
+    
+    # Determine if passed based on minimum score
+    minimum_score = minimum_score or 0
+    passed = score >= minimum_score
+    
+    return {
+        'score': score,
+        'minimum_score': minimum_score,
+        'passed': passed,
+        'status': 'completed' if passed else 'failed',
+        'earned_points': earned_points,
+        'total_points': total_points,
+        'passed_checkpoints': passed_checkpoints
+    }
+
+# Submission Rate Limiting
+submit_buckets_lock = threading.Lock()
+submit_buckets = {}  # {(user_id, lab_session_id): [tokens, last_refill_timestamp]}
+
+def take_submit_token(user_id, lab_session_id):
+    """
+    Token bucket limiter for submissions, per user and lab session
     
     Returns:
-        Decoded value (for comparison with expected answer)
+        tuple: (allowed: bool, retry_after_seconds: float)
+    """
+    rate = SUBMIT_RATE_PER_MINUTE / 60.0
+    now = time.monotonic()
+    key = (user_id, lab_session_id)
+    
+    with submit_buckets_lock:
+        tokens, last = submit_buckets.get(key, (SUBMIT_RATE_BURST, now))
+        tokens = min(SUBMIT_RATE_BURST, tokens + (now - last) * rate)
+        
+        if tokens < 1:
+            submit_buckets[key] = [tokens, now]
+            return False, (1 - tokens) / rate if rate else 60.0
         
-    Note:
-        - plain: Direct text (no transformation)
-        - base64: Decode base64 to text
-        - md5/sha1/sha256: Hash methods - answer should be the hash itself (for verification)
-        - reverse: Reverse the string
-        - hex: Decode hex to text
+        submit_buckets[key] = [tokens - 1, now]
+        
+        # Forget buckets that have refilled completely
+        if len(submit_buckets) > 10000:
+            for k, (t, ts) in list(submit_buckets.items()):
+                if t + (now - ts) * rate >= SUBMIT_RATE_BURST:
+                    del submit_buckets[k]
+    
+    return True, 0.0
+
+def get_submission_fingerprint(lab, checkpoint_answers, notes):
     """
-    import base64
-    import hashlib
+    Fingerprint of a submission: answers, notes and the grading rules version
     
-    if method == 'plain':
-        # Direct comparison - no transformation
-        return answer
+    Labs with auto-generated flags also include the flag date, since the
+    expected answers change every day.
+    """
+    payload = {
+        'answers': checkpoint_answers,
+        'notes': notes,
+        'rules': lab.checkpoint_rules,
+        'max_score': lab.max_score,
+        'minimum_score': lab.minimum_score
+    }
+    if any(rule['use_auto_flag'] for rule in get_lab_checkpoint_pipeline(lab)):
+        payload['flag_date'] = get_flag_date()
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+# In-container Verification Workers
+verify_executor = ThreadPoolExecutor(max_workers=VERIFY_WORKERS, thread_name_prefix='verify')
+verify_lock = threading.Lock()
+verify_jobs = {}  # {lab_session_id: {'status': str, 'queued_at': float, 'started_at': float, 'finished_at': float, 'error': str}}
+verify_metrics = {
+    'queued': 0, 'completed': 0, 'failed': 0, 'timed_out': 0, 'rejected': 0,
+    'in_flight': 0, 'total_duration': 0.0, 'max_duration': 0.0, 'total_wait': 0.0
+}
+verify_completions = []  # Completion timestamps of the last 10 minutes, for throughput
+
+def run_verification_command(user_linux_name, command, working_directory, timeout):
+    """
+    Run a lab's verification command as the student, like the run commands
+    
+    The command runs in its own process group so a timeout kills the whole
+    tree (sg, sudo, docker exec ...), not just the shell.
     
-    elif method == 'base64':
-        # Decode base64 encoded input
+    Returns:
+        tuple: (exit_code, stdout, stderr)
+    """
+    full_command = f'sg {user_linux_name} -c "cd {working_directory} && sudo {command}"'
+    process = subprocess.Popen(full_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               text=True, start_new_session=True)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
         try:
-            return base64.b64decode(answer).decode('utf-8')
-        except:
-            raise ValueError('Invalid base64 string')
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.communicate()
+        raise
+    return process.returncode, stdout, stderr
+
+def parse_verification_output(stdout):
+    """
+    Turn verification output into per-checkpoint outcomes
     
-    elif method == 'md5':
-        # For hash methods: answer is already the hash, just return it for comparison
-        # Expected answer should be the hash of the secret value
-        return answer.lower().strip()
+    A command reports on checkpoints by printing JSON like
+    {"checkpoints": {"1": true, "2": {"passed": false, "message": "..."}}}
+    as its last line.
+    
+    Returns:
+        dict: {checkpoint_number: (passed, message)} of the reported checkpoints,
+        or None if the command printed no such JSON
+    """
+    try:
+        parsed = json.loads(stdout.strip().splitlines()[-1]) if stdout.strip() else None
+    except (ValueError, IndexError):
+        parsed = None
     
-    elif method == 'sha256':
-        # For hash methods: answer is already the hash, just return it for comparison
-        return answer.lower().strip()
+    if not isinstance(parsed, dict) or not isinstance(parsed.get('checkpoints'), dict):
+        return None
     
-    elif method == 'sha1':
-        # For hash methods: answer is already the hash, just return it for comparison
-        return answer.lower().strip()
+    outcomes = {}
+    for key, value in parsed['checkpoints'].items():
+        if isinstance(value, dict):
+            outcomes[int(key)] = (bool(value.get('passed')), value.get('message', ''))
+        else:
+            outcomes[int(key)] = (bool(value), '')
+    return outcomes
+
+def record_verification_finish(lab_session_id, status, started, error=None):
+    """Update job state and throughput metrics when a job ends"""
+    now = time.time()
+    duration = now - started
+    with verify_lock:
+        job = verify_jobs.get(lab_session_id, {})
+        job.update(status=status, finished_at=now, error=error)
+        verify_metrics['in_flight'] -= 1
+        verify_metrics[status if status in ('completed', 'failed', 'timed_out') else 'failed'] += 1
+        verify_metrics['total_duration'] += duration
+        verify_metrics['max_duration'] = max(verify_metrics['max_duration'], duration)
+        verify_completions.append(now)
+        cutoff = now - 600
+        while verify_completions and verify_completions[0] < cutoff:
+            verify_completions.pop(0)
+
+def run_verification_job(lab_session_id, command, working_directory, user_linux_name, fingerprint, queued_at):
+    """
+    Worker: run the verification command and merge its outcome into checkpoint_results
     
-    elif method == 'reverse':
-        # Reverse the string
-        return answer[::-1]
+    Checkpoints the command reports on (see parse_verification_output) are
+    re-scored from the container state. Without a per-checkpoint report the
+    answer-based results stand and only get the exit code as 'verified'.
+    The merge is skipped if the student submitted again in the meantime.
+    """
+    started = time.time()
+    with verify_lock:
+        verify_jobs[lab_session_id].update(status='running', started_at=started)
+        verify_metrics['total_wait'] += started - queued_at
     
-    elif method == 'hex':
-        # Decode hex to text
+    with app.app_context():
         try:
-            return bytes.fromhex(answer).decode('utf-8')
-        except:
-            raise ValueError('Invalid hex string')
+            exit_code, stdout, stderr = run_verification_command(
+                user_linux_name, command, working_directory, VERIFY_JOB_TIMEOUT_SECONDS
+            )
+            
+            lab_session = db.session.get(LabSession, lab_session_id)
+            if not lab_session or lab_session.submission_fingerprint != fingerprint:
+                record_verification_finish(lab_session_id, 'completed', started, 'Superseded by a newer submission')
+                return
+            
+            lab = lab_session.lab
+            results = json.loads(lab_session.checkpoint_results or '[]')
+            outcomes = parse_verification_output(stdout)
+            if outcomes is None:
+                message = (stdout.strip().splitlines() or [''])[-1][:200]
+                for result in results:
+                    result['verified'] = exit_code == 0
+                    if message:
+                        result['verify_message'] = message
+                outcomes = {}
+            for result in results:
+                if result['checkpoint'] not in outcomes:
+                    continue
+                passed, message = outcomes[result['checkpoint']]
+                result['verified'] = passed
+                result['passed'] = passed
+                result['earned_points'] = result['points'] if passed else 0
+                result['message'] = (f'✓ Verified in lab environment (+{result["points"]} points)' if passed
+                                     else f'✗ Not verified in lab environment (0/{result["points"]} points)')
+                if message:
+                    result['verify_message'] = message
+            
+            summary = score_checkpoint_results(results, lab.max_score, lab.minimum_score)
+            lab_session.checkpoint_results = json.dumps(results)
+            lab_session.score = summary['score']
+            lab_session.status = summary['status']
+            record_gradebook_score(lab_session, lab)
+            db.session.commit()
+            invalidate_dashboard(lab_session.user_id)
+            pin_reads_to_primary(lab_session.user_id)
+            release_finished_lab_admission(lab_session)
+            publish_lab_session_change(lab_session, 'verified')
+            record_verification_finish(lab_session_id, 'completed', started)
+            
+        except subprocess.TimeoutExpired:
+            record_verification_finish(lab_session_id, 'timed_out', started,
+                                       f'Verification timed out after {VERIFY_JOB_TIMEOUT_SECONDS}s')
+        except Exception as e:
+            db.session.rollback()
+            print(f"Verification job for lab session {lab_session_id} failed: {e}")
+            record_verification_finish(lab_session_id, 'failed', started, str(e))
+        finally:
+            db.session.remove()
+
+def queue_verification_job(lab, lab_session, user, fingerprint):
+    """
+    Queue an in-container verification job for a submission
     
-    else:
-        raise ValueError(f'Unknown decode method: {method}')
+    Returns:
+        Job status string: queued, already_queued or rejected
+    """
+    with verify_lock:
+        job = verify_jobs.get(lab_session.id)
+        if job and job['status'] in ('queued', 'running'):
+            return 'already_queued'
+        if verify_metrics['in_flight'] >= VERIFY_QUEUE_LIMIT:
+            verify_metrics['rejected'] += 1
+            return 'rejected'
+        
+        queued_at = time.time()
+        verify_jobs[lab_session.id] = {'status': 'queued', 'queued_at': queued_at,
+                                       'started_at': None, 'finished_at': None, 'error': None}
+        verify_metrics['queued'] += 1
+        verify_metrics['in_flight'] += 1
+    
+    # Verify against the values the containers were provisioned with; sessions
+    # provisioned before values were stored get a fresh pick, as before
+    parameter_values = lab_session.chosen_parameters_dict if lab_session.chosen_parameters is not None \
+        else choose_lab_parameter_values(lab, user)
+    command = replace_lab_parameters(lab.verify_command, user, parameter_values)
+    verify_executor.submit(
+        run_verification_job, lab_session.id, command, lab_session.student_folder,
+        get_student_username(user.email), fingerprint, queued_at
+    )
+    return 'queued'
+
+@app.route('/api/lab/<int:lab_session_id>/verification')
+@login_required
+def get_verification_status(lab_session_id):
+    """Get the status of the latest verification job and the merged results"""
+    lab_session = LabSession.query.get_or_404(lab_session_id)
+    if lab_session.user_id != session['user']['id']:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    with verify_lock:
+        job = dict(verify_jobs.get(lab_session_id) or {'status': 'none'})
+    
+    return jsonify({
+        'job': job,
+        'score': lab_session.score,
+        'status': lab_session.status,
+        'results': json.loads(lab_session.checkpoint_results) if lab_session.checkpoint_results else []
+    })
+
+@app.route('/admin/verification/metrics')
+@admin_required
+def verification_metrics():
+    """Get throughput and latency metrics of the verification workers"""
+    now = time.time()
+    with verify_lock:
+        metrics = dict(verify_metrics)
+        last_minute = sum(1 for t in verify_completions if t >= now - 60)
+        last_10_minutes = len(verify_completions)
+        running = sum(1 for job in verify_jobs.values() if job['status'] == 'running')
+    
+    finished = metrics['completed'] + metrics['failed'] + metrics['timed_out']
+    started = finished + running
+    return jsonify({
+        **metrics,
+        'workers': VERIFY_WORKERS,
+        'avg_duration': round(metrics['total_duration'] / finished, 3) if finished else None,
+        'avg_wait': round(metrics['total_wait'] / started, 3) if started else None,
+        'throughput_per_minute': last_minute,
+        'throughput_per_minute_10m_avg': round(last_10_minutes / 10, 2)
+    })
+
+@app.route('/admin/http/metrics')
+@admin_required
+def http_client_metrics():
+    """Get request counts and latency of the shared outbound HTTP client"""
+    with http_lock:
+        metrics = dict(http_metrics)
+    
+    finished = metrics['requests']
+    return jsonify({
+        **metrics,
+        'loop_running': bool(async_loop and async_loop.is_running()),
+        'pool_limit': HTTP_POOL_LIMIT,
+        'pool_limit_per_host': HTTP_POOL_LIMIT_PER_HOST,
+        'avg_latency': round(metrics['total_latency'] / finished, 3) if finished else None,
+        'avg_loop_wait': round(metrics['total_wait'] / metrics['calls'], 4) if metrics['calls'] else None
+    })
+
+def validate_checkpoints(lab, lab_session, checkpoint_answers, user):
+    """
+    Validate checkpoint answers based on lab rules
+    
+    Args:
+        lab: Lab object with checkpoint_rules (JSON array with decode_method, expected_answer, case_sensitive, points, use_auto_flag)
+        lab_session: LabSession object with generated_flag
+        checkpoint_answers: List of student answers
+    
+    Returns:
+        List of validation results with points
+    """
+    compiled_rules = get_lab_checkpoint_pipeline(lab)
+    date_str = get_flag_date()
+    results, generated_flag = grade_checkpoint_answers(
+        compiled_rules, checkpoint_answers, user.email, date_str,
+        flag_lookup=lambda expected: get_expected_flag(lab.id, user.email, expected, date_str)
+    )
+    
+    if generated_flag and lab_session.generated_flag != generated_flag:
+        lab_session.generated_flag = generated_flag
+    
+    return results
+
+def regrade_submission(job):
+    """
+    Re-grade one stored submission
+    
+    Args:
+        job: tuple (lab_session_id, compiled_rules, answers, user_email, date_str, max_score, minimum_score)
+    
+    Returns:
+        tuple: (lab_session_id, results, score summary, generated flag)
+    """
+    lab_session_id, compiled_rules, answers, user_email, date_str, max_score, minimum_score = job
+    results, generated_flag = grade_checkpoint_answers(compiled_rules, answers, user_email, date_str)
+    return lab_session_id, results, score_checkpoint_results(results, max_score, minimum_score), generated_flag
+
+@app.route('/admin/lab/<int:lab_id>/regrade', methods=['POST'])
+@admin_required
+def regrade_lab(lab_id):
+    """
+    Re-score every stored submission of a lab with its current checkpoint rules
+    
+    Rules are compiled once and scores are written with one batched UPDATE.
+    The regraded scores replace the lab's gradebook entries in the same
+    transaction. Auto-generated flags use the date of the original submission.
+    Labs with a verify_command get their in-container verification queued
+    again, since regrading resets the verified checkpoints.
+    Pass {"dry_run": true} to only get the diff.
+    """
+    lab = Lab.query.get_or_404(lab_id)
+    data = request.get_json(silent=True) or {}
+    dry_run = bool(data.get('dry_run', False))
+    
+    compiled_rules = get_lab_checkpoint_pipeline(lab)
+    submissions = db.session.query(
+        LabSession.id, LabSession.user_id, LabSession.checkpoint_answers, LabSession.score,
+        LabSession.status, LabSession.completed_at, User.email
+    ).join(User, LabSession.user_id == User.id).filter(
+        LabSession.lab_id == lab_id,
+        LabSession.checkpoint_answers.isnot(None)
+    ).all()
+    
+    previous = {}
+    jobs = []
+    for session_id, user_id, answers_json, old_score, old_status, completed_at, email in submissions:
+        try:
+            answers = json.loads(answers_json)
+        except (TypeError, ValueError):
+            continue
+        previous[session_id] = (user_id, email, old_score, old_status)
+        jobs.append((session_id, compiled_rules, answers, email, get_flag_date(completed_at),
+                     lab.max_score, lab.minimum_score))
+    
+    start = time.time()
+    graded = [regrade_submission(job) for job in jobs]
+    
+    updates = []
+    changes = []
+    gradebook_scores = {}
+    for session_id, results, summary, generated_flag in graded:
+        user_id, email, old_score, old_status = previous[session_id]
+        gradebook_scores[user_id] = (summary['score'], summary['status'])
+        mapping = {
+            'id': session_id,
+            'checkpoint_results': json.dumps(results),
+            'score': summary['score'],
+            'status': summary['status']
+        }
+        if generated_flag:
+            mapping['generated_flag'] = generated_flag
+        updates.append(mapping)
+        
+        if old_score != summary['score'] or old_status != summary['status']:
+            changes.append({
+                'lab_session_id': session_id,
+                'user_email': email,
+                'old_score': old_score,
+                'new_score': summary['score'],
+                'old_status': old_status,
+                'new_status': summary['status']
+            })
+    
+    verification = None
+    if not dry_run and updates:
+        try:
+            db.session.bulk_update_mappings(LabSession, updates)
+            replace_gradebook_lab_scores(lab, gradebook_scores)
+            db.session.commit()
+            invalidate_dashboard()
+            if lab.verify_command:
+                verification = {}
+                verify_sessions = LabSession.query.filter(
+                    LabSession.id.in_([u['id'] for u in updates]),
+                    LabSession.student_folder.isnot(None)
+                ).all()
+                for lab_session in verify_sessions:
+                    job_status = queue_verification_job(lab, lab_session, lab_session.user,
+                                                        lab_session.submission_fingerprint)
+                    verification[job_status] = verification.get(job_status, 0) + 1
+            publish_admin_event(lab.course_id, 'lab_regraded', {'lab_id': lab.id, 'changed': len(changes)})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'message': 'Dry run completed' if dry_run else 'Lab regraded successfully',
+        'lab_id': lab_id,
+        'dry_run': dry_run,
+        'regraded': len(graded),
+        'changed': len(changes),
+        'verification': verification,
+        'duration_seconds': round(time.time() - start, 3),
+        'changes': changes
+    })
+
+# Admin Live Monitoring
+ADMIN_NAMESPACE = '/admin'
+
+def get_course_room(course_id):
+    """Socket.IO room of admins watching a course ('all' for every course)"""
+    return f'course:{course_id}'
+
+def publish_admin_event(course_id, event, payload):
+    """Push an event to admins watching the course and to those watching all courses"""
+    payload = dict(payload, course_id=course_id, at=datetime.utcnow().isoformat())
+    try:
+        socketio.emit(event, payload, room=get_course_room(course_id), namespace=ADMIN_NAMESPACE)
+        socketio.emit(event, payload, room=get_course_room('all'), namespace=ADMIN_NAMESPACE)
+    except Exception as e:
+        print(f"Warning: Could not publish admin event {event}: {e}")
+
+def publish_lab_session_change(lab_session, reason):
+    """Push the current status, score and idle stage of a lab session"""
+    publish_admin_event(lab_session.lab.course_id, 'lab_session_changed', {
+        'lab_session_id': lab_session.id,
+        'user_id': lab_session.user_id,
+        'user_name': lab_session.user.full_name,
+        'lab_id': lab_session.lab_id,
+        'lab_name': lab_session.lab.name,
+        'status': lab_session.status,
+        'score': lab_session.score,
+        'idle_stage': lab_session.idle_stage,
+        'reason': reason
+    })
+
+def publish_provisioning(lab_session, stage, message=None):
+    """Push the progress of starting or resetting a lab environment"""
+    publish_admin_event(lab_session.lab.course_id, 'provisioning', {
+        'lab_session_id': lab_session.id,
+        'user_id': lab_session.user_id,
+        'lab_id': lab_session.lab_id,
+        'stage': stage,
+        'message': message
+    })
+
+def publish_terminal_change(terminal_session, lab_session):
+    """Push a terminal opening or closing"""
+    publish_admin_event(lab_session.lab.course_id, 'terminal_changed', {
+        'terminal_session_id': terminal_session.id,
+        'lab_session_id': lab_session.id,
+        'user_id': lab_session.user_id,
+        'user_name': lab_session.user.full_name,
+        'lab_name': lab_session.lab.name,
+        'is_active': terminal_session.is_active
+    })
+
+def get_live_terminals(course_id):
+    """List the open terminals of a course (or of all courses) with one query"""
+    query = db.session.query(TerminalSession, LabSession, User, Lab)\
+        .join(LabSession, TerminalSession.lab_session_id == LabSession.id)\
+        .join(User, LabSession.user_id == User.id)\
+        .join(Lab, LabSession.lab_id == Lab.id)\
+        .filter(TerminalSession.is_active == True)
+    if course_id != 'all':
+        query = query.filter(Lab.course_id == course_id)
+    
+    return [{
+        'terminal_session_id': ts.id,
+        'lab_session_id': ls.id,
+        'user_id': u.id,
+        'user_name': u.full_name,
+        'lab_name': l.name,
+        'course_id': l.course_id,
+        'status': ls.status,
+        'started_at': ts.started_at.isoformat() if ts.started_at else None,
+        'last_activity': ts.last_activity.isoformat() if ts.last_activity else None
+    } for ts, ls, u, l in query.all()]
+
+@socketio.on('connect', namespace=ADMIN_NAMESPACE)
+def handle_admin_connect():
+    if session.get('user', {}).get('role') != 'admin':
+        return False
+
+@socketio.on('watch_course', namespace=ADMIN_NAMESPACE)
+def handle_watch_course(data):
+    """Join the room of a course and get its open terminals as a starting snapshot"""
+    if session.get('user', {}).get('role') != 'admin':
+        return
+    course_id = data.get('course_id') or 'all'
+    if course_id != 'all':
+        course_id = int(course_id)
+    
+    for room in list(rooms(namespace=ADMIN_NAMESPACE)):
+        if room.startswith('course:'):
+            leave_room(room)
+    join_room(get_course_room(course_id))
+    
+    emit('live_snapshot', {'course_id': course_id, 'terminals': get_live_terminals(course_id)})
 
 # WebSocket Terminal Handlers
 active_terminals = {}  # {session_id: {'terminal_session_id': int, 'lab_session_id': int, 'pty_fd': int, 'pid': int, 'read_thread': Thread}}
@@ -2234,6 +5376,7 @@ def handle_disconnect():
             if terminal_session:
                 terminal_session.is_active = False
                 db.session.commit()
+                publish_terminal_change(terminal_session, terminal_session.lab_session)
         except Exception as e:
             print(f"Warning: Could not update terminal session on disconnect: {e}")
             db.session.rollback()
@@ -2274,6 +5417,7 @@ def handle_start_terminal(data):
     
     db.session.add(terminal_session)
     db.session.commit()
+    publish_terminal_change(terminal_session, lab_session)
     
     # Check if Windows or Linux
     is_windows = platform.system() == 'Windows'
@@ -2437,14 +5581,7 @@ def handle_terminal_input(data):
                 os.write(pty_fd, input_data.encode('utf-8'))
                 
                 # Update last activity
-                try:
-                    terminal_session = db.session.get(TerminalSession, terminal_info['terminal_session_id'])
-                    if terminal_session:
-                        terminal_session.last_activity = datetime.utcnow()
-                        db.session.commit()
-                except Exception as e:
-                    print(f"Warning: Could not update last activity: {e}")
-                    db.session.rollback()
+                touch_terminal(terminal_info['terminal_session_id'])
                     
             except Exception as e:
                 print(f"Error writing to pty: {e}")
@@ -2486,12 +5623,7 @@ def handle_windows_terminal_input(session_id, input_data, terminal_info):
         emit('terminal_output', {'data': input_data}, room=session_id)
     
     # Update last activity
-    try:
-        terminal_session.last_activity = datetime.utcnow()
-        db.session.commit()
-    except Exception as e:
-        print(f"Warning: Could not update last activity: {e}")
-        db.session.rollback()
+    touch_terminal(terminal_session.id)
 
 @socketio.on('terminal_resize')
 def handle_terminal_resize(data):
@@ -2523,6 +5655,181 @@ def handle_terminal_resize(data):
     except Exception as e:
         print(f"Error resizing terminal: {e}")
 
+# Command Log Write-Behind
+# Terminals queue command logs and activity in memory; one writer thread inserts
+# them in batches so a keystroke or command never waits on a database commit.
+command_log_lock = threading.Lock()
+command_log_queue = []  # [CommandLog row dicts]
+terminal_activity = {}  # {terminal_session_id: {'commands': int, 'last_activity': datetime}}
+command_log_flush_event = threading.Event()
+command_log_writer = {'thread': None}
+command_log_metrics = {
+    'queued': 0, 'flushed': 0, 'batches': 0, 'failed_flushes': 0, 'dropped': 0,
+    'max_batch': 0, 'total_flush_duration': 0.0
+}
+
+def ensure_command_log_writer():
+    """Start the writer thread on first use, in whichever process serves terminals"""
+    with command_log_lock:
+        if command_log_writer['thread'] is None or not command_log_writer['thread'].is_alive():
+            command_log_writer['thread'] = threading.Thread(target=command_log_writer_loop, name='command-log-writer', daemon=True)
+            command_log_writer['thread'].start()
+
+def record_terminal_activity(terminal_session_id, commands=0):
+    """Count commands and note the latest activity of a terminal (caller holds command_log_lock)"""
+    activity = terminal_activity.setdefault(terminal_session_id, {'commands': 0, 'last_activity': None})
+    activity['commands'] += commands
+    activity['last_activity'] = datetime.utcnow()
+
+def touch_terminal(terminal_session_id):
+    """Note keyboard activity on a terminal without a database write"""
+    with command_log_lock:
+        record_terminal_activity(terminal_session_id)
+    ensure_command_log_writer()
+
+def trim_command_log_queue():
+    """
+    Drop the oldest queued command logs past COMMAND_LOG_QUEUE_LIMIT (caller holds command_log_lock)
+    
+    Returns:
+        int: Number of command logs dropped
+    """
+    overflow = len(command_log_queue) - COMMAND_LOG_QUEUE_LIMIT
+    if overflow <= 0:
+        return 0
+    del command_log_queue[:overflow]
+    command_log_metrics['dropped'] += overflow
+    return overflow
+
+def queue_command_log(command_log):
+    """Queue a command log for the writer thread and count it on its terminal"""
+    row = {
+        'terminal_session_id': command_log.terminal_session_id,
+        'command': command_log.command,
+        'output': command_log.output,
+        'exit_code': command_log.exit_code,
+        'is_allowed': command_log.is_allowed,
+        'blocked_reason': command_log.blocked_reason,
+        'executed_at': datetime.utcnow()
+    }
+    with command_log_lock:
+        command_log_queue.append(row)
+        record_terminal_activity(command_log.terminal_session_id, commands=1)
+        command_log_metrics['queued'] += 1
+        trim_command_log_queue()
+        full = len(command_log_queue) >= COMMAND_LOG_BATCH_SIZE
+    
+    ensure_command_log_writer()
+    if full:
+        command_log_flush_event.set()
+
+def flush_command_logs():
+    """
+    Write queued command logs and terminal counters in one transaction
+    
+    Logs are inserted with a single executemany. Logs of terminals deleted in
+    the meantime are dropped. On failure everything is put back for the next
+    flush, within COMMAND_LOG_QUEUE_LIMIT.
+    
+    Returns:
+        int: Number of command logs written (0 when everything was dropped),
+        None when the flush failed
+    """
+    with command_log_lock:
+        rows = command_log_queue[:]
+        activity = dict(terminal_activity)
+        command_log_queue.clear()
+        terminal_activity.clear()
+    if not rows and not activity:
+        return 0
+    
+    started = time.time()
+    try:
+        terminal_ids = {row['terminal_session_id'] for row in rows} | set(activity)
+        existing = {ts_id for (ts_id,) in db.session.query(TerminalSession.id).filter(TerminalSession.id.in_(terminal_ids))}
+        dropped = sum(1 for row in rows if row['terminal_session_id'] not in existing)
+        rows = [row for row in rows if row['terminal_session_id'] in existing]
+        
+        if rows:
+            db.session.execute(CommandLog.__table__.insert(), rows)
+        updates = [
+            {'ts_id': ts_id, 'commands': a['commands'], 'last_activity': a['last_activity']}
+            for ts_id, a in activity.items() if ts_id in existing
+        ]
+        if updates:
+            terminal_sessions = TerminalSession.__table__
+            db.session.execute(
+                terminal_sessions.update()
+                    .where(terminal_sessions.c.id == sa.bindparam('ts_id'))
+                    .values(
+                        command_count=db.func.coalesce(terminal_sessions.c.command_count, 0) + sa.bindparam('commands'),
+                        last_activity=sa.bindparam('last_activity')
+                    ),
+                updates
+            )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Warning: Could not flush command logs: {e}")
+        with command_log_lock:
+            command_log_queue[:0] = rows
+            dropped = trim_command_log_queue()
+            for ts_id, a in activity.items():
+                current = terminal_activity.setdefault(ts_id, {'commands': 0, 'last_activity': a['last_activity']})
+                current['commands'] += a['commands']
+            command_log_metrics['failed_flushes'] += 1
+        if dropped:
+            print(f"Warning: Command log queue is full, dropped the {dropped} oldest command logs")
+        return None
+    
+    with command_log_lock:
+        command_log_metrics['flushed'] += len(rows)
+        command_log_metrics['dropped'] += dropped
+        command_log_metrics['batches'] += 1
+        command_log_metrics['max_batch'] = max(command_log_metrics['max_batch'], len(rows))
+        command_log_metrics['total_flush_duration'] += time.time() - started
+    return len(rows)
+
+def command_log_writer_loop():
+    """Background loop that flushes command logs on size or time thresholds"""
+    while True:
+        command_log_flush_event.wait(COMMAND_LOG_FLUSH_SECONDS)
+        command_log_flush_event.clear()
+        with app.app_context():
+            try:
+                flush_command_logs()
+            finally:
+                db.session.remove()
+
+def drain_command_logs():
+    """Write everything still queued, for shutdown; gives up on the first failed flush"""
+    with app.app_context():
+        try:
+            while command_log_queue or terminal_activity:
+                if flush_command_logs() is None:
+                    break
+        finally:
+            db.session.remove()
+
+atexit.register(drain_command_logs)
+
+@app.route('/admin/command_logs/metrics')
+@admin_required
+def command_log_writer_metrics():
+    """Get queue depth and batch metrics of the command log writer"""
+    with command_log_lock:
+        metrics = dict(command_log_metrics)
+        pending = len(command_log_queue)
+    
+    return jsonify({
+        **metrics,
+        'pending': pending,
+        'batch_size': COMMAND_LOG_BATCH_SIZE,
+        'flush_seconds': COMMAND_LOG_FLUSH_SECONDS,
+        'avg_batch': round(metrics['flushed'] / metrics['batches'], 1) if metrics['batches'] else None,
+        'avg_flush_duration': round(metrics['total_flush_duration'] / metrics['batches'], 4) if metrics['batches'] else None
+    })
+
 def execute_secure_command(socket_session_id, command, terminal_session, lab_session):
     """Execute command with security validation"""
     
@@ -2561,6 +5868,7 @@ def execute_secure_command(socket_session_id, command, terminal_session, lab_ses
                 new_dir = handle_cd_command(command, current_dir, accessible_resources)
                 if new_dir != current_dir:
                     terminal_session.current_directory = new_dir
+                    db.session.commit()
                     output = f"\r\n{get_prompt(new_dir)}"
                 else:
                     output = f"\r\ncd: directory not accessible or not found\r\n{get_prompt(current_dir)}"
@@ -2642,16 +5950,8 @@ def execute_secure_command(socket_session_id, command, terminal_session, lab_ses
             command_log.output = f"Error: {str(e)}"
             command_log.exit_code = 1
     
-    # Save command log
-    try:
-        db.session.add(command_log)
-        
-        # Update terminal session stats
-        terminal_session.command_count += 1
-        db.session.commit()
-    except Exception as e:
-        print(f"Warning: Could not save command log: {e}")
-        db.session.rollback()
+    # Save command log and terminal stats in the background
+    queue_command_log(command_log)
 
 def handle_cd_command(command, current_dir, accessible_resources):
     """Handle cd command with path validation"""
@@ -2810,12 +6110,89 @@ def create_sample_templates():
                     f.write(content)
     
 
+def handle_shutdown_signal(signum, frame):
+    raise SystemExit(0)
+
+background_workers = {'pid': None, 'claimed': False, 'lock_file': None}
+background_workers_lock = threading.Lock()
+
+def claim_app_process():
+    """
+    Take the app process lock, so only one process serves the app
+    
+    Admission reservations and the start queue, the page caches and their
+    data versions, and the live terminals are all kept in process memory,
+    so a second worker process would work from its own copy of each. The
+    lock is an flock on APP_PROCESS_LOCK_PATH, released by the kernel when
+    the holder exits.
+    
+    Returns:
+        True if this process holds the lock
+    """
+    if platform.system() == 'Windows':
+        return True
+    lock_file = open(APP_PROCESS_LOCK_PATH, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    background_workers['lock_file'] = lock_file
+    return True
+
+def start_background_workers():
+    """Claim the app process and start background maintenance threads, once per process"""
+    with background_workers_lock:
+        if background_workers['pid'] == os.getpid():
+            return
+        background_workers['pid'] = os.getpid()
+        background_workers['claimed'] = claim_app_process()
+    
+    if not background_workers['claimed']:
+        print(f"Error: another process holds {APP_PROCESS_LOCK_PATH}; "
+              f"this app must run as a single process (e.g. gunicorn -w 1 --threads N)")
+        return
+    
+    if LAB_REAPER_ENABLED:
+        threading.Thread(target=idle_reaper_loop, daemon=True).start()
+    if FLAG_PRECOMPUTE_ENABLED:
+        threading.Thread(target=flag_precompute_loop, daemon=True).start()
+    if RESOURCE_MONITOR_ENABLED:
+        threading.Thread(target=resource_monitor_loop, daemon=True).start()
+
+@app.before_request
+def ensure_background_workers():
+    """
+    Start the workers in whichever process serves requests
+    
+    This covers gunicorn/uWSGI workers (also after a fork) and runs without the
+    reloader; the reloader's parent process never serves a request. Any process
+    other than the one holding the app process lock answers 503.
+    """
+    if background_workers['pid'] != os.getpid():
+        start_background_workers()
+    if not background_workers['claimed']:
+        return jsonify({'error': 'Another process is already serving this app'}), 503
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
         
         # Create sample data for testing
         create_sample_data()
+        
+        # Fill the gradebook table the first time it exists
+        if not CourseGradebook.query.first():
+            rebuild_gradebook()
+            db.session.commit()
+    
+    # Let SIGTERM run the atexit hooks that drain queued command logs
+    signal.signal(signal.SIGTERM, handle_shutdown_signal)
+    
+    # Start right away in the reloader's serving child; any other serving process
+    # starts them on its first request (ensure_background_workers)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
     
     print("🚀 Starting Lab Management System...")
     print("📡 Server will be available at: http://localhost:5000")
@@ -0,0 +1,58 @@
+"""Add indexes for hot query paths
+
+Tables created by db.create_all() on a fresh database already have these
+indexes, so each one is only created when it is missing.
+
+Revision ID: 3f9c2a7d1b40
+Revises:
+Create Date: 2026-10-18 23:40:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d1b40'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns)
+INDEXES = [
+    ('ix_users_created_at_id', 'users', ['created_at', 'id']),
+    ('ix_courses_created_at_id', 'courses', ['created_at', 'id']),
+    ('ix_labs_course_order', 'labs', ['course_id', 'order_index', 'id']),
+    ('ix_labs_course_active_order', 'labs', ['course_id', 'is_active', 'order_index']),
+    ('ix_enrollments_enrolled_at_id', 'enrollments', ['enrolled_at', 'id']),
+    ('ix_enrollments_course_status', 'enrollments', ['course_id', 'status']),
+    ('ix_lab_sessions_created_at_id', 'lab_sessions', ['created_at', 'id']),
+    ('ix_lab_sessions_lab_status', 'lab_sessions', ['lab_id', 'status']),
+    ('ix_lab_sessions_status_user', 'lab_sessions', ['status', 'user_id']),
+    ('ix_terminal_sessions_lab_session_active', 'terminal_sessions', ['lab_session_id', 'is_active']),
+    ('ix_command_logs_terminal_executed', 'command_logs', ['terminal_session_id', 'executed_at', 'id']),
+    ('ix_labs_network_used', 'labs_network', ['used']),
+]
+
+
+def existing_indexes(inspector, table):
+    if not inspector.has_table(table):
+        return None
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        indexes = existing_indexes(inspector, table)
+        if indexes is not None and name not in indexes:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in reversed(INDEXES):
+        indexes = existing_indexes(inspector, table)
+        if indexes is not None and name in indexes:
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,32 @@
+"""Add fetch cache policy to labs
+
+Revision ID: 8b21e6f4c3d7
+Revises: 3f9c2a7d1b40
+Create Date: 2026-10-19 01:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b21e6f4c3d7'
+down_revision = '3f9c2a7d1b40'
+branch_labels = None
+depends_on = None
+
+
+def has_column(table, column):
+    inspector = sa.inspect(op.get_bind())
+    return column in {c['name'] for c in inspector.get_columns(table)}
+
+
+def upgrade():
+    if not has_column('labs', 'fetch_cache_policy'):
+        op.add_column('labs', sa.Column('fetch_cache_policy', sa.Text(), nullable=True))
+
+
+def downgrade():
+    if has_column('labs', 'fetch_cache_policy'):
+        with op.batch_alter_table('labs') as batch_op:
+            batch_op.drop_column('fetch_cache_policy')
@@ -0,0 +1,32 @@
+"""Add idle reaper stage to lab sessions
+
+Revision ID: a1c4e7f20b13
+Revises: 8b21e6f4c3d7
+Create Date: 2026-10-19 09:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c4e7f20b13'
+down_revision = '8b21e6f4c3d7'
+branch_labels = None
+depends_on = None
+
+
+def has_column(table, column):
+    inspector = sa.inspect(op.get_bind())
+    return column in {c['name'] for c in inspector.get_columns(table)}
+
+
+def upgrade():
+    if not has_column('lab_sessions', 'idle_stage'):
+        op.add_column('lab_sessions', sa.Column('idle_stage', sa.String(length=20), nullable=True))
+
+
+def downgrade():
+    if has_column('lab_sessions', 'idle_stage'):
+        with op.batch_alter_table('lab_sessions') as batch_op:
+            batch_op.drop_column('idle_stage')
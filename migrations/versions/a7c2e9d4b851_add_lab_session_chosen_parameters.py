@@ -0,0 +1,32 @@
+"""Add chosen parameter values to lab sessions
+
+Revision ID: a7c2e9d4b851
+Revises: f1b8d3e5a620
+Create Date: 2026-10-19 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c2e9d4b851'
+down_revision = 'f1b8d3e5a620'
+branch_labels = None
+depends_on = None
+
+
+def has_column(table, column):
+    inspector = sa.inspect(op.get_bind())
+    return column in {c['name'] for c in inspector.get_columns(table)}
+
+
+def upgrade():
+    if not has_column('lab_sessions', 'chosen_parameters'):
+        op.add_column('lab_sessions', sa.Column('chosen_parameters', sa.Text(), nullable=True))
+
+
+def downgrade():
+    if has_column('lab_sessions', 'chosen_parameters'):
+        with op.batch_alter_table('lab_sessions') as batch_op:
+            batch_op.drop_column('chosen_parameters')
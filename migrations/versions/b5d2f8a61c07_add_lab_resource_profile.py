@@ -0,0 +1,32 @@
+"""Add resource profile to labs
+
+Revision ID: b5d2f8a61c07
+Revises: a1c4e7f20b13
+Create Date: 2026-10-19 09:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d2f8a61c07'
+down_revision = 'a1c4e7f20b13'
+branch_labels = None
+depends_on = None
+
+
+def has_column(table, column):
+    inspector = sa.inspect(op.get_bind())
+    return column in {c['name'] for c in inspector.get_columns(table)}
+
+
+def upgrade():
+    if not has_column('labs', 'resource_profile'):
+        op.add_column('labs', sa.Column('resource_profile', sa.Text(), nullable=True))
+
+
+def downgrade():
+    if has_column('labs', 'resource_profile'):
+        with op.batch_alter_table('labs') as batch_op:
+            batch_op.drop_column('resource_profile')
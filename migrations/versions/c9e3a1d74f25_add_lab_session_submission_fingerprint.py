@@ -0,0 +1,32 @@
+"""Add submission fingerprint to lab sessions
+
+Revision ID: c9e3a1d74f25
+Revises: b5d2f8a61c07
+Create Date: 2026-10-19 09:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e3a1d74f25'
+down_revision = 'b5d2f8a61c07'
+branch_labels = None
+depends_on = None
+
+
+def has_column(table, column):
+    inspector = sa.inspect(op.get_bind())
+    return column in {c['name'] for c in inspector.get_columns(table)}
+
+
+def upgrade():
+    if not has_column('lab_sessions', 'submission_fingerprint'):
+        op.add_column('lab_sessions', sa.Column('submission_fingerprint', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    if has_column('lab_sessions', 'submission_fingerprint'):
+        with op.batch_alter_table('lab_sessions') as batch_op:
+            batch_op.drop_column('submission_fingerprint')
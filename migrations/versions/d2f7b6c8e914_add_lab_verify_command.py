@@ -0,0 +1,32 @@
+"""Add verification command to labs
+
+Revision ID: d2f7b6c8e914
+Revises: c9e3a1d74f25
+Create Date: 2026-10-19 09:40:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f7b6c8e914'
+down_revision = 'c9e3a1d74f25'
+branch_labels = None
+depends_on = None
+
+
+def has_column(table, column):
+    inspector = sa.inspect(op.get_bind())
+    return column in {c['name'] for c in inspector.get_columns(table)}
+
+
+def upgrade():
+    if not has_column('labs', 'verify_command'):
+        op.add_column('labs', sa.Column('verify_command', sa.Text(), nullable=True))
+
+
+def downgrade():
+    if has_column('labs', 'verify_command'):
+        with op.batch_alter_table('labs') as batch_op:
+            batch_op.drop_column('verify_command')
@@ -0,0 +1,45 @@
+"""Add course gradebook table
+
+Revision ID: e6a4c0b9f318
+Revises: d2f7b6c8e914
+Create Date: 2026-10-19 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a4c0b9f318'
+down_revision = 'd2f7b6c8e914'
+branch_labels = None
+depends_on = None
+
+
+def has_table(table):
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade():
+    if not has_table('course_gradebook'):
+        op.create_table(
+            'course_gradebook',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('course_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('lab_scores', sa.Text(), nullable=True),
+            sa.Column('graded_labs', sa.Integer(), nullable=True),
+            sa.Column('completed_labs', sa.Integer(), nullable=True),
+            sa.Column('completed_score_total', sa.Integer(), nullable=True),
+            sa.Column('average_score', sa.Float(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['course_id'], ['courses.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('course_id', 'user_id')
+        )
+
+
+def downgrade():
+    if has_table('course_gradebook'):
+        op.drop_table('course_gradebook')
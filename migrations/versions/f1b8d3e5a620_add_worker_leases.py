@@ -0,0 +1,36 @@
+"""Add worker leases table
+
+Revision ID: f1b8d3e5a620
+Revises: e6a4c0b9f318
+Create Date: 2026-10-19 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b8d3e5a620'
+down_revision = 'e6a4c0b9f318'
+branch_labels = None
+depends_on = None
+
+
+def has_table(table):
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade():
+    if not has_table('worker_leases'):
+        op.create_table(
+            'worker_leases',
+            sa.Column('name', sa.String(length=50), nullable=False),
+            sa.Column('owner', sa.String(length=100), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('name')
+        )
+
+
+def downgrade():
+    if has_table('worker_leases'):
+        op.drop_table('worker_leases')
@@ -92,6 +92,10 @@ def migrate_database():
             print("\n[4/5] Creating/updating tables...")
             db.create_all()
             
+            # Add indexes that tables created by older versions are missing
+            from flask_migrate import upgrade
+            upgrade(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
+            
             # Verify new tables
             inspector = inspect(db.engine)
             all_tables = inspector.get_table_names()
@@ -0,0 +1,120 @@
+"""
+Test setup: throwaway SQLite primary and read replica databases and lab folders,
+configured through the same environment variables as a real deployment before
+the app is imported
+"""
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+import sqlalchemy as sa
+
+TEST_DIR = tempfile.mkdtemp(prefix='lab-management-tests-')
+PRIMARY_DB = os.path.join(TEST_DIR, 'primary.db')
+REPLICA_DB = os.path.join(TEST_DIR, 'replica.db')
+os.environ.update({
+    'DATABASE_URL': f'sqlite:///{PRIMARY_DB}',
+    'DATABASE_REPLICA_URL': f'sqlite:///{REPLICA_DB}',
+    'STUDENT_LABS_PATH': os.path.join(TEST_DIR, 'student-labs'),
+    'LAB_ARCHIVE_PATH': os.path.join(TEST_DIR, 'archived-labs'),
+    'LAB_SNAPSHOT_PATH': os.path.join(TEST_DIR, 'lab-snapshots'),
+    'FETCH_RECORDINGS_PATH': os.path.join(TEST_DIR, 'fetch-recordings'),
+    'LAB_REAPER_ENABLED': 'false',
+    'FLAG_PRECOMPUTE_ENABLED': 'false',
+    'RESOURCE_MONITOR_ENABLED': 'false',
+    'APP_PROCESS_LOCK_PATH': os.path.join(TEST_DIR, 'lab_management.lock'),
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lab_management_app as lab_app  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    with lab_app.app.app_context():
+        lab_app.db.drop_all()
+        lab_app.db.create_all()
+        sync_replica()
+        lab_app.invalidate_dashboard()
+        with lab_app.response_cache_lock:
+            lab_app.response_cache.clear()
+        with lab_app.read_primary_lock:
+            lab_app.read_primary_until.clear()
+        with lab_app.fetch_cache_lock:
+            lab_app.fetch_cache.clear()
+        yield lab_app.app
+        lab_app.db.session.remove()
+
+
+@pytest.fixture
+def db(app):
+    return lab_app.db
+
+
+def sync_replica():
+    """Catch the read replica up with the primary, like replication would"""
+    lab_app.db.engines['replica'].dispose()
+    shutil.copyfile(PRIMARY_DB, REPLICA_DB)
+
+
+def login(user):
+    """Get a test client with a logged in session of a user"""
+    client = lab_app.app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user'] = {
+            'id': user.id,
+            'email': user.email,
+            'full_name': user.full_name,
+            'role': user.role or 'student'
+        }
+    return client
+
+
+def create_course_data(num_courses=3, labs_per_course=10, student_email='student@example.com'):
+    """
+    Create an admin, a student enrolled in some courses and one lab session per lab
+
+    Returns:
+        tuple: (admin, student, courses)
+    """
+    db = lab_app.db
+    admin = lab_app.User(email='admin@example.com', full_name='Admin', google_id='admin', role='admin')
+    student = lab_app.User(email=student_email, full_name='Student', google_id=student_email, role='student')
+    db.session.add_all([admin, student])
+    db.session.flush()
+
+    courses = []
+    for c in range(num_courses):
+        course = lab_app.Course(code=f'C{c}', name=f'Course {c}', semester='2026-1')
+        db.session.add(course)
+        db.session.flush()
+        db.session.add(lab_app.Enrollment(user_id=student.id, course_id=course.id))
+        for i in range(labs_per_course):
+            lab = lab_app.Lab(course_id=course.id, name=f'Lab {c}.{i}', template_folder='t',
+                              num_checkpoints=1, order_index=i)
+            db.session.add(lab)
+            db.session.flush()
+            db.session.add(lab_app.LabParameter(lab_id=lab.id, parameter_name='p', parameter_values='["a"]'))
+            db.session.add(lab_app.LabSession(user_id=student.id, lab_id=lab.id, status='completed', score=80))
+        courses.append(course)
+    db.session.commit()
+    sync_replica()
+    return admin, student, courses
+
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements sent to any database inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sa.event.listen(sa.engine.Engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        sa.event.remove(sa.engine.Engine, 'before_cursor_execute', before_cursor_execute)
@@ -0,0 +1,47 @@
+from conftest import create_course_data, lab_app, login
+
+
+def watch_course(admin, course):
+    """Connect an admin Socket.IO client to the live feed of a course"""
+    client = lab_app.socketio.test_client(lab_app.app, namespace='/admin', flask_test_client=login(admin))
+    client.emit('watch_course', {'course_id': str(course.id)}, namespace='/admin')
+    client.get_received('/admin')
+    return client
+
+
+def test_regrade_event_counts_changed_submissions_only(app, db):
+    admin, student, courses = create_course_data(num_courses=1, labs_per_course=1)
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).first()
+    lab_session.checkpoint_answers = '["wrong"]'
+    db.session.commit()
+    admin_client = login(admin)
+    admin_client.post(f'/admin/lab/{lab_session.lab_id}/regrade', json={})
+    feed = watch_course(admin, courses[0])
+
+    # The second regrade rewrites the submission but changes nothing
+    body = admin_client.post(f'/admin/lab/{lab_session.lab_id}/regrade', json={}).get_json()
+
+    events = [e['args'][0] for e in feed.get_received('/admin') if e['name'] == 'lab_regraded']
+    assert (body['regraded'], body['changed']) == (1, 0)
+    assert [event['changed'] for event in events] == [0]
+
+
+def test_queue_position_is_published_only_when_it_changes(app, db, monkeypatch):
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=2)
+    first, second = lab_app.LabSession.query.filter_by(user_id=student.id).order_by(lab_app.LabSession.id).all()
+    monkeypatch.setattr(lab_app, 'admission_queue', [])
+    monkeypatch.setattr(lab_app, 'admission_reservations', {})
+    monkeypatch.setitem(lab_app.admission_state, 'loaded', True)
+    monkeypatch.setattr(lab_app, 'check_admission_capacity', lambda profile, lab_type: (False, 'Host is full'))
+
+    def poll(lab_session):
+        _, position, _ = lab_app.request_lab_admission(lab_session.lab, lab_session)
+        return position, lab_app.queue_position_changed(lab_session.id, position)
+
+    assert poll(first) == (1, True)
+    assert poll(second) == (2, True)
+    assert poll(second) == (2, False)
+
+    lab_app.release_lab_admission(first.id)
+    assert poll(second) == (1, True)
+    assert poll(second) == (1, False)
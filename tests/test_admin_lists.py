@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import create_course_data, lab_app, login
+
+
+def collect_pages(client, url, **params):
+    """Follow next_cursor through every page of an admin list"""
+    items, cursor = [], None
+    while True:
+        query = dict(params, **({'cursor': cursor} if cursor else {}))
+        body = client.get(url, query_string=query).get_json()
+        items += body['items']
+        cursor = body['next_cursor']
+        if not cursor:
+            return items
+
+
+@pytest.mark.parametrize('sort', ['created_at', '-created_at'])
+def test_keyset_pages_include_users_with_null_created_at(app, db, sort):
+    admin = lab_app.User(email='admin@example.com', full_name='Admin', google_id='admin', role='admin')
+    db.session.add(admin)
+    base = datetime(2026, 1, 1)
+    for i in range(9):
+        user = lab_app.User(email=f'user{i}@example.com', google_id=f'user{i}', full_name=f'User {i}')
+        db.session.add(user)
+        db.session.flush()
+        user.created_at = None if i % 3 == 0 else base + timedelta(hours=i % 2)
+    db.session.commit()
+
+    items = collect_pages(login(admin), '/admin/users', sort=sort, limit=2)
+
+    ids = [item['id'] for item in items]
+    assert len(ids) == len(set(ids)) == 10
+
+
+@pytest.mark.parametrize('sort', ['order', '-order'])
+def test_keyset_pages_include_labs_with_null_order_index(app, db, sort):
+    admin, _, courses = create_course_data(num_courses=2, labs_per_course=5)
+    for lab in lab_app.Lab.query.filter(lab_app.Lab.id % 2 == 0):
+        lab.order_index = None
+    db.session.commit()
+
+    items = collect_pages(login(admin), '/admin/labs', sort=sort, limit=3)
+
+    ids = [item['id'] for item in items]
+    assert len(ids) == len(set(ids)) == 10
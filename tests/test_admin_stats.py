@@ -0,0 +1,47 @@
+import pytest
+
+from conftest import count_queries, create_course_data, lab_app, login, sync_replica
+
+
+@pytest.fixture
+def admin(app, db, monkeypatch):
+    monkeypatch.setattr(lab_app, 'admin_stats_cache', {'expires_at': 0, 'stats': None})
+    admin, _, _ = create_course_data(num_courses=2, labs_per_course=3)
+    return admin
+
+
+def add_user(db, email):
+    db.session.add(lab_app.User(email=email, full_name='New', google_id=email, role='student'))
+    db.session.commit()
+    sync_replica()
+
+
+def test_stats_are_aggregated(admin):
+    stats = login(admin).get('/admin/stats').get_json()
+
+    assert (stats['total_users'], stats['total_courses'], stats['total_labs']) == (2, 2, 6)
+    assert stats['enrollments_by_status'] == {'active': 2}
+    assert stats['lab_sessions_by_status'] == {'completed': 6}
+
+
+def test_cached_stats_cost_no_queries(admin):
+    lab_app.get_admin_stats()
+
+    with count_queries() as statements:
+        lab_app.get_admin_stats()
+
+    assert statements == []
+
+
+def test_refresh_and_expiry_recompute(admin, db, monkeypatch):
+    client = login(admin)
+    assert client.get('/admin/stats').get_json()['total_users'] == 2
+    add_user(db, 'new@example.com')
+
+    assert client.get('/admin/stats').get_json()['total_users'] == 2
+    assert client.get('/admin/stats?refresh=true').get_json()['total_users'] == 3
+
+    add_user(db, 'later@example.com')
+    now = lab_app.time.monotonic()
+    monkeypatch.setattr(lab_app.time, 'monotonic', lambda: now + lab_app.ADMIN_STATS_CACHE_SECONDS + 1)
+    assert client.get('/admin/stats').get_json()['total_users'] == 4
@@ -0,0 +1,59 @@
+import fcntl
+from datetime import datetime
+
+import pytest
+
+from conftest import create_course_data, lab_app
+
+
+@pytest.fixture
+def running_lab(app, db, monkeypatch):
+    """A started lab session holding a host reservation"""
+    monkeypatch.setattr(lab_app, 'admission_queue', [])
+    monkeypatch.setattr(lab_app, 'admission_reservations', {})
+    monkeypatch.setitem(lab_app.admission_state, 'loaded', True)
+    monkeypatch.setattr(lab_app, 'check_admission_capacity', lambda profile, lab_type: (True, 'Admitted'))
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).first()
+    assert lab_app.request_lab_admission(lab_session.lab, lab_session)[0]
+    return lab_session
+
+
+def test_failed_attempt_keeps_its_capacity(running_lab):
+    running_lab.status = 'failed'
+    lab_app.release_finished_lab_admission(running_lab)
+    assert running_lab.id in lab_app.admission_reservations
+
+    running_lab.status = 'completed'
+    lab_app.release_finished_lab_admission(running_lab)
+    assert running_lab.id not in lab_app.admission_reservations
+
+
+def test_reservations_are_reloaded_for_unfinished_sessions(running_lab, db, monkeypatch):
+    running_lab.status = 'failed'
+    running_lab.started_at = datetime.utcnow()
+    db.session.commit()
+    monkeypatch.setattr(lab_app, 'admission_reservations', {})
+    monkeypatch.setitem(lab_app.admission_state, 'loaded', False)
+
+    lab_app.load_admission_reservations()
+
+    assert list(lab_app.admission_reservations) == [running_lab.id]
+
+
+def test_second_process_is_refused(app, tmp_path, monkeypatch):
+    lock_path = tmp_path / 'app.lock'
+    monkeypatch.setattr(lab_app, 'APP_PROCESS_LOCK_PATH', str(lock_path))
+    monkeypatch.setitem(lab_app.background_workers, 'pid', None)
+    monkeypatch.setitem(lab_app.background_workers, 'claimed', False)
+    monkeypatch.setitem(lab_app.background_workers, 'lock_file', None)
+    client = app.test_client()
+
+    with open(lock_path, 'a') as other_process:
+        fcntl.flock(other_process, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        assert client.get('/login').status_code == 503
+
+    # Once the holder exits, a restarted process takes over
+    monkeypatch.setitem(lab_app.background_workers, 'pid', None)
+    assert client.get('/login').status_code != 503
+    lab_app.background_workers['lock_file'].close()
@@ -0,0 +1,67 @@
+import base64
+import hashlib
+import json
+
+from conftest import lab_app
+
+
+def grade(rules, answers, email='student@example.com', date_str='19102026'):
+    results, _ = lab_app.grade_checkpoint_answers(
+        lab_app.compile_checkpoint_rules(json.dumps(rules)), answers, email, date_str
+    )
+    return results
+
+
+def test_pipeline_runs_steps_left_to_right():
+    answer = base64.b64encode(b'olleh').decode()
+    [result] = grade([{'decode_method': 'base64|reverse', 'expected_answer': 'hello'}], [answer])
+
+    assert result['decoded_answer'] == 'hello'
+    assert result['passed']
+
+
+def test_pipeline_accepts_a_list_of_steps():
+    answer = '  ' + 'HELLO'.encode().hex() + ' '
+    [result] = grade([{'decode_method': ['strip', 'hex', 'lower'], 'expected_answer': 'hello',
+                       'case_sensitive': True}], [answer])
+
+    assert result['passed']
+
+
+def test_decode_error_fails_only_its_checkpoint():
+    results = grade([{'decode_method': 'base64', 'expected_answer': 'x', 'points': 5},
+                     {'decode_method': 'plain', 'expected_answer': 'y', 'points': 5}], ['not base64!', 'y'])
+
+    assert [r['passed'] for r in results] == [False, True]
+    assert results[0]['message'] == 'Decode error: Invalid base64 string'
+
+
+def test_unknown_method_is_reported_per_answer():
+    [result] = grade([{'decode_method': 'base64|rot13', 'expected_answer': 'x'}], ['eA=='])
+
+    assert not result['passed']
+    assert result['message'] == 'Decode error: Unknown decode method: rot13'
+
+
+def test_hash_answers_compare_normalized():
+    digest = hashlib.sha256(b'secret').hexdigest()
+    [result] = grade([{'decode_method': 'sha256', 'expected_answer': digest}], [' ' + digest.upper()])
+
+    assert result['passed']
+    assert lab_app.compile_checkpoint_rule({'decode_method': 'sha256'})['compare'] is lab_app.compare_constant_time
+
+
+def test_auto_flag_is_expected_after_decoding():
+    flag = lab_app.build_expected_flag('19102026', 'student@example.com', 'sqli')
+    answer = base64.b64encode(flag.encode()).decode()
+    [result] = grade([{'decode_method': 'base64', 'expected_answer': 'sqli', 'use_auto_flag': True}], [answer])
+
+    assert result['passed']
+    assert result['expected_answer'] == '[Auto-generated Flag]'
+
+
+def test_answers_past_the_rules_use_the_default_rule():
+    results = grade([], ['anything'])
+
+    assert results[0]['points'] == lab_app.DEFAULT_CHECKPOINT_RULE['points']
+    assert not results[0]['passed']
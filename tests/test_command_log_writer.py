@@ -0,0 +1,57 @@
+import pytest
+
+from conftest import create_course_data, lab_app
+
+
+@pytest.fixture
+def terminal(app, db, monkeypatch):
+    """A terminal of a student lab session, with the writer thread kept out of the way"""
+    monkeypatch.setattr(lab_app, 'ensure_command_log_writer', lambda: None)
+    monkeypatch.setattr(lab_app, 'command_log_queue', [])
+    monkeypatch.setattr(lab_app, 'terminal_activity', {})
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).first()
+    terminal = lab_app.TerminalSession(lab_session_id=lab_session.id, session_id='terminal-1', user_id=student.id)
+    db.session.add(terminal)
+    db.session.commit()
+    return terminal
+
+
+def queue_command(terminal_session_id, command='ls'):
+    lab_app.queue_command_log(lab_app.CommandLog(terminal_session_id=terminal_session_id, command=command))
+
+
+def test_drain_keeps_going_after_a_batch_of_deleted_terminals(terminal, monkeypatch):
+    flush = lab_app.flush_command_logs
+    calls = []
+
+    def flush_while_terminal_types():
+        written = flush()
+        if not calls:
+            queue_command(terminal.id, 'pwd')
+        calls.append(written)
+        return written
+
+    monkeypatch.setattr(lab_app, 'flush_command_logs', flush_while_terminal_types)
+    queue_command(terminal.id + 1000)
+
+    lab_app.drain_command_logs()
+
+    assert calls == [0, 1]
+    assert [log.command for log in lab_app.CommandLog.query] == ['pwd']
+
+
+def test_failed_flush_keeps_the_queue_within_its_limit(terminal, db, monkeypatch):
+    for i in range(5):
+        queue_command(terminal.id, f'echo {i}')
+    monkeypatch.setattr(lab_app, 'COMMAND_LOG_QUEUE_LIMIT', 3)
+    dropped = lab_app.command_log_metrics['dropped']
+
+    def fail():
+        raise RuntimeError('database is down')
+
+    monkeypatch.setattr(db.session, 'commit', fail)
+    assert lab_app.flush_command_logs() is None
+
+    assert [row['command'] for row in lab_app.command_log_queue] == ['echo 2', 'echo 3', 'echo 4']
+    assert lab_app.command_log_metrics['dropped'] == dropped + 2
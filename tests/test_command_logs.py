@@ -0,0 +1,25 @@
+from conftest import create_course_data, lab_app, login, sync_replica
+
+
+def add_command_log(db, lab_session, output):
+    terminal = lab_app.TerminalSession(lab_session_id=lab_session.id, session_id='terminal-1',
+                                       user_id=lab_session.user_id)
+    db.session.add(terminal)
+    db.session.flush()
+    db.session.add(lab_app.CommandLog(terminal_session_id=terminal.id, command='cat notes.txt', output=output))
+    db.session.commit()
+    sync_replica()
+
+
+def test_multibyte_output_is_measured_in_characters(app, db):
+    admin, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).first()
+    output = 'Kết quả ' * (lab_app.COMMAND_OUTPUT_PREVIEW_CHARS // 8)
+    add_command_log(db, lab_session, output)
+
+    body = login(admin).get(f'/admin/lab_session/{lab_session.id}/commands').get_json()
+
+    command = body['commands'][0]
+    assert command['output_length'] == len(output)
+    assert command['output_truncated'] is False
+
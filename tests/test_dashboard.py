@@ -0,0 +1,27 @@
+from conftest import count_queries, create_course_data, lab_app, login
+
+
+def test_dashboard_query_count_does_not_grow_with_labs(app):
+    _, student, _ = create_course_data(num_courses=3, labs_per_course=10)
+    client = login(student)
+
+    with count_queries() as statements:
+        response = client.get('/dashboard')
+
+    assert response.status_code == 200
+    assert len(statements) == 1, statements
+
+
+def test_dashboard_is_served_from_cache_until_invalidated(app):
+    _, student, courses = create_course_data(num_courses=1, labs_per_course=2)
+    client = login(student)
+    client.get('/dashboard')
+
+    with count_queries() as statements:
+        assert client.get('/dashboard').status_code == 200
+    assert statements == []
+
+    lab_app.invalidate_dashboard(student.id)
+    with count_queries() as statements:
+        assert client.get('/dashboard').status_code == 200
+    assert statements
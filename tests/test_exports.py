@@ -0,0 +1,34 @@
+import csv
+import io
+
+from conftest import create_course_data, lab_app, login, sync_replica
+
+
+def test_csv_export_escapes_formulas(app, db):
+    admin, student, courses = create_course_data(num_courses=1, labs_per_course=1)
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).first()
+    terminal = lab_app.TerminalSession(lab_session_id=lab_session.id, session_id='terminal-1', user_id=student.id)
+    db.session.add(terminal)
+    db.session.flush()
+    db.session.add(lab_app.CommandLog(terminal_session_id=terminal.id, command='=HYPERLINK("http://evil")',
+                                      output='-2+3'))
+    db.session.commit()
+    sync_replica()
+
+    response = login(admin).get(f'/admin/course/{courses[0].id}/export/command_logs?columns=command,output')
+
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[1] == ['\'=HYPERLINK("http://evil")', "'-2+3"]
+
+
+def test_export_filename_is_a_safe_token(app, db):
+    admin, _, courses = create_course_data(num_courses=1, labs_per_course=1)
+    courses[0].code = 'Mạng "máy"\r\nX-Injected: 1;'
+    db.session.commit()
+    sync_replica()
+
+    response = login(admin).get(f'/admin/course/{courses[0].id}/export/gradebook')
+
+    assert response.headers['Content-Disposition'] == 'attachment; filename="Mng_myX-Injected_1_gradebook.csv"'
+    assert 'X-Injected' not in response.headers
+    response.close()
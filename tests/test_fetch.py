@@ -0,0 +1,118 @@
+import http.server
+import json
+import threading
+
+import flask
+import pytest
+
+from conftest import create_course_data, lab_app, login
+
+
+class UpstreamHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'x' * (256 * 1024)
+        self.send_response(200)
+        if self.path == '/unknown-charset':
+            self.send_header('Content-Type', 'text/plain; charset=no-such-charset')
+        else:
+            self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def upstream():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), UpstreamHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+
+
+@pytest.mark.parametrize('max_bytes', ['100', -1, 1.5, True, None])
+def test_fetch_url_rejects_invalid_max_bytes(app, upstream, max_bytes):
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+
+    response = login(student).post('/api/fetch_url', json={'url': upstream, 'max_bytes': max_bytes})
+
+    assert response.status_code == 400
+
+
+def test_stream_releases_upstream_when_body_is_never_read(app, upstream):
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    in_flight = lab_app.http_metrics['in_flight']
+
+    # Call the view directly: the test client would start iterating the body
+    with lab_app.app.test_request_context('/api/fetch_url/stream', method='POST', json={'url': upstream}):
+        flask.session['user'] = {'id': student.id, 'role': 'student'}
+        response = lab_app.fetch_url_stream()
+    assert response.status_code == 200
+    assert lab_app.http_metrics['in_flight'] == in_flight + 1
+
+    # What a WSGI server does when the client disconnects before the first chunk
+    response.close()
+    assert lab_app.http_metrics['in_flight'] == in_flight
+
+
+def test_failed_decode_is_counted_once(app, upstream):
+    before = dict(lab_app.http_metrics)
+
+    result = lab_app.run_async(lab_app.fetch_url_async(upstream + 'unknown-charset'))
+
+    assert result['success'] is False
+    assert 'no-such-charset' in result['error']
+    after = lab_app.http_metrics
+    assert after['requests'] - before['requests'] == 1
+    assert after['failed'] - before['failed'] == 1
+    assert after['in_flight'] == before['in_flight']
+
+
+def set_fetch_cache_policy(db, lab, **policy):
+    lab.fetch_cache_policy = json.dumps(policy)
+    db.session.commit()
+
+
+def test_fetch_cache_is_off_by_default(app, db, upstream):
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    lab = lab_app.Lab.query.first()
+    client = login(student)
+
+    results = [client.post('/api/fetch_url', json={'url': upstream, 'lab_id': lab.id}).get_json()
+               for _ in range(2)]
+
+    assert [result['cache'] for result in results] == ['bypass', 'bypass']
+
+
+def test_only_listed_methods_are_cached(app, db, upstream):
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    lab = lab_app.Lab.query.first()
+    set_fetch_cache_policy(db, lab, mode='cache', ttl=60)
+    client = login(student)
+
+    def fetch(method):
+        return client.post('/api/fetch_url', json={'url': upstream, 'method': method, 'lab_id': lab.id}).get_json()
+
+    assert [fetch('GET')['cache'], fetch('GET')['cache']] == ['miss', 'hit']
+    assert [fetch('POST')['cache'], fetch('POST')['cache']] == ['bypass', 'bypass']
+
+    set_fetch_cache_policy(db, lab, mode='cache', ttl=60, methods=['get', 'post'])
+    assert [fetch('POST')['cache'], fetch('POST')['cache']] == ['miss', 'hit']
+
+
+def test_students_can_only_use_the_policy_of_their_own_labs(app, db, upstream):
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    other_course = lab_app.Course(code='OTHER', name='Other course')
+    db.session.add(other_course)
+    db.session.flush()
+    other_lab = lab_app.Lab(course_id=other_course.id, name='Other lab', template_folder='t', num_checkpoints=1)
+    db.session.add(other_lab)
+    db.session.commit()
+    client = login(student)
+
+    assert client.post('/api/fetch_url', json={'url': upstream, 'lab_id': other_lab.id}).status_code == 403
+    assert client.post('/api/fetch_multiple', json={'urls': [upstream], 'lab_id': other_lab.id}).status_code == 403
@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import lab_app
+
+
+class Clock(datetime):
+    """datetime whose now() is a settable naive UTC time"""
+    current = datetime(2026, 10, 19, 16, 59, 59)
+
+    @classmethod
+    def now(cls, tz=None):
+        now = cls.current.replace(tzinfo=timezone.utc)
+        return now.astimezone(tz) if tz else cls.current
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(lab_app, 'datetime', Clock)
+    monkeypatch.setattr(lab_app.time, 'time', lambda: Clock.current.replace(tzinfo=timezone.utc).timestamp())
+    monkeypatch.setattr(lab_app, 'flag_cache', {'date': None, 'expires_at': 0, 'flags': {}})
+    monkeypatch.setattr(Clock, 'current', Clock.current)
+    return Clock
+
+
+def test_flag_date_follows_local_midnight():
+    # Asia/Ho_Chi_Minh is UTC+7, so its midnight is 17:00 UTC
+    assert lab_app.get_flag_date(datetime(2026, 10, 19, 16, 59, 59)) == '19102026'
+    assert lab_app.get_flag_date(datetime(2026, 10, 19, 17, 0, 0)) == '20102026'
+
+
+def test_cache_expires_at_local_midnight(clock):
+    assert lab_app.get_next_local_midnight() == datetime(2026, 10, 19, 17, tzinfo=timezone.utc).timestamp()
+    before = lab_app.get_expected_flag(1, 'student@example.com', 'answer')
+    assert before == lab_app.build_expected_flag('19102026', 'student@example.com', 'answer')
+    assert lab_app.flag_cache['flags'] == {(1, 'student@example.com', 'answer'): before}
+
+    clock.current = datetime(2026, 10, 19, 17, 0, 1)
+    after = lab_app.get_expected_flag(1, 'student@example.com', 'answer')
+
+    assert after == lab_app.build_expected_flag('20102026', 'student@example.com', 'answer')
+    assert lab_app.flag_cache['date'] == '20102026'
+    assert lab_app.flag_cache['flags'] == {(1, 'student@example.com', 'answer'): after}
+
+
+def test_other_days_are_not_cached(clock):
+    flag = lab_app.get_expected_flag(1, 'student@example.com', 'answer', date_str='18102026')
+
+    assert flag == lab_app.build_expected_flag('18102026', 'student@example.com', 'answer')
+    assert lab_app.flag_cache['flags'] == {}
+
+
+def test_flag_matches_the_lab_template_scripts():
+    # echo -n "19102026_student@example.com_answer" | sha1sum
+    assert lab_app.build_expected_flag('19102026', 'student@example.com', 'answer') == \
+        'FLAG{80ad6b9359a1320ba8d7b08a9c6c744783f794da}'
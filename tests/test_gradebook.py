@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from conftest import create_course_data, lab_app, login
+
+
+def gradebook_scores(student, lab):
+    entry = lab_app.CourseGradebook.query.filter_by(course_id=lab.course_id, user_id=student.id).one()
+    return entry.lab_scores_dict[str(lab.id)]
+
+
+@pytest.fixture
+def submitted_lab(app, db):
+    """A lab with one plain-text checkpoint and a full-score submission in the gradebook"""
+    admin, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    lab = lab_app.Lab.query.one()
+    lab.checkpoint_rules = json.dumps([{'decode_method': 'plain', 'expected_answer': 'abc', 'points': 10}])
+    lab.max_score = 100
+    lab.minimum_score = 50
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).one()
+    lab_session.checkpoint_answers = json.dumps(['abc'])
+    lab_session.score = 100
+    lab_session.status = 'completed'
+    lab_app.record_gradebook_score(lab_session, lab)
+    db.session.commit()
+    return admin, student, lab
+
+
+def test_regrade_that_lowers_a_score_updates_the_gradebook(submitted_lab, db):
+    admin, student, lab = submitted_lab
+    lab.checkpoint_rules = json.dumps([{'decode_method': 'plain', 'expected_answer': 'xyz', 'points': 10}])
+    db.session.commit()
+
+    body = login(admin).post(f'/admin/lab/{lab.id}/regrade', json={}).get_json()
+
+    assert body['changed'] == 1
+    db.session.expire_all()
+    assert gradebook_scores(student, lab) == {'best_score': 0, 'status': 'failed'}
+
+
+def test_submissions_keep_the_best_score(submitted_lab, db):
+    _, student, lab = submitted_lab
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).one()
+    lab_session.score = 40
+    lab_session.status = 'failed'
+    lab_app.record_gradebook_score(lab_session, lab)
+    db.session.commit()
+
+    entry = lab_app.CourseGradebook.query.filter_by(user_id=student.id).one()
+    assert entry.lab_scores_dict[str(lab.id)] == {'best_score': 100, 'status': 'completed'}
+    assert (entry.graded_labs, entry.completed_labs, entry.average_score) == (1, 1, 100)
+
+
+def test_admin_correction_replaces_the_score(submitted_lab, db):
+    admin, student, lab = submitted_lab
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).one()
+
+    response = login(admin).put(f'/admin/lab_session/{lab_session.id}', json={'score': 30, 'status': 'failed'})
+
+    assert response.status_code == 200
+    db.session.expire_all()
+    entry = lab_app.CourseGradebook.query.filter_by(user_id=student.id).one()
+    assert entry.lab_scores_dict[str(lab.id)] == {'best_score': 30, 'status': 'failed'}
+    assert (entry.completed_labs, entry.average_score) == (0, 0)
+
+
+def test_deleted_lab_session_leaves_the_gradebook(submitted_lab, db):
+    admin, student, lab = submitted_lab
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).one()
+
+    assert login(admin).delete(f'/admin/lab_session/{lab_session.id}').status_code == 200
+
+    db.session.expire_all()
+    entry = lab_app.CourseGradebook.query.filter_by(user_id=student.id).one()
+    assert entry.lab_scores_dict == {}
+    assert entry.graded_labs == 0
+
+
+def test_rebuild_starts_from_the_lab_sessions_only(submitted_lab, db):
+    admin, student, lab = submitted_lab
+    lab_app.LabSession.query.filter_by(user_id=student.id).update({'score': 40, 'status': 'failed'})
+    db.session.commit()
+
+    body = login(admin).post('/admin/gradebook/rebuild', json={'course_id': lab.course_id}).get_json()
+
+    assert body['rows'] == 1
+    db.session.expire_all()
+    assert gradebook_scores(student, lab) == {'best_score': 40, 'status': 'failed'}
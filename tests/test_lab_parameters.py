@@ -0,0 +1,92 @@
+import json
+import os
+
+from conftest import create_course_data, lab_app
+
+
+def render(path, replacements):
+    pattern = lab_app.build_parameter_pattern(replacements)
+    return lab_app.render_parameter_file(str(path), pattern, replacements)
+
+
+def test_longer_placeholder_wins_over_its_prefix(tmp_path):
+    target = tmp_path / 'config.ini'
+    target.write_text('host=${host}\nhostname=${hostname}\n')
+
+    count = render(target, {'${host}': '10.0.0.1', '${hostname}': 'lab-01'})
+
+    assert count == 2
+    assert target.read_text() == 'host=10.0.0.1\nhostname=lab-01\n'
+
+
+def test_all_placeholders_are_rendered_in_one_pass(tmp_path):
+    target = tmp_path / 'run.sh'
+    target.write_text('#!/bin/sh\necho ${a} ${b} ${a}\r\n')
+    target.chmod(0o755)
+
+    count = render(target, {'${a}': '1', '${b}': '2'})
+
+    assert count == 3
+    with open(target, newline='') as f:
+        assert f.read() == '#!/bin/sh\necho 1 2 1\r\n'
+    assert os.stat(target).st_mode & 0o777 == 0o755
+    assert [p.name for p in tmp_path.iterdir()] == ['run.sh']
+
+
+def test_substituted_values_are_not_substituted_again(tmp_path):
+    target = tmp_path / 'flag.txt'
+    target.write_text('${a}\n')
+
+    assert render(target, {'${a}': '${b}', '${b}': 'x'}) == 1
+    assert target.read_text() == '${b}\n'
+
+
+def test_file_without_placeholders_is_not_rewritten(tmp_path):
+    target = tmp_path / 'README'
+    target.write_text('nothing to see\n')
+    before = os.stat(target)
+
+    assert render(target, {'${a}': '1'}) == 0
+
+    after = os.stat(target)
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+    assert [p.name for p in tmp_path.iterdir()] == ['README']
+
+
+def test_no_parameters_means_no_pattern():
+    assert lab_app.build_parameter_pattern({}) is None
+
+
+def test_parameters_sharing_a_file_are_applied_together(app, db, tmp_path):
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=1, student_email='student-01@example.com')
+    lab = lab_app.Lab.query.first()
+    lab_app.LabParameter.query.delete()
+    for name, values in (('${port}', ['8080']), ('${user}', ['${studentName}'])):
+        db.session.add(lab_app.LabParameter(lab_id=lab.id, parameter_name=name,
+                                            parameter_values=json.dumps(values),
+                                            file_path='app/.env'))
+    db.session.commit()
+    (tmp_path / 'app').mkdir()
+    (tmp_path / 'app' / '.env').write_text('PORT=${port}\nUSER=${user}\n')
+
+    values = lab_app.choose_lab_parameter_values(lab, student)
+    lab_app.apply_parameter_file_modifications(lab, str(tmp_path), values)
+
+    assert (tmp_path / 'app' / '.env').read_text() == 'PORT=8080\nUSER=student_student01\n'
+
+
+def test_session_keeps_the_values_it_was_provisioned_with(app, db):
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).one()
+    lab = lab_session.lab
+    lab_app.LabParameter.query.delete()
+    db.session.add(lab_app.LabParameter(lab_id=lab.id, parameter_name='${port}',
+                                        parameter_values=json.dumps([str(p) for p in range(8000, 8100)])))
+    db.session.commit()
+
+    chosen = lab_app.get_lab_session_parameters(lab_session, lab, student)
+    db.session.commit()
+
+    assert all(lab_app.get_lab_session_parameters(lab_session, lab, student) == chosen for _ in range(20))
+    assert lab_app.replace_lab_parameters('check ${email} ${port}', student, chosen) == \
+        f'check {student.email} {chosen["${port}"]}'
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from conftest import create_course_data, lab_app, login
+
+
+@pytest.fixture
+def provisioned_lab(app, db, tmp_path, monkeypatch):
+    """A student lab folder using docker compose, with container commands recorded instead of run"""
+    commands = []
+    monkeypatch.setattr(lab_app, 'ADMISSION_CONTROL_ENABLED', False)
+    monkeypatch.setattr(lab_app, 'execute_run_command',
+                        lambda user, command, folder: commands.append(command) or True)
+    monkeypatch.setattr(lab_app, 'run_lab_commands',
+                        lambda lab, user, user_linux_name, folder, values: commands.append('run_commands'))
+    monkeypatch.setattr(lab_app, 'set_lab_folder_owner', lambda folder, user: None)
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).first()
+    folder = tmp_path / 'student-lab'
+    (folder / 'data').mkdir(parents=True)
+    (folder / 'docker-compose.yml').write_text('services: {}\n')
+    (folder / 'data' / 'db.sql').write_text('seed\n')
+    lab_session.student_folder = str(folder)
+    db.session.commit()
+    yield lab_session, student, folder, commands
+    snapshot_path = lab_app.get_snapshot_path(str(folder))
+    if os.path.exists(snapshot_path):
+        os.remove(snapshot_path)
+
+
+def test_snapshot_is_taken_once_with_containers_stopped(provisioned_lab):
+    _, _, folder, commands = provisioned_lab
+
+    snapshot_path = lab_app.snapshot_lab_folder(str(folder), 'student')
+    assert os.path.exists(snapshot_path)
+    assert commands == ['docker compose stop', 'docker compose start']
+
+    assert lab_app.snapshot_lab_folder(str(folder), 'student') == snapshot_path
+    assert commands == ['docker compose stop', 'docker compose start']
+
+
+def test_reset_restores_the_snapshot_and_starts_fresh_containers(provisioned_lab):
+    lab_session, student, folder, commands = provisioned_lab
+    lab_app.snapshot_lab_folder(str(folder), 'student')
+    commands.clear()
+    (folder / 'data' / 'db.sql').write_text('dropped tables\n')
+    (folder / 'exploit.php').write_text('<?php ?>\n')
+
+    response = login(student).post(f'/api/lab/{lab_session.id}/reset')
+
+    assert response.status_code == 200
+    assert response.get_json()['restored_from'] == 'snapshot'
+    assert (folder / 'data' / 'db.sql').read_text() == 'seed\n'
+    assert not (folder / 'exploit.php').exists()
+    assert commands == ['docker compose down -v', 'run_commands']
+
+
+def test_reset_of_someone_elses_lab_is_refused(provisioned_lab, db):
+    lab_session, _, folder, commands = provisioned_lab
+    other = lab_app.User(email='other@example.com', full_name='Other', google_id='g-other', role='student')
+    db.session.add(other)
+    db.session.commit()
+
+    assert login(other).post(f'/api/lab/{lab_session.id}/reset').status_code == 403
+    assert commands == []
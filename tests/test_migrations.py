@@ -0,0 +1,55 @@
+import os
+
+import flask_migrate
+import sqlalchemy as sa
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+
+from conftest import lab_app
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(lab_app.__file__), 'migrations')
+
+# Tables and columns of the schema the first migration starts from
+BASELINE_SCHEMA = {
+    'labs_network': {'id', 'name', 'subnet_ip_base', 'mask', 'gateway', 'used', 'created_at', 'updated_at'},
+    'users': {'id', 'email', 'full_name', 'google_id', 'avatar_url', 'is_active', 'role', 'created_at',
+              'last_login'},
+    'courses': {'id', 'code', 'name', 'description', 'instructor_id', 'semester', 'is_active', 'max_students',
+                'created_at'},
+    'enrollments': {'id', 'user_id', 'course_id', 'enrolled_at', 'status'},
+    'labs': {'id', 'course_id', 'name', 'description', 'template_folder', 'accessible_resources',
+             'build_command', 'order_index', 'deadline', 'max_score', 'minimum_score', 'estimated_duration',
+             'difficulty', 'is_active', 'run_commands', 'num_checkpoints', 'checkpoint_rules',
+             'pdf_instruction_url', 'output_result', 'created_at'},
+    'lab_parameters': {'id', 'lab_id', 'parameter_name', 'parameter_values', 'file_path', 'description',
+                       'created_at'},
+    'lab_sessions': {'id', 'user_id', 'lab_id', 'student_folder', 'status', 'started_at', 'completed_at',
+                     'last_accessed', 'score', 'submission_notes', 'checkpoint_answers', 'checkpoint_results',
+                     'generated_flag', 'created_at'},
+    'terminal_sessions': {'id', 'session_id', 'user_id', 'lab_session_id', 'current_directory', 'is_active',
+                          'started_at', 'last_activity', 'command_count'},
+    'command_logs': {'id', 'terminal_session_id', 'command', 'output', 'exit_code', 'is_allowed',
+                     'blocked_reason', 'executed_at'},
+}
+
+
+def current_schema(engine):
+    inspector = sa.inspect(engine)
+    return {
+        table: {column['name'] for column in inspector.get_columns(table)}
+        for table in inspector.get_table_names() if table != 'alembic_version'
+    }
+
+
+def test_migration_chain_matches_models(app, db):
+    # Downgrading a fresh create_all() database must land on the baseline schema:
+    # a model change without a migration is still there afterwards
+    flask_migrate.stamp(directory=MIGRATIONS_DIR)
+    flask_migrate.downgrade(directory=MIGRATIONS_DIR, revision='base')
+    assert current_schema(db.engine) == BASELINE_SCHEMA
+
+    # ... and upgrading from the baseline must produce exactly the models
+    flask_migrate.upgrade(directory=MIGRATIONS_DIR)
+    with db.engine.connect() as connection:
+        diffs = compare_metadata(MigrationContext.configure(connection), db.metadata)
+    assert diffs == []
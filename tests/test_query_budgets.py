@@ -0,0 +1,29 @@
+import pytest
+
+from conftest import count_queries, create_course_data, lab_app, login
+
+# Most queries each endpoint may run for one page, whatever the amount of data
+QUERY_BUDGETS = {
+    '/admin/courses': 3,
+    '/admin/labs': 2,
+    '/api/courses': 2,
+}
+
+
+@pytest.mark.parametrize('url', sorted(QUERY_BUDGETS))
+@pytest.mark.parametrize('num_courses,labs_per_course', [(1, 1), (5, 8)])
+def test_listing_stays_within_query_budget(app, db, url, num_courses, labs_per_course):
+    admin, student, _ = create_course_data(num_courses=num_courses, labs_per_course=labs_per_course)
+    # A course the student is not enrolled in, for /api/courses
+    other = lab_app.Course(code='OPEN', name='Open course')
+    db.session.add(other)
+    db.session.flush()
+    db.session.add(lab_app.Lab(course_id=other.id, name='Open lab', template_folder='t', num_checkpoints=1))
+    db.session.commit()
+    client = login(admin if url.startswith('/admin') else student)
+
+    with count_queries() as statements:
+        response = client.get(url)
+
+    assert response.status_code == 200
+    assert len(statements) <= QUERY_BUDGETS[url], statements
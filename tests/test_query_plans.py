@@ -0,0 +1,48 @@
+import re
+
+import pytest
+import sqlalchemy as sa
+
+from conftest import lab_app
+
+m = lab_app
+
+# The filters and sorts the hot endpoints run, each of which must be served by an index
+HOT_QUERIES = {
+    'command log page': lambda: sa.select(m.CommandLog.id)
+        .where(m.CommandLog.terminal_session_id == 1)
+        .order_by(m.CommandLog.executed_at, m.CommandLog.id).limit(50),
+    'active terminals of a lab session': lambda: sa.select(m.TerminalSession.id)
+        .where(m.TerminalSession.lab_session_id == 1, m.TerminalSession.is_active == True),
+    'active labs of a course': lambda: sa.select(m.Lab.id)
+        .where(m.Lab.course_id == 1, m.Lab.is_active == True).order_by(m.Lab.order_index),
+    'lab sessions by status and user': lambda: sa.select(m.LabSession.id)
+        .where(m.LabSession.status == 'in_progress', m.LabSession.user_id == 1),
+    'lab sessions of a lab by status': lambda: sa.select(sa.func.count(m.LabSession.id))
+        .where(m.LabSession.lab_id == 1, m.LabSession.status == 'completed'),
+    'free lab networks': lambda: sa.select(m.LabsNetwork.id).where(m.LabsNetwork.used == False).limit(1),
+    'enrollments of a course by status': lambda: sa.select(sa.func.count(m.Enrollment.id))
+        .where(m.Enrollment.course_id == 1, m.Enrollment.status == 'active'),
+    'newest users page': lambda: sa.select(m.User.id)
+        .order_by(m.User.created_at.desc(), m.User.id.desc()).limit(50),
+    'newest lab sessions page': lambda: sa.select(m.LabSession.id)
+        .order_by(m.LabSession.created_at.desc(), m.LabSession.id.desc()).limit(50),
+}
+
+
+def full_scans(connection, statement):
+    """Tables a statement reads without an index, from the database's own EXPLAIN"""
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    if connection.dialect.name == 'sqlite':
+        plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}').all()
+        return [row.detail for row in plan if re.fullmatch(r'SCAN (TABLE )?\w+', row.detail)]
+    if connection.dialect.name == 'mysql':
+        plan = connection.exec_driver_sql(f'EXPLAIN {sql}').mappings().all()
+        return [row['table'] for row in plan if row['type'] == 'ALL']
+    pytest.skip(f'No query plan check for {connection.dialect.name}')
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_an_index(app, db, name):
+    with db.engine.connect() as connection:
+        assert full_scans(connection, HOT_QUERIES[name]()) == []
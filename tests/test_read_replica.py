@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+
+from conftest import create_course_data, lab_app, login
+
+
+@contextmanager
+def replica_statements():
+    """Collect the SQL statements sent to the read replica inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = lab_app.db.engines['replica']
+    sa.event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        sa.event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def add_student(db, email):
+    student = lab_app.User(email=email, full_name=email, google_id=email, role='student')
+    db.session.add(student)
+    db.session.commit()
+    return student
+
+
+def test_reporting_endpoints_read_from_the_replica(app, db):
+    admin, _, _ = create_course_data(num_courses=1, labs_per_course=2)
+    # Written after the last sync, so only the primary has it
+    late = add_student(db, 'late@example.com')
+    db.session.add(lab_app.LabSession(user_id=late.id, lab_id=lab_app.Lab.query.first().id))
+    db.session.commit()
+
+    with replica_statements() as statements:
+        body = login(admin).get('/admin/lab_sessions').get_json()
+
+    assert statements
+    assert 'late@example.com' not in {item['user_email'] for item in body['items']}
+
+
+def test_writes_go_to_the_primary_inside_reporting_endpoints(app, db):
+    admin, _, courses = create_course_data(num_courses=1, labs_per_course=1)
+
+    with lab_app.app.test_request_context(), lab_app.replica_reads():
+        db.session.add(lab_app.Course(code='NEW', name='New course'))
+        db.session.commit()
+
+    with db.engines['replica'].connect() as replica:
+        assert replica.execute(sa.text("SELECT count(*) FROM courses WHERE code = 'NEW'")).scalar() == 0
+    assert lab_app.Course.query.filter_by(code='NEW').count() == 1
+
+
+def test_admin_write_pins_the_affected_student_to_the_primary(app, db):
+    admin, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    bystander = add_student(db, 'bystander@example.com')
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).first()
+
+    response = login(admin).put(f'/admin/lab_session/{lab_session.id}', json={'score': 55})
+    assert response.status_code == 200
+
+    with replica_statements() as statements:
+        assert login(student).get('/profile').status_code == 200
+    assert statements == []
+
+    with replica_statements() as statements:
+        assert login(bystander).get('/profile').status_code == 200
+    assert statements
+
+
+def test_primary_pins_expire(app, db):
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    lab_app.pin_reads_to_primary(student.id, seconds=0)
+
+    with replica_statements() as statements:
+        assert login(student).get('/profile').status_code == 200
+    assert statements
@@ -0,0 +1,100 @@
+import asyncio
+import http.server
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from conftest import lab_app
+
+
+class ResourceHandler(http.server.BaseHTTPRequestHandler):
+    """Slow upstream that counts hits per path and the most requests it served at once"""
+    protocol_version = 'HTTP/1.1'
+    lock = threading.Lock()
+    hits = Counter()
+    in_flight = 0
+    max_in_flight = 0
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.hits[self.path] += 1
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(0.2)
+        with cls.lock:
+            cls.in_flight -= 1
+        self.send_response(503 if self.path == '/down' else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ResourceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+@pytest.fixture
+def upstream(server, monkeypatch):
+    monkeypatch.setattr(lab_app, 'resource_cache', {})
+    ResourceHandler.hits.clear()
+    ResourceHandler.max_in_flight = 0
+    return server
+
+
+def check(urls, max_age=lab_app.RESOURCE_CACHE_SECONDS):
+    return lab_app.run_async(lab_app.check_lab_resource_availability(urls, max_age))
+
+
+def test_fresh_results_come_from_the_cache(upstream):
+    first = check([f'{upstream}/up', f'{upstream}/down'])
+    assert first[f'{upstream}/up']['available'] is True
+    assert first[f'{upstream}/down']['available'] is False
+
+    assert check([f'{upstream}/up']) == {f'{upstream}/up': first[f'{upstream}/up']}
+    assert ResourceHandler.hits['/up'] == 1
+
+    check([f'{upstream}/up'], max_age=0)
+    assert ResourceHandler.hits['/up'] == 2
+
+
+def test_concurrent_checks_share_one_probe(upstream):
+    async def two_checks():
+        urls = [f'{upstream}/shared', f'{upstream}/shared']
+        return await asyncio.gather(lab_app.check_lab_resource_availability(urls, 0),
+                                    lab_app.check_lab_resource_availability(urls, 0))
+
+    first, second = lab_app.run_async(two_checks())
+
+    assert first == second
+    assert ResourceHandler.hits['/shared'] == 1
+
+
+def test_probes_are_limited_and_concurrent(upstream, monkeypatch):
+    monkeypatch.setattr(lab_app, 'RESOURCE_CHECK_CONCURRENCY', 3)
+    monkeypatch.setattr(lab_app, 'resource_semaphore', None)
+    started = time.monotonic()
+
+    results = check([f'{upstream}/r{i}' for i in range(9)])
+
+    assert all(result['available'] for result in results.values())
+    assert ResourceHandler.max_in_flight == 3
+    # Three rounds of 0.2s, not nine
+    assert time.monotonic() - started < 1.5
+
+
+def test_probe_counts_each_request_once(upstream):
+    before = dict(lab_app.http_metrics)
+
+    check([f'{upstream}/once'], max_age=0)
+
+    assert lab_app.http_metrics['requests'] - before['requests'] == 1
+    assert lab_app.http_metrics['in_flight'] == before['in_flight']
@@ -0,0 +1,68 @@
+import pytest
+
+from conftest import count_queries, create_course_data, lab_app, login
+
+
+@pytest.fixture
+def students(app, db):
+    """An enrolled student and one who is not enrolled in any course"""
+    _, enrolled, _ = create_course_data(num_courses=2, labs_per_course=1)
+    other = lab_app.User(email='other@example.com', full_name='Other', google_id='g-other', role='student')
+    db.session.add(other)
+    db.session.commit()
+    return enrolled, other
+
+
+def test_response_carries_validators(students):
+    response = login(students[1]).get('/api/courses')
+
+    assert response.status_code == 200
+    assert response.headers['ETag']
+    assert response.headers['Last-Modified']
+    assert set(response.headers['Cache-Control'].split(', ')) == {'private', 'no-cache'}
+
+
+def test_matching_etag_gets_304_without_queries(students):
+    client = login(students[1])
+    etag = client.get('/api/courses').headers['ETag']
+
+    with count_queries() as statements:
+        response = client.get('/api/courses', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.data == b''
+    assert statements == []
+
+
+def test_unchanged_since_last_modified_gets_304(students):
+    client = login(students[1])
+    last_modified = client.get('/api/courses').headers['Last-Modified']
+
+    assert client.get('/api/courses', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+
+def test_write_changes_the_etag(students, db):
+    client = login(students[1])
+    first = client.get('/api/courses')
+
+    db.session.add(lab_app.Course(code='NEW', name='New course', semester='2026-1'))
+    db.session.commit()
+    lab_app.bump_data_version('courses')
+    response = client.get('/api/courses', headers={'If-None-Match': first.headers['ETag']})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != first.headers['ETag']
+    assert len(response.get_json()) == len(first.get_json()) + 1
+
+
+def test_per_user_responses_are_isolated(students):
+    enrolled, other = students
+    other_client = login(other)
+    other_response = other_client.get('/api/courses')
+
+    enrolled_response = login(enrolled).get('/api/courses', headers={'If-None-Match': other_response.headers['ETag']})
+
+    assert enrolled_response.status_code == 200
+    assert enrolled_response.get_json() == []
+    assert len(other_response.get_json()) == 2
+    assert other_client.get('/api/courses').get_json() == other_response.get_json()
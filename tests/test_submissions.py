@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from conftest import count_queries, create_course_data, lab_app, login
+
+
+@pytest.fixture
+def lab_session(app, db, monkeypatch):
+    """An in-progress lab session of a lab with one plain-text checkpoint"""
+    monkeypatch.setattr(lab_app, 'submit_buckets', {})
+    monkeypatch.setattr(lab_app, 'SUBMIT_RATE_BURST', 3)
+    monkeypatch.setattr(lab_app, 'SUBMIT_RATE_PER_MINUTE', 6)
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    lab = lab_app.Lab.query.one()
+    lab.checkpoint_rules = json.dumps([{'decode_method': 'plain', 'expected_answer': 'abc', 'points': 10}])
+    lab.max_score = 100
+    lab.minimum_score = 50
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).one()
+    lab_session.status = 'in_progress'
+    lab_session.score = None
+    db.session.commit()
+    return lab_session
+
+
+def submit(client, lab_session, answer):
+    return client.post(f'/api/lab/{lab_session.id}/submit', json={'checkpoint_answers': [answer]})
+
+
+def test_identical_resubmission_is_answered_without_writing(lab_session):
+    client = login(lab_session.user)
+    first = submit(client, lab_session, 'abc').get_json()
+    assert (first['score'], first.get('cached')) == (100, None)
+
+    with count_queries() as statements:
+        again = submit(client, lab_session, 'abc').get_json()
+
+    assert again['cached'] is True
+    assert (again['score'], again['status']) == (100, 'completed')
+    assert again['results'] == first['results']
+    assert not [s for s in statements if not s.lstrip().upper().startswith('SELECT')]
+
+
+def test_changed_answers_are_graded_again(lab_session):
+    client = login(lab_session.user)
+    submit(client, lab_session, 'abc')
+
+    body = submit(client, lab_session, 'wrong').get_json()
+
+    assert body.get('cached') is None
+    assert (body['score'], body['status']) == (0, 'failed')
+
+
+def test_burst_is_limited_with_retry_after(lab_session):
+    client = login(lab_session.user)
+    assert [submit(client, lab_session, f'try {i}').status_code for i in range(3)] == [200, 200, 200]
+
+    response = submit(client, lab_session, 'try 3')
+
+    assert response.status_code == 429
+    # 6 per minute refills one submission every 10 seconds
+    assert 1 <= int(response.headers['Retry-After']) <= 11
+
+
+def test_bucket_refills_over_time(lab_session, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(lab_app.time, 'monotonic', lambda: now[0])
+    for _ in range(3):
+        assert lab_app.take_submit_token(lab_session.user_id, lab_session.id)[0]
+    assert lab_app.take_submit_token(lab_session.user_id, lab_session.id) == (False, pytest.approx(10.0))
+
+    now[0] += 10
+    assert lab_app.take_submit_token(lab_session.user_id, lab_session.id) == (True, 0.0)
+    # Other lab sessions have their own bucket
+    assert lab_app.take_submit_token(lab_session.user_id, lab_session.id + 1)[0]
+
+
+def test_someone_elses_lab_spends_no_token(lab_session, db):
+    other = lab_app.User(email='other@example.com', full_name='Other', google_id='g-other', role='student')
+    db.session.add(other)
+    db.session.commit()
+
+    assert submit(login(other), lab_session, 'abc').status_code == 403
+    assert lab_app.submit_buckets == {}
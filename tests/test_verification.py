@@ -0,0 +1,107 @@
+import json
+import subprocess
+import time
+
+import pytest
+
+from conftest import create_course_data, lab_app
+
+
+@pytest.fixture
+def verified_lab(app, db, monkeypatch):
+    """A lab with a verify command and an answer-graded two-checkpoint submission worth 100"""
+    monkeypatch.setattr(lab_app, 'verify_jobs', {})
+    monkeypatch.setattr(lab_app, 'verify_metrics', dict(lab_app.verify_metrics, in_flight=0))
+    monkeypatch.setattr(lab_app, 'verify_completions', [])
+    _, student, _ = create_course_data(num_courses=1, labs_per_course=1)
+    lab = lab_app.Lab.query.one()
+    lab.checkpoint_rules = json.dumps([{'expected_answer': 'a', 'points': 10}, {'expected_answer': 'b', 'points': 10}])
+    lab.num_checkpoints = 2
+    lab.max_score = 100
+    lab.minimum_score = 50
+    lab.verify_command = 'verify.sh ${port}'
+    lab_session = lab_app.LabSession.query.filter_by(user_id=student.id).one()
+    lab_session.student_folder = '/labs/student'
+    lab_session.chosen_parameters = json.dumps({'${port}': '8081'})
+    results, _ = lab_app.grade_checkpoint_answers(lab_app.get_lab_checkpoint_pipeline(lab), ['a', 'b'],
+                                                  student.email, lab_app.get_flag_date())
+    lab_session.checkpoint_results = json.dumps(results)
+    lab_session.score = 100
+    lab_session.status = 'completed'
+    lab_session.submission_fingerprint = 'fp'
+    lab_app.record_gradebook_score(lab_session, lab)
+    db.session.commit()
+    return lab_session.id
+
+
+def run_job(monkeypatch, lab_session_id, output=None, error=None):
+    """Run a verification job in the test thread with a canned command outcome"""
+    def run_verification_command(user_linux_name, command, working_directory, timeout):
+        if error:
+            raise error
+        return output
+
+    monkeypatch.setattr(lab_app, 'run_verification_command', run_verification_command)
+    lab_app.verify_jobs[lab_session_id] = {'status': 'queued'}
+    lab_app.verify_metrics['in_flight'] += 1
+    lab_app.run_verification_job(lab_session_id, 'verify.sh', '/labs/student', 'student', 'fp', time.time())
+    return lab_app.db.session.get(lab_app.LabSession, lab_session_id), lab_app.verify_jobs[lab_session_id]
+
+
+def test_only_reported_checkpoints_are_rescored(verified_lab, monkeypatch):
+    lab_session, job = run_job(monkeypatch, verified_lab, (1, 'checking\n{"checkpoints": {"2": false}}\n', ''))
+
+    results = json.loads(lab_session.checkpoint_results)
+    assert job['status'] == 'completed'
+    assert [(r['passed'], r.get('verified')) for r in results] == [(True, None), (False, False)]
+    assert (lab_session.score, lab_session.status) == (50, 'completed')
+
+
+def test_exit_code_alone_is_recorded_next_to_the_answers(verified_lab, monkeypatch):
+    lab_session, _ = run_job(monkeypatch, verified_lab, (1, 'service is down\n', ''))
+
+    results = json.loads(lab_session.checkpoint_results)
+    assert [(r['passed'], r['verified'], r['verify_message']) for r in results] == \
+        [(True, False, 'service is down'), (True, False, 'service is down')]
+    assert lab_session.score == 100
+
+
+def test_verification_keeps_the_best_gradebook_score(verified_lab, monkeypatch):
+    lab_session, _ = run_job(monkeypatch, verified_lab, (0, '{"checkpoints": {"1": false, "2": false}}', ''))
+
+    entry = lab_app.CourseGradebook.query.filter_by(user_id=lab_session.user_id).one()
+    assert lab_session.score == 0
+    assert entry.lab_scores_dict[str(lab_session.lab_id)] == {'best_score': 100, 'status': 'completed'}
+
+
+def test_timeout_leaves_the_results_alone(verified_lab, monkeypatch):
+    lab_session, job = run_job(monkeypatch, verified_lab, error=subprocess.TimeoutExpired('verify.sh', 60))
+
+    assert job['status'] == 'timed_out'
+    assert job['error'] == f'Verification timed out after {lab_app.VERIFY_JOB_TIMEOUT_SECONDS}s'
+    assert lab_app.verify_metrics['timed_out'] == 1
+    assert lab_session.score == 100
+    assert all('verified' not in r for r in json.loads(lab_session.checkpoint_results))
+
+
+def test_superseded_submission_is_not_merged(verified_lab, db, monkeypatch):
+    lab_session = db.session.get(lab_app.LabSession, verified_lab)
+    lab_session.submission_fingerprint = 'newer'
+    db.session.commit()
+
+    lab_session, job = run_job(monkeypatch, verified_lab, (1, '{"checkpoints": {"1": false}}', ''))
+
+    assert job['error'] == 'Superseded by a newer submission'
+    assert lab_session.score == 100
+
+
+def test_verify_command_uses_the_provisioned_parameters(verified_lab, db, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(lab_app.verify_executor, 'submit', lambda fn, *args: submitted.append(args))
+    lab_session = db.session.get(lab_app.LabSession, verified_lab)
+
+    status = lab_app.queue_verification_job(lab_session.lab, lab_session, lab_session.user, 'fp')
+
+    assert status == 'queued'
+    assert submitted[0][1] == 'verify.sh 8081'
+
@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta
+
+from conftest import lab_app
+
+
+def acquire_as(monkeypatch, pid, name='idle_reaper', seconds=600):
+    monkeypatch.setattr(lab_app.os, 'getpid', lambda: pid)
+    return lab_app.acquire_worker_lease(name, seconds)
+
+
+def test_only_one_process_holds_a_lease(app, db, monkeypatch):
+    assert acquire_as(monkeypatch, 101)
+    assert not acquire_as(monkeypatch, 102)
+    # The holder renews its own lease
+    assert acquire_as(monkeypatch, 101)
+    # Other jobs have their own lease
+    assert acquire_as(monkeypatch, 102, name='other_job')
+
+
+def test_expired_lease_is_taken_over(app, db, monkeypatch):
+    assert acquire_as(monkeypatch, 101)
+    lease = db.session.get(lab_app.WorkerLease, 'idle_reaper')
+    lease.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert acquire_as(monkeypatch, 102)
+    assert db.session.get(lab_app.WorkerLease, 'idle_reaper').owner.endswith(':102')
+    assert not acquire_as(monkeypatch, 101)